@@ -8,10 +8,9 @@ from psychopy import gui, logging
 from psychopy.tools.arraytools import extendArr, shuffleArray
 from psychopy.tools.fileerrortools import handleFileCollision
 import psychopy
-import cPickle, string, sys, platform, os, time, copy, csv
+import cPickle, string, sys, platform, os, time, copy, copy_reg, csv, shutil
 import numpy
 from scipy import optimize, special
-from matplotlib import mlab    #used for importing csv files
 from contrib.quest import *    #used for QuestHandler
 import inspect #so that Handlers can find the script that called them
 import codecs, locale
@@ -40,6 +39,9 @@ class ExperimentHandler(object):
         exp = data.ExperimentHandler(name="Face Preference",version='0.1.0')
 
     """
+    streamWideText=False#so that handlers unpickled from old psydat files work
+    _streamFile=None
+    _streamFileName=None
     def __init__(self,
                 name='',
                 version='',
@@ -48,7 +50,9 @@ class ExperimentHandler(object):
                 originPath=None,
                 savePickle=True,
                 saveWideText=True,
-                dataFileName=''):
+                dataFileName='',
+                streamWideText=False,
+                streamDelim=','):
         """
         :parameters:
 
@@ -77,6 +81,24 @@ class ExperimentHandler(object):
                 The handler will attempt to populate the file even in the
                 event of a (not too serious) crash!
 
+            streamWideText : True or False (default False)
+                If True (and a dataFileName was given) then each call to
+                :meth:`nextEntry` appends one row to the wide-text file
+                immediately (the file is line-buffered) and the entry is then
+                dropped from memory, so long sessions keep a bounded memory
+                footprint and the data are on disk even after a hard crash.
+                Columns that first appear mid-session are appended to the
+                right-hand side; their names are kept in a sidecar
+                `*.header` file during the session and the header row of
+                the data file is rewritten when the stream is closed.
+                NB: `entries` will not contain the streamed rows, so neither
+                will the psydat file.
+
+            streamDelim : ',' or '\\t' (default ',')
+                The delimiter used when `streamWideText=True`. Comma-delimited
+                streams are written to `dataFileName+'.csv'`, tab-delimited
+                ones to `dataFileName+'.dlm'`
+
         """
         self.loops=[]
         self.loopsUnfinished=[]
@@ -97,13 +119,22 @@ class ExperimentHandler(object):
         self.dataNames=[]#names of all the data (eg. resp.keys)
         if dataFileName in ['', None]:
             logging.warning('ExperimentHandler created with no dataFileName parameter. No data will be saved in the event of a crash')
+        elif streamWideText:
+            self._openStream(streamDelim)
     def __del__(self):
         if self.dataFileName not in ['', None]:
             logging.debug('Saving data for %s ExperimentHandler' %self.name)
             if self.savePickle==True:
                 self.saveAsPickle(self.dataFileName)
-            if self.saveWideText==True:
+            if self.streamWideText:
+                self.closeStream()
+            elif self.saveWideText==True:
                 self.saveAsWideText(self.dataFileName+'.csv', delim=',')
+    def __getstate__(self):
+        #an open file can't be pickled (and shouldn't be resumed by a copy)
+        d = self.__dict__.copy()
+        d['_streamFile'] = None
+        return d
     def addLoop(self, loopHandler):
         """Add a loop such as a :class:`~psychopy.data.TrialHandler` or :class:`~psychopy.data.StairHandler`
         Data from this loop will be included in the resulting data files.
@@ -224,9 +255,153 @@ class ExperimentHandler(object):
         #add the extraInfo dict to the data
         if type(self.extraInfo)==dict:
             this.update(self.extraInfo)#NB update() really means mergeFrom()
-        self.entries.append(this)
+        if self.streamWideText:
+            #write the row now and keep nothing in memory
+            self._streamEntry(this)
+        else:
+            self.entries.append(this)
         #then create new empty entry for n
         self.thisEntry = {}
+    def _openStream(self, delim=','):
+        """Opens the (line-buffered) wide-text file that :meth:`nextEntry`
+        will append to when streaming.
+        """
+        if delim==',':
+            self._streamFileName = self.dataFileName+'.csv'
+        else:
+            self._streamFileName = self.dataFileName+'.dlm'
+        self._streamHeaderName = self._streamFileName+'.header'
+        if os.path.exists(self._streamFileName):
+            logging.warning('Data file, %s, will be overwritten' %self._streamFileName)
+        self._streamFile = codecs.open(self._streamFileName, 'w',
+            encoding="utf-8", buffering=1)#line buffered
+        self._streamDelim = delim
+        self._streamNames = []#column order as written to disk
+        self._streamNamesSet = set()
+        self._streamNamesWritten = 0#n names in the header row on disk
+        self._streamNRows = 0
+        self._streamWidths = []#(rowN, nNames) each time columns were added
+        self.streamWideText = True
+    def _streamEntry(self, entry):
+        """Appends a single entry as one row of the streamed wide-text file
+        """
+        known = self._streamNamesSet
+        if any(name not in known for name in entry):
+            #new columns get added to the right-hand side (in the same order
+            #that saveAsWideText would use)
+            allNames = self._getAllParamNames()
+            allNames.extend(self.dataNames)
+            allNames.extend(self._getExtraInfo()[0])
+            allNames.extend(entry.keys())
+            for name in allNames:
+                if name not in known:
+                    self._streamNames.append(name)
+                    known.add(name)
+            if self._streamNRows==0:
+                #nothing written yet so the header row can go straight in
+                self._writeWideTextHeader(self._streamFile, self._streamNames,
+                    self._streamDelim)
+                self._streamNamesWritten = len(self._streamNames)
+            else:
+                #keep the full header beside the data in case of a crash
+                f = codecs.open(self._streamHeaderName, 'w', encoding="utf-8")
+                self._writeWideTextHeader(f, self._streamNames, self._streamDelim)
+                f.close()
+                self._streamWidths.append((self._streamNRows, len(self._streamNames)))
+        self._writeWideTextEntry(self._streamFile, entry, self._streamNames,
+            self._streamDelim)
+        self._streamNRows += 1
+    def closeStream(self):
+        """Finishes the streamed wide-text file (when `streamWideText=True`).
+
+        The rows are already on disk so this is usually just a flush and
+        close. Only if columns were added after the first row was written
+        is the file rewritten (one row at a time) to update the header row
+        and pad the earlier rows to the full width.
+        """
+        if not self.streamWideText:
+            return
+        self.streamWideText = False
+        self.saveWideText = False
+        if self._streamFile is not None:
+            self._streamFile.close()
+            self._streamFile = None
+        if not self._streamWidths:
+            return#header on disk is already complete
+        nNames = len(self._streamNames)
+        delim = self._streamDelim
+        tmpName = self._streamFileName+'.tmp'
+        inFile = open(self._streamFileName, 'rb')
+        rows = _readWideTextRows(inFile)
+        outFile = codecs.open(tmpName, 'w', encoding="utf-8")
+        rows.next()#the old (incomplete) header
+        self._writeWideTextHeader(outFile, self._streamNames, delim)
+        #each change is (first row, n columns those rows were written with)
+        changes = [(0, self._streamNamesWritten)]+self._streamWidths
+        for changeN, (firstRow, width) in enumerate(changes):
+            if changeN+1<len(changes):
+                nRows = changes[changeN+1][0]-firstRow
+            else:
+                nRows = self._streamNRows-firstRow
+            padding = delim*(nNames-width)
+            for rowN in range(nRows):
+                row = rows.next().decode('utf-8')
+                outFile.write(row.rstrip('\r\n')+padding+u'\n')
+        inFile.close()
+        outFile.close()
+        os.remove(self._streamFileName)
+        os.rename(tmpName, self._streamFileName)
+        if os.path.exists(self._streamHeaderName):
+            os.remove(self._streamHeaderName)
+        self._streamNamesWritten = nNames
+        self._streamWidths = []
+    def _copyStream(self, fileName, delim, matrixOnly, writeFormat):
+        """Copies the rows of the (closed) stream file to fileName for
+        :meth:`saveAsWideText`
+        """
+        if delim!=self._streamDelim:
+            logging.warning('Data were streamed with delimiter %r, which is kept in %s'
+                %(self._streamDelim, fileName))
+        if fileName=='stdout':
+            f = sys.stdout
+        else:
+            if fileName[-4:] not in ['.csv', '.CSV','.dlm','.DLM', '.tsv','.TSV']:
+                if delim==',': fileName+='.csv'
+                else: fileName+='.dlm'
+            if os.path.abspath(fileName)==os.path.abspath(self._streamFileName):
+                if matrixOnly or writeFormat=='a':
+                    logging.warning('%s is the streamed data file, so matrixOnly and appendFile were ignored' %fileName)
+                return
+            if os.path.exists(fileName) and writeFormat == 'w':
+                logging.warning('Data file, %s, will be overwritten' %fileName)
+            f = open(fileName, writeFormat+'b')
+        inFile = open(self._streamFileName, 'rb')
+        rows = _readWideTextRows(inFile)
+        if matrixOnly:
+            rows.next()#the header
+        for row in rows:
+            f.write(row)
+        inFile.close()
+        if f!=sys.stdout:
+            f.close()
+    def _writeWideTextHeader(self, f, names, delim):
+        for heading in names:
+            f.write(u'%s%s' %(heading,delim))
+        f.write('\n')
+    def _writeWideTextEntry(self, f, entry, names, delim):
+        cells = []
+        for name in names:
+            if name in entry:
+                val = unicode(entry[name])
+                if ',' in val or delim in val or '"' in val or '\n' in val or '\r' in val:
+                    #quote (doubling any quotes) so the value stays in one cell
+                    cells.append(u'"%s"%s' %(val.replace('"','""'),delim))
+                else:
+                    cells.append(u'%s%s' %(val,delim))
+            else:
+                cells.append(delim)
+        cells.append(u'\n')
+        f.write(u''.join(cells))
     def saveAsWideText(self, fileName, delim=None,
                    matrixOnly=False,
                    appendFile=False):
@@ -238,18 +413,28 @@ class ExperimentHandler(object):
 
         If `matrixOnly=True` then the file will not contain a header row, which can be handy if you want to append data
         to an existing file of the same format.
-        """
 
+        If the handler is streaming (`streamWideText=True`) the rows are
+        already on disk, so this just closes the stream (see
+        :meth:`closeStream`) and, if a different fileName was requested,
+        copies the streamed rows there (without the header if `matrixOnly`,
+        and added to the end of the file if `appendFile`). The rows keep the
+        delimiter they were streamed with.
+        """
+        if self.streamWideText:
+            self.closeStream()
         #create the file or print to stdout
         if appendFile: writeFormat='a'
         else: writeFormat='w' #will overwrite a file
-        if os.path.exists(fileName) and writeFormat == 'w':
-            logging.warning('Data file, %s, will be overwritten' %fileName)
-
         if fileName[-4:] in ['.csv', '.CSV']:
             delim=','
         else:
             delim='\t'
+        if self._streamFileName is not None:
+            self._copyStream(fileName, delim, matrixOnly, writeFormat)
+            return
+        if os.path.exists(fileName) and writeFormat == 'w':
+            logging.warning('Data file, %s, will be overwritten' %fileName)
 
         if fileName=='stdout':
             f = sys.stdout
@@ -266,22 +451,10 @@ class ExperimentHandler(object):
         names.extend(self._getExtraInfo()[0]) #names from the extraInfo dictionary
         #write a header line
         if not matrixOnly:
-            for heading in names:
-                f.write(u'%s%s' %(heading,delim))
-            f.write('\n')
+            self._writeWideTextHeader(f, names, delim)
         #write the data for each entry
-
         for entry in self.entries:
-            for name in names:
-                entry.keys()
-                if name in entry.keys():
-                    if ',' in unicode(entry[name]):
-                        f.write(u'"%s"%s' %(entry[name],delim))
-                    else:
-                        f.write(u'%s%s' %(entry[name],delim))
-                else:
-                    f.write(delim)
-            f.write('\n')
+            self._writeWideTextEntry(f, entry, names, delim)
         f.close()
         self.saveWideText=False
     def saveAsPickle(self,fileName, fileCollisionMethod = 'rename'):
@@ -315,6 +488,22 @@ class ExperimentHandler(object):
         """
         self.savePickle=False
         self.saveWideText=False
+        if self.streamWideText:
+            #rows already streamed stay on disk, but stop adding to them
+            self.closeStream()
+
+def _readWideTextRows(f):
+    """Yields the rows of a wide-text data file opened in binary mode. Line
+    breaks inside (quoted) values are kept as part of their row.
+    """
+    row = ''
+    for line in f:
+        row += line
+        if row.count('"')%2==0:
+            yield row
+            row = ''
+    if row:
+        yield row
 
 class TrialType(dict):
     """This is just like a dict, except that you can access keys with obj.key
@@ -607,6 +796,58 @@ class _BaseTrialHandler(object):
             origin=None
         return originPath, origin
 
+class _TrialSequence(object):
+    """The order of conditions for a :class:`TrialHandler`, generated one
+    repetition at a time (as it is needed) rather than all at the start.
+
+    The 'random' method draws each repetition's shuffle from its own copy of
+    numpy's random number generator, so the sequence (and the state of the
+    global generator afterwards) is the same as if all the repetitions had
+    been shuffled at the start.
+    """
+    def __init__(self, method, nConds, nReps, seed=None):
+        self.method = method
+        self.nConds = nConds
+        self.nReps = nReps
+        self._reps = []#the permutation for each rep generated so far
+        if method == 'random':
+            if seed is not None:
+                numpy.random.seed(seed)
+            self._rng = numpy.random.RandomState()
+            self._rng.set_state(numpy.random.get_state())
+            #move the global generator on, as the shuffles used to do
+            nDraws = nConds*nReps
+            while nDraws>0:
+                numpy.random.random(min(nDraws, 1000000))
+                nDraws -= 1000000
+        elif method == 'fullRandom':
+            #can't be split into reps so shuffle indices*nReps in one go
+            if seed is not None:
+                numpy.random.seed(seed)
+            sequential = numpy.repeat(numpy.arange(nConds), nReps)
+            order = numpy.argsort(numpy.random.random(nConds*nReps))
+            self._fullSequence = sequential[order].reshape(nConds, nReps)
+    def getIndex(self, trialN, repN):
+        """The index of the condition for trialN in repetition repN"""
+        if self.method == 'sequential':
+            return trialN
+        elif self.method == 'fullRandom':
+            return int(self._fullSequence[trialN, repN])
+        while repN>=len(self._reps):
+            rndArray = self._rng.random_sample(self.nConds)
+            self._reps.append(numpy.argsort(rndArray).astype(numpy.int32))
+        return int(self._reps[repN][trialN])
+    def getAll(self):
+        """Returns the whole sequence as an array of form indices[stimN][repN]
+        """
+        if self.method == 'sequential':
+            return numpy.repeat(numpy.arange(self.nConds)[:,None], self.nReps, 1)
+        elif self.method == 'fullRandom':
+            return self._fullSequence
+        if self.nReps:
+            self.getIndex(0, self.nReps-1)#generate any remaining reps
+        return numpy.transpose(numpy.array(self._reps[:self.nReps], int).reshape(self.nReps, self.nConds))
+
 class TrialHandler(_BaseTrialHandler):
     """Class to handle trial sequencing and data storage.
 
@@ -721,6 +962,7 @@ class TrialHandler(_BaseTrialHandler):
             self.data.addDataType(dataTypes)
         self.data.addDataType('ran')
         self.data['ran'].mask=False#this is a bool - all entries are valid
+        self.data.columns['ran'].fill(0)
         self.data.addDataType('order')
         #generate stimulus sequence
         if self.method in ['random','sequential', 'fullRandom']:
@@ -774,11 +1016,14 @@ class TrialHandler(_BaseTrialHandler):
 
     def _createSequence(self):
         """
-        Pre-generates the sequence of trial presentations (for non-adaptive methods).
+        Prepares the sequence of trial presentations (for non-adaptive methods).
         This is called automatically when the TrialHandler is initialised so doesn't
         need an explicit call from the user.
 
-        The returned sequence has form indices[stimN][repN]
+        For a flat trialList this returns a :class:`_TrialSequence`, which
+        generates each repetition when it is first needed. Otherwise the
+        returned sequence has form indices[stimN][repN]. Either way
+        self.sequenceIndices has that form
         Example: sequential with 6 trialtypes (rows), 5 reps (cols), returns:
             [[0 0 0 0 0]
              [1 1 1 1 1]
@@ -796,6 +1041,13 @@ class TrialHandler(_BaseTrialHandler):
         Note that users can make any sequence whatsoever outside of PsychoPy, and
         specify sequential order; any order is possible this way.
         """
+        if numpy.asarray(self.trialList, 'O').ndim==1:
+            #the usual (flat) list of conditions - generate each rep on demand
+            sequence = _TrialSequence(self.method, len(self.trialList),
+                                      self.nReps, seed=self.seed)
+            logging.exp('Created sequence: %s, trialTypes=%d, nReps=%i, seed=%s' %
+                    (self.method, len(self.trialList), self.nReps, str(self.seed) )  )
+            return sequence
         # create indices for a single rep
         indices = numpy.asarray(self._makeIndices(self.trialList), dtype=int)
 
@@ -818,6 +1070,26 @@ class TrialHandler(_BaseTrialHandler):
                 (self.method, len(indices), self.nReps, str(self.seed) )  )
         return sequenceIndices
 
+    def _getSequenceIndices(self):
+        if self.__dict__.get('_sequence') is not None:
+            return self._sequence.getAll()
+        return self.__dict__.get('sequenceIndices', [])
+    def _setSequenceIndices(self, sequenceIndices):
+        if isinstance(sequenceIndices, _TrialSequence):
+            self._sequence = sequenceIndices
+        else:#a sequence given explicitly (or an older handler)
+            self._sequence = None
+            self.__dict__['sequenceIndices'] = sequenceIndices
+    sequenceIndices = property(_getSequenceIndices, _setSequenceIndices,
+        doc="""The sequence of trial presentations, with form indices[stimN][repN]
+        (for a long run, prefer :meth:`getFutureTrial` etc, which don't need
+        the whole sequence to be generated)""")
+    def _getSequenceIndex(self, trialN, repN):
+        """The index of the condition for trialN in repetition repN"""
+        if self.__dict__.get('_sequence') is not None:
+            return self._sequence.getIndex(trialN, repN)
+        return self.sequenceIndices[trialN][repN]
+
     def _makeIndices(self,inputArray):
         """
         Creates an array of tuples the same shape as the input array
@@ -829,21 +1101,14 @@ class TrialHandler(_BaseTrialHandler):
         #get some simple variables for later
         dims=inputArray.shape
         dimsProd=numpy.product(dims)
-        dimsN = len(dims)
-        dimsList = range(dimsN)
-        listOfLists = []
-        arrayOfTuples = numpy.ones(dimsProd, 'O')#this creates space for an array of any objects
-
-        #for each dimension create list of its indices (using modulo)
-        for thisDim in dimsList:
-            prevDimsProd = numpy.product(dims[:thisDim])
-            thisDimVals = numpy.arange(dimsProd)/prevDimsProd % dims[thisDim] #NB this means modulus in python
-            listOfLists.append(thisDimVals)
-
-        #convert to array
-        indexArr = numpy.asarray(listOfLists)
-        for n in range(dimsProd):
-            arrayOfTuples[n] = tuple((indexArr[:,n]))
+        #the index for each dimension (with the first dimension changing fastest)
+        indexArr = numpy.unravel_index(numpy.arange(dimsProd), dims, order='F')
+        tuples = zip(*[thisDimVals.tolist() for thisDimVals in indexArr])
+        if len(dims)==1:
+            return tuples
+        arrayOfTuples = numpy.empty(dimsProd, 'O')#this creates space for an array of any objects
+        for n, thisTuple in enumerate(tuples):
+            arrayOfTuples[n] = thisTuple
         return (numpy.reshape(arrayOfTuples,dims)).tolist()
 
     def next(self):
@@ -884,7 +1149,7 @@ class TrialHandler(_BaseTrialHandler):
 
         #fetch the trial info
         if self.method in ['random','sequential','fullRandom']:
-            self.thisIndex = self.sequenceIndices[self.thisTrialN][self.thisRepN]
+            self.thisIndex = self._getSequenceIndex(self.thisTrialN, self.thisRepN)
             self.thisTrial = self.trialList[self.thisIndex]
             self.data.add('ran',1)
             self.data.add('order',self.thisN)
@@ -898,8 +1163,8 @@ class TrialHandler(_BaseTrialHandler):
         # check that we don't go out of bounds for either positive or negative offsets:
         if n>self.nRemaining or self.thisN+n < 0:
             return None
-        seqs = numpy.array(self.sequenceIndices).transpose().flat
-        condIndex=seqs[self.thisN+n]
+        repN, trialN = divmod(self.thisN+n, len(self.trialList))
+        condIndex=self._getSequenceIndex(trialN, repN)
         return self.trialList[condIndex]
 
     def getEarlierTrial(self, n=-1):
@@ -1134,7 +1399,7 @@ class TrialHandler(_BaseTrialHandler):
         for rep in range(self.nReps):
             for trialN in range(len(self.trialList)):
                 #find out what trial type was on this trial
-                trialTypeIndex = self.sequenceIndices[trialN, rep]
+                trialTypeIndex = self._getSequenceIndex(trialN, rep)
                 #determine which repeat it is for this trial
                 if trialTypeIndex not in repsPerType.keys():
                     repsPerType[trialTypeIndex]=0
@@ -1206,7 +1471,7 @@ def importTrialTypes(fileName, returnFieldNames=False):
     logging.warning("importTrialTypes is DEPRECATED (as of v1.70.00). Please use `importConditions` for identical functionality.")
     return importConditions(fileName, returnFieldNames)
 
-def importConditions(fileName, returnFieldNames=False):
+def importConditions(fileName, returnFieldNames=False, useCache=False):
     """Imports a list of conditions from an .xlsx, .csv, or .pkl file
 
     The output is suitable as an input to :class:`TrialHandler` `trialTypes` or to
@@ -1225,6 +1490,12 @@ def importConditions(fileName, returnFieldNames=False):
         - begin with a letter (upper or lower case)
         - contain no spaces or other punctuation (underscores are permitted)
 
+    If `useCache=True` then the parsed conditions of a .csv or .xlsx file
+    are also saved in a (hidden) pickle file alongside it, and that is
+    loaded instead for as long as the original file is unchanged (same
+    modification time and size). Useful for large files that are
+    imported every time an experiment is run.
+
     """
     def _assertValidVarNames(fieldNames, fileName):
         """screens a list of names as candidate variable names. if all names are
@@ -1245,34 +1516,28 @@ def importConditions(fileName, returnFieldNames=False):
     if not os.path.isfile(fileName):
         raise ImportError, 'Conditions file not found: %s' %os.path.abspath(fileName)
 
-    if fileName.endswith('.csv'):
+    cached = None
+    if useCache and not fileName.endswith('.pkl'):
+        cached = _loadConditionsCache(fileName)
+    if cached is not None:
+        fieldNames, columns = cached
+    elif fileName.endswith('.csv'):
         #use csv import library to fetch the fieldNames
         f = open(fileName, 'rU')#the U converts line endings to os.linesep (not unicode!)
         #lines = f.read().split(os.linesep)#csv module is temperamental with line endings
         try:
             reader = csv.reader(f)#.split(os.linesep))
+            fieldNames = reader.next() # first row
+            rows = list(reader)
         except:
             raise ImportError, 'Could not open %s as conditions' % fileName
-        fieldNames = reader.next() # first row
+        f.close()
         _assertValidVarNames(fieldNames, fileName)
-        #use matplotlib to import data and intelligently check for data types
         #all data in one column will be given a single type (e.g. if one cell is string, all will be set to string)
-        trialsArr = mlab.csv2rec(f) # data = non-header row x col
-        f.close()
-        #convert the record array into a list of dicts
-        trialList = []
-        for trialN, trialType in enumerate(trialsArr):
-            thisTrial ={}
-            for fieldN, fieldName in enumerate(fieldNames):
-                val = trialsArr[trialN][fieldN]
-                if type(val)==numpy.string_:
-                    val = unicode(val.decode('utf-8'))
-                    #if it looks like a list, convert it:
-                    if val.startswith('[') and val.endswith(']'):
-                        #exec('val=%s' %unicode(val.decode('utf8')))
-                        val = eval(val)
-                thisTrial[fieldName] = val
-            trialList.append(thisTrial)
+        columns = []
+        for fieldN in range(len(fieldNames)):
+            column = [(len(row)>fieldN and row[fieldN]) or '' for row in rows]
+            columns.append(_getCsvColumnValues(column))
     elif fileName.endswith('.pkl'):
         f = open(fileName, 'rU') # is U needed?
         try:
@@ -1280,14 +1545,11 @@ def importConditions(fileName, returnFieldNames=False):
         except:
             raise ImportError, 'Could not open %s as conditions' % fileName
         f.close()
-        trialList = []
         fieldNames = trialsArr[0] # header line first
         _assertValidVarNames(fieldNames, fileName)
-        for row in trialsArr[1:]:
-            thisTrial = {}
-            for fieldN, fieldName in enumerate(fieldNames):
-                thisTrial[fieldName] = row[fieldN] # type is correct, being .pkl
-            trialList.append(thisTrial)
+        #type is correct, being .pkl
+        columns = [[row[fieldN] for row in trialsArr[1:]]
+                   for fieldN in range(len(fieldNames))]
     else:
         if not haveOpenpyxl:
             raise ImportError, 'openpyxl is required for loading excel format files, but it was not found.'
@@ -1296,30 +1558,21 @@ def importConditions(fileName, returnFieldNames=False):
         except: # InvalidFileException(unicode(e)): # this fails
             raise ImportError, 'Could not open %s as conditions' % fileName
         ws = wb.worksheets[0]
-        nCols = ws.get_highest_column()
-        nRows = ws.get_highest_row()
-
+        #fetch all the cells in one go rather than one at a time
+        rows = ws.range('A1:%s' %_getExcelCellName(col=ws.get_highest_column()-1,
+                                                   row=ws.get_highest_row()-1))
         #get parameter names from the first row header
-        fieldNames = []
-        for colN in range(nCols):
-            fieldName = ws.cell(_getExcelCellName(col=colN, row=0)).value
-            fieldNames.append(fieldName)
+        fieldNames = [cell.value for cell in rows[0]]
         _assertValidVarNames(fieldNames, fileName)
+        columns = []
+        for colN in range(len(fieldNames)):
+            columns.append(_evalListValues([row[colN].value for row in rows[1:]],
+                                            brackets=['[]','()']))
 
-        #loop trialTypes
-        trialList = []
-        for rowN in range(1, nRows):#skip header first row
-            thisTrial={}
-            for colN in range(nCols):
-                val = ws.cell(_getExcelCellName(col=colN, row=rowN)).value
-                #if it looks like a list, convert it
-                if type(val) in [unicode, str] and (
-                        val.startswith('[') and val.endswith(']') or
-                        val.startswith('(') and val.endswith(')') ):
-                    val = eval(val)
-                fieldName = fieldNames[colN]
-                thisTrial[fieldName] = val
-            trialList.append(thisTrial)
+    if useCache and cached is None and not fileName.endswith('.pkl'):
+        _saveConditionsCache(fileName, fieldNames, columns)
+    #convert the columns into a list of dicts (one per trial type)
+    trialList = [dict(zip(fieldNames, row)) for row in zip(*columns)]
 
     logging.exp('Imported %s as conditions, %d conditions, %d params' %
                  (fileName, len(trialList), len(fieldNames)))
@@ -1328,6 +1581,84 @@ def importConditions(fileName, returnFieldNames=False):
     else:
         return trialList
 
+def _evalListValues(values, brackets=['[]']):
+    """Converts strings that look like a list (e.g. "[1,2]") into the list.
+    Identical strings are only evaluated once.
+    """
+    evaluated = {}
+    out = []
+    for val in values:
+        if type(val) in [unicode, str] and len(val)>1 and \
+                (val[0]+val[-1]) in brackets:
+            if val not in evaluated:
+                evaluated[val] = eval(val)
+            else:#don't share mutable values between trials
+                out.append(copy.deepcopy(evaluated[val]))
+                continue
+            val = evaluated[val]
+        out.append(val)
+    return out
+
+def _getCsvColumnValues(column):
+    """Converts a column of strings from a csv file to values, choosing a
+    single type for the whole column (int, float, bool or unicode string).
+    Empty cells in a numeric column make it float (with nan for those cells).
+    """
+    nonEmpty = [val for val in column if val.strip()!='']
+    if not nonEmpty:
+        return [unicode(val.decode('utf-8')) for val in column]
+    if len(nonEmpty)==len(column):
+        try:
+            return list(numpy.array(column, dtype=int))
+        except (ValueError, OverflowError):
+            pass
+    try:
+        return list(numpy.array([val.strip() or 'nan' for val in column],
+                                dtype=float))
+    except ValueError:
+        pass
+    if set([val.strip().lower() for val in nonEmpty]) <= set(['true','false']) \
+            and len(nonEmpty)==len(column):
+        return [numpy.bool_(val.strip().lower()=='true') for val in column]
+    return _evalListValues([unicode(val.decode('utf-8')) for val in column])
+
+def _getConditionsCacheName(fileName):
+    folder, name = os.path.split(os.path.abspath(fileName))
+    return os.path.join(folder, '.%s.psycache' %name)
+
+def _loadConditionsCache(fileName):
+    """Returns (fieldNames, columns) from the cache for this conditions file
+    or None if there isn't an up-to-date cache
+    """
+    cacheName = _getConditionsCacheName(fileName)
+    if not os.path.isfile(cacheName):
+        return None
+    stat = os.stat(fileName)
+    try:
+        f = open(cacheName, 'rb')
+        cached = cPickle.load(f)
+        f.close()
+    except:
+        logging.warning('Could not read conditions cache %s' %cacheName)
+        return None
+    if cached.get('key')!=(stat.st_mtime, stat.st_size):
+        return None#the file has changed
+    logging.debug('Using conditions cache %s' %cacheName)
+    return cached['fieldNames'], cached['columns']
+
+def _saveConditionsCache(fileName, fieldNames, columns):
+    stat = os.stat(fileName)
+    cacheName = _getConditionsCacheName(fileName)
+    try:
+        f = open(cacheName, 'wb')
+        cPickle.dump({'key':(stat.st_mtime, stat.st_size),
+                      'fieldNames':fieldNames, 'columns':columns},
+                     f, cPickle.HIGHEST_PROTOCOL)
+        f.close()
+    except (IOError, OSError):
+        #e.g. the folder is read-only, so just don't cache
+        logging.warning('Could not save conditions cache %s' %cacheName)
+
 def createFactorialTrialList(factors):
     """Create a trialList by entering a list of factors with names (keys) and levels (values)
     it will return a trialList in which all factors have been factorially combined (so for example
@@ -2525,6 +2856,115 @@ class MultiStairHandler(_BaseTrialHandler):
             thisStair.saveAsText(fileName='stdout', delim=delim,
                 matrixOnly=thisMatrixOnly)
 
+class _DataColumn(object):
+    """Typed, growable storage for the values of one data type.
+
+    The dtype is chosen from the first value given and promoted only when
+    needed (bool -> int -> float, anything else mixed -> object).
+    Strings are stored as fixed-width arrays whose width doubles when a
+    longer value arrives. Entries that have not been set are marked by the
+    boolean `valid` array rather than by a placeholder value.
+
+    `shape` is the shape of the data; the arrays may have room for more
+    (their `capacity`) so that growing the column is cheap.
+    """
+    _numericKinds = ['b','i','f']
+    def __init__(self, shape):
+        self.shape = tuple(shape)
+        self.capacity = self.shape
+        self.kind = None#set by the first value
+        self.data = numpy.zeros(self.capacity, 'f')#placeholder until then
+        self.valid = numpy.zeros(self.capacity, bool)
+    def _getKind(self, value):
+        if isinstance(value, (bool, numpy.bool_)):
+            return 'b'
+        elif isinstance(value, (int, long, numpy.integer)):
+            if -2**63 <= value < 2**63:
+                return 'i'
+            return 'O'
+        elif isinstance(value, (float, numpy.floating)):
+            return 'f'
+        elif isinstance(value, str):
+            return 'S'
+        elif isinstance(value, unicode):
+            return 'U'
+        return 'O'
+    def _getDtype(self, kind, itemsize=0):
+        if kind=='b': return numpy.dtype(bool)
+        elif kind=='i': return numpy.dtype('i8')
+        elif kind=='f': return numpy.dtype('f8')
+        elif kind in ['S','U']: return numpy.dtype('%s%i' %(kind, max(itemsize,1)))
+        return numpy.dtype('O')
+    def _convert(self, kind, itemsize=0):
+        """Recreate the storage as the given kind (keeping the values)"""
+        if self.kind is None:
+            self.data = numpy.zeros(self.capacity, self._getDtype(kind, itemsize))
+        elif kind=='O':
+            newData = numpy.empty(self.capacity, 'O')
+            newData[self.valid] = self.data[self.valid].tolist()
+            self.data = newData
+        else:
+            self.data = self.data.astype(self._getDtype(kind, itemsize))
+        self.kind = kind
+    def set(self, index, value):
+        """Store value at the given index, promoting the dtype if necessary
+        """
+        kind = self._getKind(value)
+        if kind!=self.kind:
+            if self.kind is None:
+                newKind = kind
+            elif kind in self._numericKinds and self.kind in self._numericKinds:
+                newKind = max(kind, self.kind, key=self._numericKinds.index)
+            else:
+                newKind = 'O'
+            if newKind!=self.kind:
+                if newKind in ['S','U']:
+                    itemsize = max(len(value), self._getItemLength())
+                    self._convert(newKind, itemsize*2)
+                else:
+                    self._convert(newKind)
+        if self.kind in ['S','U'] and len(value)>self._getItemLength():
+            self._convert(self.kind, len(value)*2)
+        self.data[index] = value
+        self.valid[index] = True
+    def _getItemLength(self):
+        if self.kind=='S':
+            return self.data.dtype.itemsize
+        elif self.kind=='U':
+            return self.data.dtype.itemsize//numpy.dtype('U1').itemsize
+        return 0
+    def fill(self, value):
+        """Set every entry to value (and mark them all valid)"""
+        self.set((Ellipsis,), value)
+        self.valid[...] = True
+    def grow(self, position):
+        """Extend the shape of the column to include position, keeping the
+        existing values. When the arrays need to grow they double in size
+        so that repeated growth is cheap.
+        """
+        shape = tuple([max(n, pos+1) for n, pos in zip(self.shape, position)])
+        if [n for n, cap in zip(shape, self.capacity) if n>cap]:
+            capacity = tuple([max(n, cap*2) if n>cap else cap
+                              for n, cap in zip(shape, self.capacity)])
+            oldSlice = tuple([slice(0,n) for n in self.capacity])
+            newData = numpy.zeros(capacity, self.data.dtype)
+            newData[oldSlice] = self.data
+            newValid = numpy.zeros(capacity, bool)
+            newValid[oldSlice] = self.valid
+            self.data, self.valid, self.capacity = newData, newValid, capacity
+        self.shape = shape
+    def getData(self):
+        """Returns (values, valid) for the shape of the column (views of the
+        arrays, which may be larger)
+        """
+        used = tuple([slice(0,n) for n in self.shape])
+        return self.data[used], self.valid[used]
+    def asArray(self):
+        """Returns the values as a masked array of the column's own dtype
+        """
+        data, valid = self.getData()
+        return numpy.ma.array(data, mask=~valid)
+
 class DataHandler(dict):
     """For handling data (used by TrialHandler, principally, rather than
     by users directly)
@@ -2534,17 +2974,27 @@ class DataHandler(dict):
     is converted to a standard (not masked) numpy array with dtype='O' and where missing entries have
     value="--"
 
+    Values are also stored in typed columns (see :meth:`getColumn`) that
+    keep their own dtype (bool, int, float, str or object) and grow as
+    needed. add() updates both, so use it (rather than changing the arrays
+    in place) to modify the data.
+
     Attributes:
         - ['key']=data arrays containing values for that key
             (e.g. data['accuracy']=...)
+        - columns=the typed storage for each key
         - dataShape=shape of data (x,y,...z,nReps)
         - dataTypes=list of keys as strings
 
     """
+    columns=None#handlers unpickled from older versions don't have these
+    _repCounts=None
     def __init__(self, dataTypes=None, trials=None, dataShape=None):
         self.trials=trials
         self.dataTypes=[]#names will be added during addDataType
         self.isNumeric={}
+        self.columns={}
+        self._repCounts={}#number of reps run so far for each trial index
         #if given dataShape use it - otherwise guess!
         if dataShape: self.dataShape=dataShape
         elif self.trials:
@@ -2556,6 +3006,24 @@ class DataHandler(dict):
             for thisType in dataTypes:
                 self.addDataType(thisType)
 
+    def __setitem__(self, key, value):
+        """Replaces the data for key with the given array"""
+        dict.__setitem__(self, key, value)
+        self.isNumeric[key] = numpy.asarray(value).dtype.kind in 'biuf'
+        #the typed column is recreated from the array when next needed
+        self._getColumns().pop(key, None)
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).iteritems():
+            self[key] = value
+    def setdefault(self, key, value=None):
+        if key not in self:
+            self[key] = value
+        return dict.__getitem__(self, key)
+    def __reduce_ex__(self, protocol):
+        #always restore the dict with dict.__init__ (as for protocols 0
+        #and 1) so the arrays don't go through __setitem__ before the
+        #attributes are back
+        return copy_reg._reconstructor, (self.__class__, dict, dict(self)), self.__dict__
     def addDataType(self, names, shape=None):
         """Add a new key to the data dictionary of
         particular shape if specified (otherwise the
@@ -2569,15 +3037,75 @@ class DataHandler(dict):
             #recursively call this function until we have a string
             for thisName in names: self.addDataType(thisName)
         else:
-            #create the appropriate array in the dict
-            #initially use numpy masked array of floats with mask=True for missing vals
-            #convert to a numpy array with dtype='O' if non-numeric data given
-            #NB don't use masked array with dytpe='O' together -they don't unpickle
-            self[names]=numpy.ma.zeros(shape,'f')#masked array of floats
-            self[names].mask=True
+            #create the array (a masked array of floats with mask=True for
+            #missing vals) and the typed column for the values
+            arr = numpy.ma.zeros(shape,'f')
+            arr.mask = True
+            dict.__setitem__(self, names, arr)
+            self._getColumns()[names]=_DataColumn(shape)
             #add the name to the list
             self.dataTypes.append(names)
             self.isNumeric[names]=True#until we need otherwise
+    def getColumn(self, thisType):
+        """Returns the data for thisType as a masked array that keeps the
+        dtype of the values given (e.g. int, bool or str), rather than the
+        float/object array given by data[thisType]
+        """
+        return self._getColumn(thisType).asArray()
+    def _getColumns(self):
+        if self.columns is None:
+            self.columns={}#handler from an older version
+        return self.columns
+    def _getColumn(self, thisType):
+        """The typed column for thisType, created from the array if needed
+        (for handlers from older versions or arrays set directly)
+        """
+        columns = self._getColumns()
+        if thisType not in columns:
+            columns[thisType] = self._columnFromArray(
+                dict.__getitem__(self, thisType), self.isNumeric[thisType])
+        return columns[thisType]
+    def _columnFromArray(self, arr, isNumeric):
+        """Create a typed column holding the values of a data array"""
+        if isNumeric:
+            valid = ~numpy.ma.getmaskarray(arr)
+            vals = numpy.ma.getdata(arr)
+        else:
+            arr = numpy.asarray(arr)
+            isValue = numpy.frompyfunc(lambda x: not (isinstance(x, basestring) and x=='--'), 1, 1)
+            valid = isValue(arr).astype(bool)
+            vals = arr
+        column = _DataColumn(vals.shape)
+        for index in zip(*numpy.nonzero(valid)):
+            column.set(index, vals[index])
+        return column
+    def _updateArray(self, thisType):
+        """Recreate data[thisType] from its column: a masked array of floats
+        while the data are numeric, otherwise an object array with "--" for
+        missing values
+        """
+        data, valid = self._getColumn(thisType).getData()
+        if self.isNumeric[thisType]:
+            arr = numpy.ma.array(data.astype('f'), mask=~valid)
+        else:
+            arr = numpy.empty(data.shape, 'O')
+            arr[...] = '--'
+            arr[valid] = data[valid]
+        dict.__setitem__(self, thisType, arr)
+    def _getRepN(self, index, thisType):
+        """The rep number for the current trial index, counting the reps
+        as 'ran' is added (so is O(1) rather than a sum over the reps)
+        """
+        if self._repCounts is None:
+            self._repCounts = {}
+        if index not in self._repCounts:
+            #first time (or older handler), so count from the data
+            data, valid = self._getColumn('ran').getData()
+            self._repCounts[index] = int(data[index][valid[index]].sum())
+        if thisType=='ran':
+            #'ran' is always the first thing to update
+            self._repCounts[index] += 1
+        return self._repCounts[index]-1
     def add(self, thisType, value, position=None):
         """Add data to an existing data type
         (and add a new one if necess)
@@ -2585,36 +3113,37 @@ class DataHandler(dict):
         if not thisType in self:
             self.addDataType(thisType)
         if position==None:
-            #'ran' is always the first thing to update
-            if thisType=='ran':
-                repN = sum(self['ran'][self.trials.thisIndex])
-            else:
-                repN = sum(self['ran'][self.trials.thisIndex])-1#because it has already been updated
             #make a list where 1st digit is trial number
-            position= [self.trials.thisIndex]
-            position.append(repN)
+            index = self.trials.thisIndex
+            position= [index, self._getRepN(index, thisType)]
+        elif thisType=='ran' and self._repCounts:
+            #count the reps for this index from the data when next needed
+            self._repCounts.pop(position[0], None)
+        position = tuple(position)
 
         #check whether data falls within bounds
-        posArr = numpy.asarray(position)
-        shapeArr = numpy.asarray(self.dataShape)
-        if not numpy.alltrue(posArr<shapeArr):
-            #array isn't big enough
-            logging.warning('need a bigger array for:'+thisType)
-            self[thisType]=extendArr(self[thisType],posArr)#not implemented yet!
+        column = self._getColumn(thisType)
+        for dim, pos in enumerate(position):
+            if pos>=column.shape[dim]:
+                #array isn't big enough
+                self._extendDataType(thisType, position)
+                break
+        column.set(position, value)
         #check for ndarrays with more than one value and for non-numeric data
         if self.isNumeric[thisType] and \
             ((type(value)==numpy.ndarray and len(value)>1) or (type(value) not in [float, int])):
-                self._convertToObjectArray(thisType)
-        #insert the value
-        self[thisType][position[0],position[1]]=value
-    def _convertToObjectArray(self, thisType):
-        """Convert this datatype from masked numeric array to unmasked object array
-        """
-        dat = self[thisType]
-        self[thisType] = numpy.array(dat.data, dtype='O')#create an array of Object type
-        #masked vals should be "--", others keep data
-        self[thisType] = numpy.where(dat.mask, '--',dat).astype('O')#we have to repeat forcing to 'O' or text gets truncated to 4chars
-        self.isNumeric[thisType]=False
+                self.isNumeric[thisType]=False
+                self._updateArray(thisType)#convert to an object array
+        else:
+            dict.__getitem__(self, thisType)[position] = value
+    def _extendDataType(self, thisType, position):
+        """Grow the data for this type to include position (the typed column
+        reserves extra room so that repeated growth is cheap)
+        """
+        column = self._getColumn(thisType)
+        column.grow(position)
+        logging.debug('extending data array for %s to %s' %(thisType, column.shape))
+        self._updateArray(thisType)
 
 class FitFunction:
     """Deprecated: - use the specific functions; FitWeibull, FitLogistic...
@@ -2705,6 +3234,19 @@ class FitWeibull(_baseFunctionFit):
         global _chance
         xx = alpha * (-numpy.log((1.0-yy)/(1-_chance))) **(1.0/beta)
         return xx
+    @staticmethod
+    def _jacobian(xx, alpha, beta):
+        """The derivatives of _eval with respect to [alpha, beta] at each xx
+        """
+        global _chance
+        xx = numpy.asarray(xx, float)
+        uu = (xx/alpha)**beta
+        scale = (1.0-_chance)*numpy.exp(-uu)*uu
+        jac = numpy.empty((len(xx),2))
+        jac[:,0] = -scale*beta/alpha
+        jac[:,1] = scale*numpy.log(xx/alpha)
+        jac[uu==0,1] = 0.0#(limit of u*log(u) at zero)
+        return jac
 
 class FitNakaRushton(_baseFunctionFit):
     """Fit a Naka-Rushton function
@@ -2737,6 +3279,24 @@ class FitNakaRushton(_baseFunctionFit):
         yScaled[yScaled<0]=0
         xx = (yScaled*(c50)**n/(1-yScaled))**(1/n)
         return xx
+    @staticmethod
+    def _jacobian(xx, c50, n, rMin, rMax):
+        """The derivatives of _eval with respect to [c50, n, rMin, rMax] at each xx
+        """
+        xx = numpy.asarray(xx, float)
+        if c50<=0: c50=0.001
+        if n<=0: n=0.001
+        xxN = xx**n
+        c50N = c50**n
+        denom = (xxN+c50N)**2
+        frac = xxN/(xxN+c50N)
+        jac = numpy.empty((len(xx),4))
+        jac[:,0] = -(rMax-rMin)*xxN*n*c50**(n-1)/denom
+        jac[:,1] = (rMax-rMin)*xxN*c50N*(numpy.log(xx)-numpy.log(c50))/denom
+        jac[xxN==0,1] = 0.0
+        jac[:,2] = 1-frac
+        jac[:,3] = frac
+        return jac
 
 class FitLogistic(_baseFunctionFit):
     """Fit a Logistic function (either 2AFC or YN)
@@ -2767,6 +3327,19 @@ class FitLogistic(_baseFunctionFit):
         yy = numpy.asarray(yy)
         xx = PSE - numpy.log((1-_chance)/(yy-_chance) - 1)/JND
         return xx
+    @staticmethod
+    def _jacobian(xx, PSE, JND):
+        """The derivatives of _eval with respect to [PSE, JND] at each xx
+        """
+        global _chance
+        xx = numpy.asarray(xx, float)
+        ee = numpy.exp((PSE-xx)*JND)
+        scale = -(1-_chance)*ee/(1+ee)**2
+        scale[numpy.isinf(ee)] = 0.0
+        jac = numpy.empty((len(xx),2))
+        jac[:,0] = scale*JND
+        jac[:,1] = scale*(PSE-xx)
+        return jac
 
 class FitCumNormal(_baseFunctionFit):
     """Fit a Cumulative Normal function (aka error function or erf)
@@ -2804,13 +3377,31 @@ class FitCumNormal(_baseFunctionFit):
         #xx = (special.erfinv((yy-chance)/(1-chance)*2.0-1)+xShift)/xScale#NB numpy.special.erfinv() goes from -1:1
         xx = xShift+sd*special.erfinv(( (yy-_chance)/(1-_chance) - 0.5 )*2)
         return xx
+    @staticmethod
+    def _jacobian(xx, xShift, sd):
+        """The derivatives of _eval with respect to [xShift, sd] at each xx
+        """
+        global _chance
+        zz = (numpy.asarray(xx, float)-xShift)/sd
+        jac = numpy.empty((len(zz),2))
+        jac[:,0] = -(1-_chance)*numpy.exp(-zz**2)/numpy.sqrt(numpy.pi)/sd
+        jac[:,1] = jac[:,0]*zz
+        return jac
 
 ########################## End psychopy.data classes ##########################
 
-def bootStraps(dat, n=1):
-    """Create a list of n bootstrapped resamples of the data
+def _getRandomState(randomState):
+    """Returns something with the numpy.random functions from an int seed, a
+    numpy.random.RandomState or None (meaning numpy's global generator)
+    """
+    if randomState is None:
+        return numpy.random
+    elif isinstance(randomState, numpy.random.RandomState):
+        return randomState
+    return numpy.random.RandomState(randomState)
 
-    SLOW IMPLEMENTATION (Python for-loop)
+def bootStraps(dat, n=1, randomState=None):
+    """Create a list of n bootstrapped resamples of the data
 
     Usage:
         ``out = bootStraps(dat, n=1)``
@@ -2820,6 +3411,9 @@ def bootStraps(dat, n=1):
             an NxM or 1xN array (each row is a different condition, each column is a different trial)
         n
             number of bootstrapped resamples to create
+        randomState
+            an int seed or a numpy.random.RandomState (default uses numpy's
+            global random number generator)
 
         out
             - dim[0]=conditions
@@ -2829,17 +3423,231 @@ def bootStraps(dat, n=1):
     dat = numpy.asarray(dat)
     if len(dat.shape)==1: #have presumably been given a series of data for one stimulus
         dat=numpy.array([dat])#adds a dimension (arraynow has shape (1,Ntrials))
+    rng = _getRandomState(randomState)
 
-    nTrials = dat.shape[1]
+    nStim, nTrials = dat.shape
     #initialise a matrix to store output
     resamples = numpy.zeros(dat.shape+(n,), dat.dtype)
-    for stimulusN in range(dat.shape[0]):
-        thisStim = dat[stimulusN,:]#fetch data for this stimulus
-        for sampleN in range(n):
-            indices = numpy.floor(nTrials*numpy.random.rand(nTrials)).astype('i')
-            resamples[stimulusN,:,sampleN] = numpy.take(thisStim, indices)
+    #create the indices for many resamples at once, but in chunks so that
+    #the index arrays don't get bigger than the output
+    chunkSize = max(1, 1000000//max(1, nStim*nTrials))
+    stimN = numpy.arange(nStim)[:,None,None]
+    for firstSample in range(0, n, chunkSize):
+        nSamples = min(chunkSize, n-firstSample)
+        indices = rng.randint(0, nTrials, size=(nStim, nTrials, nSamples))
+        resamples[:,:,firstSample:firstSample+nSamples] = dat[stimN, indices]
     return resamples
 
+def _bootStrapFitChunk(args):
+    """Fits one chunk of resamples for :func:`bootStrapFit` (a module-level
+    function so that it can be sent to a process pool)
+    """
+    fitClass, intensities, responses, indices, bins, expectedMin = args
+    allParams = []
+    for theseIndices in indices:
+        xx, yy, nn = functionFromStaircase(intensities[theseIndices],
+                                           responses[theseIndices], bins=bins)
+        try:
+            params = fitClass(xx, yy, expectedMin=expectedMin, display=0).params
+        except Exception:#e.g. the fit failed to converge
+            params = None
+        allParams.append(params)
+    return allParams
+
+def bootStrapFit(fitClass, intensities, responses, n=100, bins='unique',
+                 expectedMin=0.5, randomState=None, nProcesses=1):
+    """Fit a psychometric function to n bootstrapped resamples of some trials
+    (e.g. to find confidence intervals for its parameters)
+
+    Usage::
+
+        params = bootStrapFit(data.FitWeibull, intensities, responses, n=1000)
+        alphaCI = numpy.percentile(params[:,0], [2.5, 97.5])
+
+    Where:
+        fitClass
+            e.g. :class:`FitWeibull`, :class:`FitLogistic` or :class:`FitCumNormal`
+        intensities, responses
+            the intensity and (0/1) response on each trial
+        n
+            number of bootstrapped resamples to fit
+        bins
+            how to bin each resample (see :func:`functionFromStaircase`)
+        expectedMin
+            passed to the fitClass
+        randomState
+            an int seed or a numpy.random.RandomState (default uses numpy's
+            global random number generator)
+        nProcesses
+            the number of processes to share the fitting between (None uses
+            one per CPU)
+
+    Returns an array of shape (n, nParams) where any resample that could not
+    be fitted has nan for its parameters.
+    """
+    intensities = numpy.asarray(intensities)
+    responses = numpy.asarray(responses)
+    rng = _getRandomState(randomState)
+    nTrials = len(intensities)
+    #all the resamples in one go (one row of trial indices per resample)
+    indices = rng.randint(0, nTrials, size=(n, nTrials))
+    if nProcesses is None:
+        import multiprocessing
+        nProcesses = multiprocessing.cpu_count()
+    nChunks = max(1, min(n, nProcesses*4))
+    chunks = [(fitClass, intensities, responses, theseIndices, bins, expectedMin)
+              for theseIndices in numpy.array_split(indices, nChunks)]
+    if nProcesses>1:
+        import multiprocessing
+        pool = multiprocessing.Pool(nProcesses)
+        try:
+            results = pool.map(_bootStrapFitChunk, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(_bootStrapFitChunk, chunks)
+    allParams = [params for chunk in results for params in chunk]
+    nParams = max([len(params) for params in allParams if params is not None] or [0])
+    out = numpy.empty((n, nParams))
+    out.fill(numpy.nan)
+    for sampleN, params in enumerate(allParams):
+        if params is not None:
+            out[sampleN] = params
+    return out
+
+def _isWellDetermined(params, covar, resid, ier):
+    """True if a leastsq solution converged with every parameter's standard
+    error smaller than the parameter itself
+    """
+    if ier not in [1,2,3,4] or covar is None:
+        return False
+    nDof = max(1, len(resid)-len(params))
+    errs = numpy.sqrt(numpy.abs(numpy.diag(covar))*numpy.sum(resid**2)/nDof)
+    return bool(numpy.all(errs<numpy.abs(params)))
+
+def _fitBatchChunk(args):
+    """Fits one chunk of datasets for :func:`fitBatch` (a module-level
+    function so that it can be sent to a process pool)
+    """
+    fitClass, xx, yy, sems, guess, expectedMin, warmStart = args
+    global _chance
+    _chance = expectedMin
+    evalFunc = fitClass._eval
+    jacobian = getattr(fitClass, '_jacobian', None)
+    results = []
+    start = guess
+    errSettings = numpy.seterr(all='ignore')#once, rather than per evaluation
+    try:
+        for thisX, thisY, theseSems in zip(xx, yy, sems):
+            def residuals(params):
+                return evalFunc(thisX, *params)-thisY
+            if jacobian is None:
+                Dfun = None
+            else:
+                def Dfun(params):
+                    return jacobian(thisX, *params)
+            params, covar, info, msg, ier = optimize.leastsq(residuals, start,
+                Dfun=Dfun, full_output=True)
+            wellDetermined = _isWellDetermined(params, covar, info['fvec'], ier)
+            #a warm start can leave the fit stuck where the function is flat
+            #(e.g. a step) so retry poorly determined fits from the guess
+            if start is not guess and not wellDetermined:
+                params, covar, info, msg, ier = optimize.leastsq(residuals, guess,
+                    Dfun=Dfun, full_output=True)
+                wellDetermined = _isWellDetermined(params, covar, info['fvec'], ier)
+            converged = ier in [1,2,3,4] and numpy.all(numpy.isfinite(params))
+            if warmStart and wellDetermined:
+                start = params#the next dataset is probably similar
+            else:
+                start = guess
+            resid = residuals(params)
+            results.append((params, resid, converged))
+    finally:
+        numpy.seterr(**errSettings)
+    return results
+
+def fitBatch(fitClass, xx, yy, sems=1.0, guess=None, expectedMin=0.5,
+             warmStart=True, nProcesses=1):
+    """Fit one function (e.g. for each subject and condition) to many
+    datasets in one call
+
+    This is equivalent to creating one `fitClass` object per dataset but is
+    faster: it uses the analytic derivatives of the function (when the
+    class provides a `_jacobian`), starts each fit from the previous
+    solution (`warmStart`) and can share the fits between several
+    processes.
+
+    Usage::
+
+        fits = fitBatch(data.FitWeibull, contrasts, allResponses)
+        thresholds = fits['params'][:,0]
+
+    Where:
+        fitClass
+            e.g. :class:`FitWeibull`, :class:`FitLogistic`,
+            :class:`FitCumNormal` or :class:`FitNakaRushton`
+        xx
+            array of x values, either (nFits, nPoints) or (nPoints,) if
+            all datasets share the same values
+        yy
+            array (nFits, nPoints) of the values to fit
+        sems
+            standard errors (broadcast to the shape of yy), used for 'chi'
+        guess
+            starting parameters for the first fit (default all 1s)
+        nProcesses
+            the number of processes to share the fitting between (None uses
+            one per CPU)
+
+    Returns a numpy structured array with one entry per dataset and fields
+    'params', 'residuals', 'ssq', 'chi', 'rms' (as for the fit objects)
+    and 'converged'.
+    """
+    yy = numpy.atleast_2d(numpy.asarray(yy, float))
+    nFits, nPoints = yy.shape
+    xx = numpy.asarray(xx, float)*numpy.ones((nFits, nPoints))
+    sems = numpy.asarray(sems, float)*numpy.ones((nFits, nPoints))
+    nParams = len(inspect.getargspec(fitClass._eval)[0])-1#all but xx
+    if guess is None:
+        guess = numpy.ones(nParams)
+    if nProcesses is None:
+        import multiprocessing
+        nProcesses = multiprocessing.cpu_count()
+    nChunks = max(1, min(nFits, nProcesses))
+    chunks = [(fitClass, theseX, theseY, theseSems, guess, expectedMin, warmStart)
+              for theseX, theseY, theseSems in zip(numpy.array_split(xx, nChunks),
+                                                   numpy.array_split(yy, nChunks),
+                                                   numpy.array_split(sems, nChunks))]
+    if nProcesses>1:
+        import multiprocessing
+        pool = multiprocessing.Pool(nProcesses)
+        try:
+            results = pool.map(_fitBatchChunk, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(_fitBatchChunk, chunks)
+    global _chance
+    _chance = expectedMin
+
+    out = numpy.zeros(nFits, dtype=[('params', float, (nParams,)),
+                                    ('residuals', float, (nPoints,)),
+                                    ('ssq', float), ('chi', float),
+                                    ('rms', float), ('converged', bool)])
+    fitN = 0
+    for chunk in results:
+        for params, resid, converged in chunk:
+            out['params'][fitN] = params
+            out['residuals'][fitN] = resid
+            out['converged'][fitN] = converged
+            fitN += 1
+    out['ssq'] = (out['residuals']**2).sum(1)
+    out['chi'] = (out['residuals']**2/sems).sum(1)
+    out['rms'] = out['ssq']/nPoints
+    return out
+
 def functionFromStaircase(intensities, responses, bins = 10):
     """Create a psychometric function by binning data from a staircase procedure
 
@@ -2874,31 +3682,29 @@ def functionFromStaircase(intensities, responses, bins = 10):
         intensities = numpy.array(intensities)
         responses = numpy.array(responses)
 
-    #sort the responses
-    sort_ii = numpy.argsort(intensities)
-    sortedInten = numpy.take(intensities, sort_ii)
-    sortedResp = numpy.take(responses, sort_ii)
-
-    binnedResp=[]; binnedInten=[]; nPoints = []
     if bins=='unique':
         intensities = numpy.round(intensities, decimals=8)
-        uniqueIntens=numpy.unique(intensities)
-        for thisInten in uniqueIntens:
-            theseResps = responses[intensities==thisInten]
-            binnedInten.append(thisInten)
-            binnedResp.append(numpy.mean(theseResps))
-            nPoints.append(len(theseResps))
+        binnedInten, binNs = numpy.unique(intensities, return_inverse=True)
+        nBins = len(binnedInten)
     else:
+        #sort the responses
+        sort_ii = numpy.argsort(intensities)
+        intensities = numpy.take(intensities, sort_ii)
+        responses = numpy.take(responses, sort_ii)
+        #the first point in each bin (rounding as python's round() does)
         pointsPerBin = len(intensities)/float(bins)
-        for binN in range(bins):
-            thisResp = sortedResp[int(round(binN*pointsPerBin)) : int(round((binN+1)*pointsPerBin))]
-            thisInten = sortedInten[int(round(binN*pointsPerBin)) : int(round((binN+1)*pointsPerBin))]
-
-            binnedResp.append( numpy.mean(thisResp))
-            binnedInten.append( numpy.mean(thisInten))
-            nPoints.append( len(thisInten) )
-
-    return binnedInten, binnedResp, nPoints
+        binStarts = numpy.floor(numpy.arange(bins+1)*pointsPerBin+0.5).astype(int)
+        binNs = numpy.searchsorted(binStarts, numpy.arange(len(intensities)), side='right')-1
+        nBins = bins
+    #sum each bin in one pass (empty bins give a mean of nan, as numpy.mean would)
+    nPoints = numpy.bincount(binNs, minlength=nBins)
+    oldSettings = numpy.seterr(invalid='ignore', divide='ignore')
+    binnedResp = numpy.bincount(binNs, weights=responses, minlength=nBins)/nPoints
+    if bins!='unique':
+        binnedInten = numpy.bincount(binNs, weights=intensities, minlength=nBins)/nPoints
+    numpy.seterr(**oldSettings)
+
+    return list(binnedInten), list(binnedResp), nPoints.tolist()
 
 def getDateStr(format="%Y_%b_%d_%H%M"):
     """Uses ``time.strftime()``_ to generate a string of the form
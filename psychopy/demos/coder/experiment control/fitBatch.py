@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+
+#Fits a psychometric function to many simulated datasets (e.g. subjects x
+#conditions), first with one FitWeibull object per dataset and then with a
+#single call to data.fitBatch, and reports the time taken by each
+
+from psychopy import data, core
+import numpy
+
+nSubjects, nConds = 40, 10
+intensities = numpy.array([0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.7])
+nTrials = 40 #per intensity
+expectedMin = 0.5 #2AFC
+
+#simulate each dataset with its own threshold and slope
+rng = numpy.random.RandomState(0)
+nFits = nSubjects*nConds
+alphas = rng.uniform(0.15, 0.35, nFits)
+betas = rng.uniform(2.0, 4.0, nFits)
+pCorrect = expectedMin+(1-expectedMin)*(1-numpy.exp(-(intensities/alphas[:,None])**betas[:,None]))
+responses = rng.binomial(nTrials, pCorrect)/float(nTrials)
+
+timer = core.Clock()
+loopParams = []
+for thisResp in responses:
+    fit = data.FitWeibull(intensities, thisResp, expectedMin=expectedMin)
+    loopParams.append(fit.params)
+loopTime = timer.getTime()
+print 'loop of %i FitWeibull objects: %.3fs' %(nFits, loopTime)
+
+for nProcesses in [1, None]:
+    timer.reset()
+    fits = data.fitBatch(data.FitWeibull, intensities, responses,
+        expectedMin=expectedMin, nProcesses=nProcesses)
+    batchTime = timer.getTime()
+    print 'fitBatch(nProcesses=%s): %.3fs (%.1fx faster)' %(nProcesses, batchTime, loopTime/batchTime)
+
+print 'fits converged: %i/%i' %(fits['converged'].sum(), nFits)
+print 'largest difference in alpha from the loop: %.2g' %numpy.abs(fits['params'][:,0]-numpy.array(loopParams)[:,0]).max()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Compares ioHub DataStore event_table_settings for a BinocularEyeSampleEvent
+table. For each compression / chunking setting, simulated binocular samples
+are saved and the script reports:
+    * the size of the resulting hdf5 file,
+    * write throughput, in events / sec, including closing the file,
+    * read throughput, in events / sec, when reading the whole table and
+      when reading only the time column.
+
+The ioHub Server is not started; an ioHubpyTablesFile is created in a
+temporary folder and given events directly. Results are printed to stdout.
+"""
+import os, shutil, tempfile
+import numpy
+import tables
+from psychopy.iohub import EventConstants, DeviceEvent, Computer
+from psychopy.iohub.datastore import ioHubpyTablesFile
+from psychopy.iohub.devices.eyetracker import EyeTracker, BinocularEyeSampleEvent
+
+getTime=Computer.getTime
+
+EventConstants.addClassMappings(EyeTracker,[BinocularEyeSampleEvent.EVENT_TYPE_ID],
+                                {'BinocularEyeSampleEvent':BinocularEyeSampleEvent})
+
+SAMPLE_COUNT=1000000
+SAMPLE_RATE=1000.0
+
+SETTINGS=(('no compression',dict(complib='zlib',complevel=0,shuffle=False)),
+          ('zlib 1',dict(complib='zlib',complevel=1,shuffle=True)),
+          ('zlib 5',dict(complib='zlib',complevel=5,shuffle=True)),
+          ('blosc 5',dict(complib='blosc',complevel=5,shuffle=True)),
+          ('blosc 5, 4096 row chunks',dict(complib='blosc',complevel=5,shuffle=True,chunkshape=4096)),
+          ('blosc 9',dict(complib='blosc',complevel=9,shuffle=True)),
+          ('lzo 1',dict(complib='lzo',complevel=1,shuffle=True)),
+          )
+
+def createSamples(count):
+    # gaze data is a noisy random walk, much like real eye samples.
+    template=list(numpy.zeros(1,dtype=BinocularEyeSampleEvent.NUMPY_DTYPE)[0].tolist())
+    gaze=numpy.cumsum(numpy.random.normal(0.0,0.5,(count,4)),axis=0).round(1)
+    pupil=numpy.random.normal(4.0,0.05,(count,2)).round(2)
+    gaze_indexes=[BinocularEyeSampleEvent.CLASS_ATTRIBUTE_NAMES.index(n) for n in
+                  ('left_gaze_x','left_gaze_y','right_gaze_x','right_gaze_y')]
+    pupil_indexes=[BinocularEyeSampleEvent.CLASS_ATTRIBUTE_NAMES.index(n) for n in
+                   ('left_pupil_measure1','right_pupil_measure1')]
+    samples=[]
+    for i in xrange(count):
+        s=list(template)
+        s[DeviceEvent.EVENT_ID_INDEX]=i+1
+        s[DeviceEvent.EVENT_TYPE_ID_INDEX]=BinocularEyeSampleEvent.EVENT_TYPE_ID
+        s[DeviceEvent.EVENT_HUB_TIME_INDEX]=i/SAMPLE_RATE
+        for c,v in zip(gaze_indexes,gaze[i]):
+            s[c]=v
+        for c,v in zip(pupil_indexes,pupil[i]):
+            s[c]=v
+        samples.append(s)
+    return samples
+
+def timeWrite(folder,label,table_settings,samples,block_size=1000):
+    settings=dict(flush_interval=32,write_block_size=1,
+                  event_table_settings=dict(BINOCULAR_EYE_SAMPLE=table_settings))
+    file_name='%s.hdf5'%(label.replace(' ','_').replace(',',''))
+    stime=getTime()
+    datastore=ioHubpyTablesFile(file_name,folder,'w',settings)
+    datastore.updateDataStoreStructure(EyeTracker.__new__(EyeTracker),
+                                       {'BinocularEyeSampleEvent':BinocularEyeSampleEvent})
+    datastore.createOrUpdateExperimentEntry([0,'BENCH','DataStore Benchmark','','1.0',1])
+    datastore.createExperimentSessionEntry(dict(code='S1',name='',comments='',user_variables='{}'))
+    for i in xrange(0,len(samples),block_size):
+        datastore._handleEvents(samples[i:i+block_size])
+    datastore.close()
+    return os.path.join(folder,file_name),len(samples)/(getTime()-stime)
+
+def timeRead(file_path):
+    hdf5_file=tables.openFile(file_path,'r')
+    try:
+        table=hdf5_file.root.data_collection.events.eyetracker.BinocularEyeSampleEvent
+        stime=getTime()
+        table.read()
+        all_columns=table.nrows/(getTime()-stime)
+        stime=getTime()
+        table.col('time')
+        time_column=table.nrows/(getTime()-stime)
+    finally:
+        hdf5_file.close()
+    return all_columns,time_column
+
+if __name__ == '__main__':
+    print 'Creating %d simulated binocular samples...'%(SAMPLE_COUNT)
+    samples=createSamples(SAMPLE_COUNT)
+    folder=tempfile.mkdtemp()
+    try:
+        print
+        print '{0:<26s} {1:>10s} {2:>14s} {3:>14s} {4:>14s}'.format('Setting','Size (MB)','Write (ev/s)','Read (ev/s)','Read time col')
+        for label,table_settings in SETTINGS:
+            if tables.whichLibVersion(table_settings['complib']) is None:
+                print '{0:<26s} {1} is not available.'.format(label,table_settings['complib'])
+                continue
+            file_path,write_rate=timeWrite(folder,label,table_settings,samples)
+            read_rate,time_column_rate=timeRead(file_path)
+            print '{0:<26s} {1:10.1f} {2:14.0f} {3:14.0f} {4:14.0f}'.format(label,os.path.getsize(file_path)/1024.0/1024.0,
+                                                                       write_rate,read_rate,time_column_rate)
+    finally:
+        shutil.rmtree(folder,ignore_errors=True)
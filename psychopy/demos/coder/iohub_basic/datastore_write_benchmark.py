@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Measures how quickly the ioHub DataStore can save BinocularEyeSampleEvents,
+comparing saving each event as it is received (write_block_size: 1) with
+staging events into blocks that are written by the background writer thread
+(write_block_size > 1).
+
+For each setting the script reports:
+    * the time the device polling loop spends handing events to the
+      DataStore for each 1 msec poll, when binocular samples arrive at
+      1000 Hz and 2000 Hz,
+    * the maximum number of events / sec that can be saved, including the
+      time needed to write every staged event to the hdf5 file.
+
+The ioHub Server is not started; an ioHubpyTablesFile is created in a
+temporary folder and given events directly. Results are printed to stdout.
+"""
+import shutil, tempfile, time
+import numpy
+from psychopy.iohub import EventConstants, DeviceEvent, Computer
+from psychopy.iohub.datastore import ioHubpyTablesFile
+from psychopy.iohub.devices.eyetracker import EyeTracker, BinocularEyeSampleEvent
+
+getTime=Computer.getTime
+
+EventConstants.addClassMappings(EyeTracker,[BinocularEyeSampleEvent.EVENT_TYPE_ID],
+                                {'BinocularEyeSampleEvent':BinocularEyeSampleEvent})
+
+def createDataStore(folder,write_block_size):
+    settings=dict(flush_interval=32,write_block_size=write_block_size,write_max_latency=0.25)
+    datastore=ioHubpyTablesFile('bench_%d.hdf5'%(write_block_size),folder,'w',settings)
+    datastore.updateDataStoreStructure(EyeTracker.__new__(EyeTracker),
+                                       {'BinocularEyeSampleEvent':BinocularEyeSampleEvent})
+    datastore.createOrUpdateExperimentEntry([0,'BENCH','DataStore Benchmark','','1.0',1])
+    datastore.createExperimentSessionEntry(dict(code='S%d'%(write_block_size),name='',
+                                                comments='',user_variables='{}'))
+    return datastore
+
+def createSample(event_id,hub_time):
+    sample=list(numpy.zeros(1,dtype=BinocularEyeSampleEvent.NUMPY_DTYPE)[0].tolist())
+    sample[DeviceEvent.EVENT_ID_INDEX]=event_id
+    sample[DeviceEvent.EVENT_TYPE_ID_INDEX]=BinocularEyeSampleEvent.EVENT_TYPE_ID
+    sample[DeviceEvent.EVENT_HUB_TIME_INDEX]=hub_time
+    return sample
+
+def timePolls(datastore,sample_rate,duration=5.0):
+    # each iteration stands in for one 1 msec device poll.
+    samples_per_poll=sample_rate//1000
+    durations=[]
+    event_id=0
+    end_time=getTime()+duration
+    while getTime()<end_time:
+        stime=getTime()
+        for s in xrange(samples_per_poll):
+            event_id+=1
+            datastore._handleEvent(createSample(event_id,stime))
+        durations.append(getTime()-stime)
+        time.sleep(0.001)
+    return numpy.asarray(durations)*1000.0
+
+def timeThroughput(datastore,event_count=200000):
+    samples=[createSample(i,i*0.0005) for i in xrange(event_count)]
+    stime=getTime()
+    for s in samples:
+        datastore._handleEvent(s)
+    datastore.flush()
+    return event_count/(getTime()-stime)
+
+def printStats(label,values):
+    print '\t{0:<26s} mean {1:8.4f}  median {2:8.4f}  99% {3:8.4f}  max {4:8.4f}'.format(label,
+                values.mean(),numpy.median(values),numpy.percentile(values,99),values.max())
+
+if __name__ == '__main__':
+    folder=tempfile.mkdtemp()
+    try:
+        for write_block_size in (1,128,1024):
+            datastore=createDataStore(folder,write_block_size)
+            print
+            print '** write_block_size: %d'%(write_block_size)
+            for sample_rate in (1000,2000):
+                printStats('%d Hz, msec per poll'%(sample_rate),timePolls(datastore,sample_rate))
+            print '\tmax. throughput: %.0f events / sec'%(timeThroughput(datastore))
+            datastore.close()
+    finally:
+        shutil.rmtree(folder,ignore_errors=True)
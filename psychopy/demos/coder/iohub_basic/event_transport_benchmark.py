@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the time taken by ioHubConnection.getEvents() when events are sent
+from the ioHub Process using UDP (the default) and when they are read from the
+shared memory ring buffers (shared_memory_events: enable: True).
+
+For each transport the script reports:
+    * the duration of a getEvents() call when there are no new events,
+    * the duration of a getEvents() call returning bursts of MessageEvents,
+      and the resulting events / msec throughput,
+    * the delay between a MessageEvent being created and getEvents()
+      returning it, when getEvents() is called in a tight loop.
+
+No PsychoPy Window is created for this demo; results are printed to stdout.
+"""
+import time
+import numpy
+from psychopy.iohub import ioHubConnection, Computer
+
+getTime=Computer.getTime
+
+def getHubConfig(shared_memory):
+    return dict(monitor_devices=[dict(Display={'override_using_psycho_settings':False}),
+                                 dict(Experiment={}),
+                                 dict(Keyboard={})],
+                shared_memory_events=dict(enable=shared_memory,ring_length=4096))
+
+def timeEmptyGetEvents(io,count=1000):
+    io.clearEvents()
+    durations=[]
+    for i in xrange(count):
+        stime=getTime()
+        io.getEvents()
+        durations.append(getTime()-stime)
+    return numpy.asarray(durations)*1000.0
+
+def timeEventBursts(io,burst_size,repeats=20):
+    durations=[]
+    counts=[]
+    for r in xrange(repeats):
+        io.clearEvents()
+        for i in xrange(burst_size):
+            io.sendMessageEvent('burst message %d'%(i),'BENCH')
+        # give the ioHub Process time to move the events into the
+        # event buffer being read by getEvents().
+        time.sleep(0.05)
+        stime=getTime()
+        events=io.getEvents()
+        durations.append(getTime()-stime)
+        counts.append(len(events))
+    return numpy.asarray(durations)*1000.0,numpy.asarray(counts)
+
+def timeDeliveryDelay(io,count=200):
+    delays=[]
+    io.clearEvents()
+    for i in xrange(count):
+        io.sendMessageEvent('delay message %d'%(i),'BENCH')
+        found=False
+        while not found:
+            for e in io.getEvents():
+                if e.text=='delay message %d'%(i):
+                    delays.append(getTime()-e.time)
+                    found=True
+    return numpy.asarray(delays)*1000.0
+
+def printStats(label,values):
+    print '\t{0:<42s} mean {1:8.3f}  median {2:8.3f}  95% {3:8.3f}  max {4:8.3f}'.format(label,
+                values.mean(),numpy.median(values),numpy.percentile(values,95),values.max())
+
+if __name__ == '__main__':
+    results={}
+    for transport,shared_memory in (('UDP',False),('Shared Memory',True)):
+        io=ioHubConnection(getHubConfig(shared_memory))
+        if shared_memory and io._shared_event_reader is None:
+            print 'Shared memory event buffers could not be created; skipping.'
+            io.quit()
+            continue
+        print
+        print '** getEvents() using %s (times in msec):'%(transport)
+        printStats('no new events',timeEmptyGetEvents(io))
+        for burst_size in (10,100,1000):
+            durations,counts=timeEventBursts(io,burst_size)
+            printStats('%d event bursts'%(burst_size),durations)
+            print '\t\t%.1f events / msec (%d of %d events received)'%(counts.sum()/durations.sum(),
+                                                                    counts.sum(),burst_size*len(counts))
+        printStats('event delivery delay',timeDeliveryDelay(io))
+        io.quit()
+        time.sleep(1.0)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Compares the per frame cost of sending MessageEvents with
+ioHubConnection.sendMessageEvent() when each message waits for a reply from
+the ioHub Process (the default) and when messages are queued and sent
+together once per frame (async_message_events: enable: True).
+
+For 1, 5 and 10 messages per frame, the time spent in the sendMessageEvent()
+calls plus flushMessages() is measured for each 'frame'. No PsychoPy Window
+is created, so each frame is simulated by a short sleep; results are printed
+to stdout. At the end, the MessageEvents are read back to check that none
+were lost.
+"""
+import time
+import numpy
+from psychopy.iohub import ioHubConnection, Computer, EventConstants
+
+getTime=Computer.getTime
+
+def getHubConfig(async_messages):
+    return dict(monitor_devices=[dict(Display={'override_using_psycho_settings':False}),
+                                 dict(Experiment={})],
+                async_message_events=dict(enable=async_messages,max_backlog=256))
+
+def timeFrames(io,msgs_per_frame,frame_count=300):
+    durations=[]
+    for f in xrange(frame_count):
+        stime=getTime()
+        for m in xrange(msgs_per_frame):
+            io.sendMessageEvent('frame %d message %d'%(f,m),'BENCH')
+        io.flushMessages()
+        durations.append(getTime()-stime)
+        # stand in for the rest of the frame.
+        time.sleep(0.002)
+    return numpy.asarray(durations)*1000.0
+
+def countMessages(io):
+    time.sleep(0.25)
+    return len(io.devices.experiment.getEvents(EventConstants.MESSAGE))
+
+def printStats(label,values):
+    print '\t{0:<26s} mean {1:8.3f}  median {2:8.3f}  95% {3:8.3f}  max {4:8.3f}'.format(label,
+                values.mean(),numpy.median(values),numpy.percentile(values,95),values.max())
+
+if __name__ == '__main__':
+    for mode,async_messages in (('one request per message',False),('batched per frame',True)):
+        io=ioHubConnection(getHubConfig(async_messages))
+        print
+        print '** sendMessageEvent(), %s (msec per frame):'%(mode)
+        for msgs_per_frame in (1,5,10):
+            io.devices.experiment.getEvents()
+            durations=timeFrames(io,msgs_per_frame)
+            printStats('%d messages / frame'%(msgs_per_frame),durations)
+            print '\t\t%d of %d messages received'%(countMessages(io),msgs_per_frame*len(durations))
+        io.quit()
+        time.sleep(1.0)
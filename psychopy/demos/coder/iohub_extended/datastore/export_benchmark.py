@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Times ExperimentDataAccessUtility.exportColumnar() on an ioHub DataStore
+HDF5 file and reports the peak memory used, for several chunk sizes. Each
+export runs in its own process, so the peak memory reported is for that
+export only.
+
+Usage:
+    python export_benchmark.py [hdf5_file [trial_start_variable trial_end_variable]]
+
+If no file is given, a file selection dialog is shown. If the names of the
+condition variables holding trial start and end times are given, events are
+joined to their condition variable rows. Use a multi-GB session file to see
+that peak memory depends on the chunk size, not the file size.
+
+After each export, the time column of the largest event table is summed
+using loadColumnarExport() to show the export can be used without PyTables.
+"""
+import sys, os, shutil, tempfile
+import multiprocessing
+import psychopy.iohub
+if psychopy.iohub._DATA_STORE_AVAILABLE is False:
+    raise ImportError("DataStore module could not be imported. (Likely that pyTables hdf5dll could not be found). Exiting demo...")
+
+from psychopy.core import getTime
+from psychopy.iohub.datastore.util import displayDataFileSelectionDialog, ExperimentDataAccessUtility, loadColumnarExport
+
+def getPeakMemoryMB():
+    try:
+        import resource
+        peak=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            return peak/1024.0/1024.0
+        return peak/1024.0
+    except ImportError:
+        import psutil
+        return psutil.Process(os.getpid()).memory_info().peak_wset/1024.0/1024.0
+
+def runExport(data_file_path,export_dir,chunk_size,trial_variables,results):
+    dpath,dfile=os.path.split(data_file_path)
+    start_time=getTime()
+    dataAccessUtil=ExperimentDataAccessUtility(dpath,dfile,experimentCode=None,sessionCodes=[])
+    manifest=dataAccessUtil.exportColumnar(export_dir,chunk_size,*trial_variables)
+    dataAccessUtil.close()
+    results.put((getTime()-start_time,getPeakMemoryMB(),manifest))
+
+def exportSizeMB(export_dir):
+    total=0
+    for root,dirs,files in os.walk(export_dir):
+        total+=sum(os.path.getsize(os.path.join(root,f)) for f in files)
+    return total/1024.0/1024.0
+
+if __name__ == '__main__':
+    if len(sys.argv)>1:
+        data_file_path=sys.argv[1]
+    else:
+        data_file_path=displayDataFileSelectionDialog(psychopy.iohub.module_directory(runExport))
+    if data_file_path is None:
+        print "File Selection Cancelled, exiting..."
+        sys.exit(0)
+    trial_variables=tuple(sys.argv[2:4])
+
+    print 'DataStore file: %s (%.1f MB)'%(data_file_path,os.path.getsize(data_file_path)/1024.0/1024.0)
+    print
+    print '{0:>10s} {1:>12s} {2:>14s} {3:>16s} {4:>14s}'.format('Chunk','Export (s)','Rows / sec','Peak memory (MB)','Export (MB)')
+    for chunk_size in (8192,65536,524288):
+        export_dir=tempfile.mkdtemp()
+        try:
+            results=multiprocessing.Queue()
+            p=multiprocessing.Process(target=runExport,args=(data_file_path,export_dir,chunk_size,trial_variables,results))
+            p.start()
+            duration,peak_memory,manifest=results.get()
+            p.join()
+
+            total_rows=sum(t['rows'] for t in manifest['tables'].itervalues())
+            print '{0:>10d} {1:12.2f} {2:14.0f} {3:16.1f} {4:14.1f}'.format(chunk_size,duration,total_rows/duration,
+                                                                       peak_memory,exportSizeMB(export_dir))
+
+            event_tables=[(t['rows'],k) for k,t in manifest['tables'].iteritems() if k.startswith('events/')]
+            if event_tables:
+                rows,table_key=max(event_tables)
+                start_time=getTime()
+                exported=loadColumnarExport(export_dir)
+                if rows:
+                    exported[table_key]['time'].sum(dtype='f8')
+                print '\t\tloaded %s and summed %d times in %.3f sec.'%(table_key,rows,getTime()-start_time)
+                del exported
+        finally:
+            shutil.rmtree(export_dir,ignore_errors=True)
@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+"""
+Times the per-frame update of dot positions in a large DotStim for each
+combination of noiseDots and signalDots.
+
+For each condition the dots are updated for 300 frames (without drawing) and
+the time taken by the update is printed in msec. Press any key to stop early.
+"""
+from psychopy import visual, core, event
+import numpy
+
+nDots = 50000
+win = visual.Window([800, 800], units='norm', allowGUI=False, waitBlanking=False)
+
+for noiseDots in ['direction', 'position', 'walk']:
+    for signalDots in ['same', 'different']:
+        dots = visual.DotStim(win, nDots=nDots, fieldShape='circle', fieldSize=1.5,
+            dotLife=5, noiseDots=noiseDots, signalDots=signalDots,
+            speed=0.01, coherence=0.5, dotSize=1, autoLog=False)
+        durations = []
+        for frameN in range(300):
+            t0 = core.getTime()
+            dots._update_dotsXY()
+            durations.append(core.getTime() - t0)
+            if event.getKeys():
+                core.quit()
+        durations = numpy.array(durations)*1000.0
+        print '%-10s %-10s mean %6.2f  median %6.2f  max %6.2f ms' % (noiseDots,
+            signalDots, durations.mean(), numpy.median(durations), durations.max())
+
+win.close()
+core.quit()
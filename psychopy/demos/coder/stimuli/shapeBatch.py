@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""
+Compares the time taken to draw a visual search style array of N small
+shapes with ShapeStim.draw() for each shape and with a single
+ShapeBatch.draw().
+
+For each N the shapes are drawn for 120 frames each way, with one shape
+changing colour and position on every frame. The time from the start of the
+draw calls until OpenGL has finished drawing (glFinish) is printed in msec.
+Press any key to stop early.
+"""
+from psychopy import visual, core, event
+from psychopy.visual.shape import GL
+import numpy
+
+win = visual.Window([800, 800], units='norm', allowGUI=False, waitBlanking=False)
+colors = ['red', 'green', 'blue', 'yellow']
+
+def makeShapes(nShapes):
+    shapes = []
+    for n in range(nShapes):
+        pos = numpy.random.uniform(-0.95, 0.95, 2)
+        if n % 2:
+            shape = visual.Rect(win, width=0.03, height=0.03, pos=pos,
+                ori=numpy.random.uniform(0, 90), autoLog=False)
+        else:
+            shape = visual.Circle(win, radius=0.015, edges=16, pos=pos, autoLog=False)
+        shape.setFillColor(colors[n % len(colors)], log=False)
+        shape.setLineColor('white', log=False)
+        shapes.append(shape)
+    return shapes
+
+def timeFrames(shapes, drawFrame, nFrames=120):
+    durations = []
+    for frameN in range(nFrames):
+        changing = shapes[frameN % len(shapes)]
+        changing.setFillColor(colors[frameN % len(colors)], log=False)
+        changing.setPos(numpy.random.uniform(-0.95, 0.95, 2), log=False)
+        t0 = core.getTime()
+        drawFrame()
+        GL.glFinish()
+        durations.append(core.getTime() - t0)
+        win.flip()
+        if event.getKeys():
+            core.quit()
+    return numpy.array(durations)*1000.0
+
+for nShapes in [100, 500, 1000, 2000]:
+    shapes = makeShapes(nShapes)
+    batch = visual.ShapeBatch(win, shapes, autoLog=False)
+    def drawEach():
+        for shape in shapes:
+            shape.draw()
+    for label, drawFrame in [('ShapeStim.draw() x %i' % nShapes, drawEach),
+                             ('ShapeBatch.draw()', batch.draw)]:
+        durations = timeFrames(shapes, drawFrame)
+        print '%-24s mean %7.2f  median %7.2f  max %7.2f ms' % (label,
+            durations.mean(), numpy.median(durations), durations.max())
+
+win.close()
+core.quit()
@@ -18,6 +18,8 @@ from collections import deque
 import json
 import signal
 from weakref import proxy
+from operator import itemgetter
+import numpy as N
 
 from psychopy import  core as core, gui
 import psychopy.logging as psycho_logging
@@ -33,6 +35,7 @@ from .devices import Computer, DeviceEvent,import_device
 from .devices.experiment import MessageEvent,LogEvent
 from .constants import DeviceConstants,EventConstants
 from .net import UDPClientConnection
+from .shmem import SharedEventBufferReader, getEventTransportDtype
 from . import _DATA_STORE_AVAILABLE
 
 currentSec= Computer.currentSec
@@ -323,6 +326,12 @@ class ioHubConnection(object):
     """
     ACTIVE_CONNECTION=None
     _replyDictionary=dict()
+    # max. size in bytes of one EVENT_TX_NR datagram of queued MessageEvents.
+    # The ioHub Server reads each request with recvfrom(8192), so anything
+    # longer would be truncated.
+    _MAX_MESSAGE_PACKET_SIZE=8000
+    # event type id -> numpy dtype used for getEvents(as_type='ndarray').
+    _eventArrayDtypes=dict()
     def __init__(self,ioHubConfig=None,ioHubConfigAbsPath=None):        
         if ioHubConfig:
             if not isinstance(ioHubConfig,dict):
@@ -363,6 +372,16 @@ class ioHubConnection(object):
         self._sessionMetaData=None
         self._iohub_server_config=None
         
+        # reads events from the ioHub Process shared memory ring buffers
+        # when shared_memory_events is enabled, otherwise None.
+        self._shared_event_reader=None
+
+        # MessageEvents queued by sendMessageEvent() when
+        # async_message_events is enabled; see flushMessages().
+        self._async_messages=False
+        self._message_backlog=[]
+        self._max_message_backlog=256
+
         self._shutdown_attempted=False
         self._startServer(ioHubConfig, ioHubConfigAbsPath)
 
@@ -472,6 +491,7 @@ class ioHubConnection(object):
 		* 'astuple': Each event is converted to a namedtuple object. Event attributes are accessed using natural naming style (dot name style), or by the index of the event attribute for the event type. The namedtuple class definition is created once for each Event type at the start of the experiment, so memory overhead is almost the same as the event value list, and conversion from the event list to the namedtuple is very fast. This is the default, and normally most useful, event representation type.
 		* 'dict': Each event converted to a dict object, keys equaling the event attribute names, values being, well the attribute values for the event.
 		* 'object': Each event is converted into an instance of the ioHub DeviceEvent subclass based on the event's type. This conversion process can take a bit of time if the number of events returned is large, and currently there is no real benefit converting events into DeviceEvent Class instances vs. the default namedtuple object type. Therefore this option should be used rarely.
+		* 'ndarray': Events are grouped by event type, and a dict of event type id : numpy structured array is returned, with one row per event, ordered by event time. The array dtype has the fields of the event class NUMPY_DTYPE, but with float64 time fields. No Python object is created per event, so this is the most efficient type when many events (for example eye tracker samples) are received.
                 
         Args:
             device_label (str): Indicates what device to retrieve events for. If None ( the default ) returns device events from all devices.            
@@ -479,9 +499,12 @@ class ioHubConnection(object):
 			as_type (str): Indicates how events should be represented when they are returned to the user. Default: 'namedtuple'.
 
         Returns:
-            tuple: A tuple of event objects, where the event object type is defined by the 'as_type' parameter.
+            tuple: A tuple of event objects, where the event object type is defined by the 'as_type' parameter. If as_type is 'ndarray', a dict of event type id : numpy structured array.
         """
 
+        if as_type == 'ndarray':
+            return self._getEventArrays(device_label)
+
         r=None
         if device_label is None:
             events=self._getEvents()
@@ -540,6 +563,8 @@ class ioHubConnection(object):
         """
         if device_label is None or device_label.lower() == 'all':
             self._sendToHubServer(('RPC','clearEventBuffer'))
+            if self._shared_event_reader:
+                self._shared_event_reader.clear()
             self.allEvents=[]
             if device_label and device_label.lower() == 'all':
                 [self.deviceByLabel[label].clearEvents() for label in self.deviceByLabel]
@@ -629,11 +654,68 @@ class ioHubConnection(object):
                           
             sec_time (float): The time stamp to use for the message in sec.msec format. If not provided, or None, then the MessageEvent is time stamped when this method is called using the global timer.                             
 
+        If async_message_events is enabled in the ioHub configuration, the
+        MessageEvent is time stamped when this method is called but is queued
+        instead of being sent right away; see flushMessages().
+
         Returns:
             bool: True
         """
-        self._sendToHubServer(('EXP_DEVICE','EVENT_TX',[MessageEvent._createAsList(text,category=category,msg_offset=offset,sec_time=sec_time),]))
+        msg=MessageEvent._createAsList(text,category=category,msg_offset=offset,sec_time=sec_time)
+        if self._async_messages:
+            self._message_backlog.append(msg)
+            if len(self._message_backlog)>=self._max_message_backlog:
+                self.flushMessages()
+            return True
+        self._sendToHubServer(('EXP_DEVICE','EVENT_TX',[msg,]))
         return True
+
+    def flushMessages(self):
+        """
+        Send any MessageEvents queued by sendMessageEvent() to the ioHub Process.
+        Only needed when async_message_events is enabled in the ioHub
+        configuration; otherwise there is never anything queued.
+
+        The queued messages are sent together, in as few requests as fit in
+        the ioHub Process's datagram size, and the ioHub Process does not reply
+        to them, so flushMessages() does not wait on the ioHub Process. The queue is also flushed before any other request is
+        sent to the ioHub Process (so messages are always received before,
+        for example, a getEvents() request made after them), and when it holds
+        max_backlog messages.
+
+        A convenient way to send the messages created during each frame is::
+
+            win.callOnFlip(io.flushMessages)
+            win.flip()
+
+        Args:
+            None
+
+        Returns:
+            int: The number of MessageEvents sent.
+        """
+        backlog=self._message_backlog
+        if not backlog:
+            return 0
+        self._message_backlog=[]
+        # pack the messages one at a time, starting a new datagram before
+        # the current one gets too long for the ioHub Server to read.
+        udp_client=self.udp_client
+        pack=udp_client.pack
+        request_header=udp_client.packArrayHeader(3)+pack('EXP_DEVICE')+pack('EVENT_TX_NR')
+        max_size=self._MAX_MESSAGE_PACKET_SIZE-len(request_header)-5
+        packet=[]
+        packet_size=0
+        for msg in backlog:
+            packed_msg=pack(msg)
+            if packet and packet_size+len(packed_msg)>max_size:
+                udp_client.sendPackedTo(request_header+udp_client.packArrayHeader(len(packet))+''.join(packet))
+                packet=[]
+                packet_size=0
+            packet.append(packed_msg)
+            packet_size+=len(packed_msg)
+        udp_client.sendPackedTo(request_header+udp_client.packArrayHeader(len(packet))+''.join(packet))
+        return len(backlog)
                 
     def initializeConditionVariableTable(self, condition_variable_provider):
         """
@@ -861,7 +943,45 @@ class ioHubConnection(object):
         r=self._sendToHubServer(('RPC','flushIODataStoreFile'))
         print "flushIODataStoreFile: ",r[2]
         return r[2]
-        
+
+    def getDevicePollingStats(self):
+        """
+        Returns the polling statistics of each device polled by the ioHub
+        Process. Device poll intervals adapt to the device's event rate, between
+        the device_timer min_interval and max_interval settings of the device.
+
+        Args:
+            None
+
+        Returns:
+            dict: device name -> dict with the device's poll_count, event_count, empty_poll_count, empty_poll_ratio, current poll_interval, min_interval, max_interval, buffer_high_water (the most events seen in the device's native event buffer) and buffer_length (the device's event_buffer_length).
+        """
+        r=self._sendToHubServer(('RPC','getDevicePollingStats'))
+        return r[2]
+
+    def getServerStats(self,reset=False):
+        """
+        Returns performance statistics of the ioHub Process. Latency and loop
+        time histograms have bin_edges and counts lists, plus the count, mean,
+        min and max of the times added; all times are in msec.
+
+        Args:
+            reset (bool): If True, the histograms are cleared after being read, so the next call returns stats for the period between the two calls. Overflow counts are never reset.
+
+        Returns:
+            dict: with keys
+                * device_latency: time from the hub time of each event to the ioHub Process receiving it (the event's logged time).
+                * delivery_latency: time from the ioHub Process receiving each event to it being sent to the PsychoPy Process in a GET_EVENTS reply, or written to the shared memory event buffers (not when the PsychoPy Process reads it from them).
+                * iteration_duration: time taken by each ioHub device event processing loop iteration that handled events.
+                * buffer_overflows: number of events dropped because the global_event_buffer, or a device's native_event_buffer, was full.
+                * buffer_lengths: number of events currently in the global_event_buffer and in each device's native_event_buffer.
+                * datastore: ioDataStore written_event_count, write_duration, write_rate (events / sec), staged_event_count, queued_block_count and write_block_size; None if the ioDataStore is not enabled.
+                * device_polling: same as getDevicePollingStats().
+                * time and period: the ioHub time the stats were collected and the sec.msec since the histograms were last reset.
+        """
+        r=self._sendToHubServer(('GET_STATS',reset))
+        return r[1]
+
     def shutdown(self):
         """
         Tells the ioHub Process to close all ioHub Devices, the ioDataStore, 
@@ -1062,6 +1182,27 @@ class ioHubConnection(object):
         except Exception as e:
             print "Errror in _createDeviceList: ",str(e)  
         #print 'Created Experiment Process Device List'
+
+        # attach to the shared memory event ring buffers, if the ioHub
+        # Process created them.
+        if ioHubConfig.get('shared_memory_events',{}).get('enable',False):
+            try:
+                r=self._sendToHubServer(('RPC','getSharedEventBufferPath'))
+                if r[2]:
+                    self._shared_event_reader=SharedEventBufferReader(r[2],EventConstants.getClass)
+            except Exception:
+                print2err("Error attaching to shared memory event buffers, using UDP for events.")
+                printExceptionDetailsToStdErr()
+                self._shared_event_reader=None
+                # the ioHub Process must then stop writing to them
+                try:
+                    self._sendToHubServer(('RPC','disableSharedEventBuffer'))
+                except Exception:
+                    printExceptionDetailsToStdErr()
+
+        async_messages=ioHubConfig.get('async_message_events',{})
+        self._async_messages=async_messages.get('enable',False)
+        self._max_message_backlog=max(1,async_messages.get('max_backlog',256))
                     
     def _get_maxsize(self, maxsize):
         """
@@ -1145,15 +1286,7 @@ class ioHubConnection(object):
             #ioHub.print2err('device_module_path: ',device_module_path)
             #ioHub.print2err('device_class_name: ',device_class_name)
             
-            device_class,device_class_name,event_classes=import_device(device_module_path,device_class_name)
-    
-            DeviceConstants.addClassMapping(device_class)
-            
-            device_event_ids=[]
-            for ev in event_classes.values():
-                if ev.EVENT_TYPE_ID:
-                    device_event_ids.append(ev.EVENT_TYPE_ID)
-            EventConstants.addClassMappings(device_class,device_event_ids,event_classes)
+            device_class_name=_addDeviceClassMappings(device_module_path,device_class_name)
     
             name_start=name.rfind('.')
             if name_start>0:
@@ -1200,6 +1333,11 @@ class ioHubConnection(object):
         Return (object): the message response from the ioHub Server process.
         """
 
+        # send any queued MessageEvents first, so the ioHub Server handles
+        # requests in the order they were made.
+        if self._message_backlog:
+            self.flushMessages()
+
         # send request to host, return is # bytes sent.
         bytes_sent=self.udp_client.sendTo(ioHubMessage)
 
@@ -1291,15 +1429,98 @@ class ioHubConnection(object):
         Sends a request to the ioHub Server for any new device events from the global server event buffer.
         The events are returned and the global ioHub server event buffer is cleared.
 
+        If shared_memory_events is enabled, the events are read from the
+        shared memory ring buffers instead, and a GET_EVENTS request is only
+        sent if the ioHub Server has events that could not be put in them.
+
         Args: None
         Return(tuple): list of events, or empty list if no events have occurred since last call
               to getEvents() or clearEvents(). Each event in the list is a tuple containing the ordered
               attributes of the event constructor.
         """
+        if self._shared_event_reader:
+            # no request may be sent, so send any queued messages now.
+            self.flushMessages()
+            events=self._shared_event_reader.getEvents()
+            if self._shared_event_reader.getUDPEventCount()>0:
+                r = self._sendToHubServer(('GET_EVENTS',))
+                if r[1]:
+                    events.extend(r[1])
+                    events.sort(key=itemgetter(DeviceEvent.EVENT_HUB_TIME_INDEX))
+            return events
         r = self._sendToHubServer(('GET_EVENTS',))
         return r[1]
 
 
+    def _getEventArrays(self,device_label=None):
+        """
+        getEvents() for as_type='ndarray'. Events read from the shared memory
+        ring buffers are already numpy record arrays, so only events received
+        over UDP (or buffered by wait()) need to be converted.
+        """
+        if device_label is not None:
+            return self._eventListsToArrays(self.deviceByLabel[device_label].getEvents(asType='list'))
+
+        arrays=self._eventListsToArrays(self.allEvents)
+        self.allEvents=[]
+        if self._shared_event_reader:
+            self.flushMessages()
+            self._mergeEventArrays(arrays,self._shared_event_reader.getEvents(as_array=True))
+            if self._shared_event_reader.getUDPEventCount()==0:
+                return arrays
+        r = self._sendToHubServer(('GET_EVENTS',))
+        if r[1]:
+            self._mergeEventArrays(arrays,self._eventListsToArrays(r[1]))
+        return arrays
+
+    @classmethod
+    def _getEventArrayDtype(cls,event_type_id):
+        dtype=cls._eventArrayDtypes.get(event_type_id)
+        if dtype is None:
+            eclass=EventConstants.getClass(event_type_id)
+            dtype=cls._eventArrayDtypes[event_type_id]=getEventTransportDtype(eclass.NUMPY_DTYPE)
+        return dtype
+
+    @classmethod
+    def _eventListsToArrays(cls,eventValueLists):
+        """
+        Group ioHub events, each represented as an ordered list of values, by
+        event type and return a dict of event type id : numpy structured array.
+        The event lists are only iterated over once; each event type is then
+        converted to an array in a single numpy call.
+        """
+        type_index=DeviceEvent.EVENT_TYPE_ID_INDEX
+        grouped=dict()
+        for e in eventValueLists or ():
+            rows=grouped.get(e[type_index])
+            if rows is None:
+                rows=grouped[e[type_index]]=[]
+            rows.append(tuple(e))
+        arrays=dict()
+        for event_type_id,rows in grouped.iteritems():
+            try:
+                arrays[event_type_id]=N.array(rows,dtype=cls._getEventArrayDtype(event_type_id))
+            except:
+                printExceptionDetailsToStdErr()
+                raise ioHubError("Error converting ioHub events to a numpy array",event_type=event_type_id)
+        return arrays
+
+    @staticmethod
+    def _mergeEventArrays(arrays,new_arrays):
+        """
+        Add the event arrays in new_arrays to arrays (both dicts of event type id
+        : numpy structured array), keeping the events of each type ordered by
+        ioHub time.
+        """
+        for event_type_id,events in new_arrays.iteritems():
+            current=arrays.get(event_type_id)
+            if current is None or len(current)==0:
+                arrays[event_type_id]=events
+            elif len(events):
+                merged=N.concatenate((current,events))
+                time_field=merged.dtype.names[DeviceEvent.EVENT_HUB_TIME_INDEX]
+                arrays[event_type_id]=merged[N.argsort(merged[time_field],kind='mergesort')]
+
     @staticmethod
     def _eventListToObject(eventValueList):
         """
@@ -1354,6 +1575,11 @@ class ioHubConnection(object):
                 TimeoutError=psutil.TimeoutExpired
                 
             try:
+                if self._message_backlog:
+                    self.flushMessages()
+                if self._shared_event_reader:
+                    self._shared_event_reader.close()
+                    self._shared_event_reader=None
                 self.udp_client.sendTo(('STOP_IOHUB_SERVER',))
                 self.udp_client.close()
                 if Computer.ioHubServerProcess:
@@ -1417,6 +1643,141 @@ class ioHubConnection(object):
             pass
 
 
+class ioHubEventClient(object):
+    """
+    Reads events from an ioHub Process that was started by another process,
+    normally an experiment using an ioHubConnection. This lets tools such as
+    an online monitoring display, or a recording quality dashboard, get the
+    device events without taking them from the experiment process, and
+    without creating a second set of devices.
+
+    The client registers with the ioHub Process when created. From then on
+    the ioHub Process keeps every event the client has not read yet, in a log
+    shared by all registered clients. Each client has its own read position
+    and event type filter. The iohub config event_clients settings limit the
+    size of the log (log_length), and choose what happens to a client that
+    falls further behind than that (drop_policy):
+        * 'drop_oldest': the client loses the oldest events; see getLostEventCount().
+        * 'unregister': the client is unregistered, and getEvents() raises an ioHubServerError.
+
+    Args:
+        udp_port (int): The udp_port of the ioHub Process. Default: 9034.
+
+        event_types (list): Event type ids (see EventConstants) to receive. If None (the default), all events are received.
+
+        remote_host (str): The address of the computer running the ioHub Process. Default: '127.0.0.1'.
+
+        timeout (float): Sec.msec to wait for each reply from the ioHub Process. Default: 5.0.
+    """
+    def __init__(self,udp_port=9034,event_types=None,remote_host='127.0.0.1',timeout=5.0):
+        self.udp_client=UDPClientConnection(remote_host=remote_host,remote_port=udp_port)
+        self.udp_client.sock.settimeout(timeout)
+        self.event_types=event_types
+        self._registered=False
+        self._lost_event_count=0
+        r=self._sendToHubServer(('REGISTER_EVENT_CLIENT',event_types))
+        self._registered=True
+        for name,device_module_path,device_class_name in r[1]:
+            try:
+                _addDeviceClassMappings(device_module_path,device_class_name)
+            except:
+                print2err("ioHubEventClient: Error adding device class %s."%(device_class_name))
+                printExceptionDetailsToStdErr()
+
+    def getEvents(self,as_type='namedtuple'):
+        """
+        Retrieve the events the ioHub Process has received since the last
+        getEvents() call (or since the client was created), that are of one of
+        the client's event_types.
+
+        Args:
+            as_type (str): 'namedtuple' (the default), 'dict', 'object', 'list' or 'ndarray'; see ioHubConnection.getEvents().
+
+        Returns:
+            list: The events, oldest first. If as_type is 'ndarray', a dict of event type id : numpy structured array.
+        """
+        events=self._getEvents()
+        if as_type == 'ndarray':
+            return ioHubConnection._eventListsToArrays(events)
+        if as_type == 'list':
+            return events
+
+        conversionMethod=None
+        if as_type =='namedtuple':
+            conversionMethod=ioHubConnection._eventListToNamedTuple
+        elif as_type == 'dict':
+            conversionMethod=ioHubConnection._eventListToDict
+        elif as_type == 'object':
+            conversionMethod=ioHubConnection._eventListToObject
+        if conversionMethod:
+            return [conversionMethod(el) for el in events]
+        return events
+
+    def clearEvents(self):
+        """
+        Discard the events the client has not read yet.
+        """
+        self._getEvents()
+
+    def getLostEventCount(self):
+        """
+        Returns the number of events, of the client's event_types, that were
+        dropped by the ioHub Process before this client read them, as of the
+        last getEvents() or clearEvents() call.
+        """
+        return self._lost_event_count
+
+    def _getEvents(self):
+        r=self._sendToHubServer(('GET_EVENTS',))
+        if len(r)>2:
+            self._lost_event_count=r[2]
+        return r[1] or []
+
+    def close(self):
+        """
+        Unregister the client from the ioHub Process, so events are no longer
+        kept for it, and close the connection.
+        """
+        if self.udp_client is None:
+            return
+        try:
+            if self._registered:
+                self._registered=False
+                self._sendToHubServer(('UNREGISTER_EVENT_CLIENT',))
+        finally:
+            self.udp_client.close()
+            self.udp_client=None
+
+    def _sendToHubServer(self,ioHubMessage):
+        self.udp_client.sendTo(ioHubMessage)
+        result,address=self.udp_client.receive()
+        if isIterable(result) and len(result)>0 and isinstance(result[0],basestring) and result[0].find('ERROR')>=0:
+            raise ioHubServerError(result)
+        return result
+
+    def __del__(self):
+        try:
+            self.close()
+        except:
+            pass
+
+def _addDeviceClassMappings(device_module_path,device_class_name):
+    """
+    Import the device class and its event classes, and add them to the
+    DeviceConstants and EventConstants class mappings so events of the device
+    can be converted. Returns the device class name.
+    """
+    device_class,device_class_name,event_classes=import_device(device_module_path,device_class_name)
+
+    DeviceConstants.addClassMapping(device_class)
+
+    device_event_ids=[]
+    for ev in event_classes.values():
+        if ev.EVENT_TYPE_ID:
+            device_event_ids.append(ev.EVENT_TYPE_ID)
+    EventConstants.addClassMappings(device_class,device_event_ids,event_classes)
+    return device_class_name
+
 #quickConnect
 print "#####\nTODO: Test launchHubServer with diff arg inputs and new iohub_config_name kwarg.\n#####\n"
 def launchHubServer(**kwargs):
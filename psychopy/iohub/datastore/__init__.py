@@ -12,6 +12,7 @@ Distributed under the terms of the GNU General Public License (GPL version 3 or
 
 """
 import os, atexit
+import threading, Queue
 
 import tables
 from tables import *
@@ -19,7 +20,9 @@ from tables import parameters
 
 import numpy as N
 
-from psychopy.iohub import printExceptionDetailsToStdErr, print2err, ioHubError, DeviceEvent, EventConstants
+from psychopy.iohub import printExceptionDetailsToStdErr, print2err, ioHubError, DeviceEvent, EventConstants, Computer
+
+getTime=Computer.getTime
 
 
 parameters.MAX_NUMEXPR_THREADS=None
@@ -43,7 +46,111 @@ FILE_VERSION = '0.7.0'
 SCHEMA_AUTHORS='Sol Simpson'
 SCHEMA_MODIFIED_DATE='May 6th, 2013'
 
-        
+
+def _withFileLock(method):
+    # PyTables is not thread safe, so any ioHubpyTablesFile method that uses
+    # the hdf5 file must hold the file lock while the event writer thread
+    # is running.
+    def lockedMethod(self,*args,**kwargs):
+        self._fileLock.acquire()
+        try:
+            return method(self,*args,**kwargs)
+        finally:
+            self._fileLock.release()
+    lockedMethod.__name__=method.__name__
+    lockedMethod.__doc__=method.__doc__
+    return lockedMethod
+
+
+class EventStagingBuffer(object):
+    """
+    A preallocated numpy array, with the dtype of an event table, that events
+    are copied into as they are received. When the array is full, or the
+    oldest event in it is older than the max. write latency, the filled rows
+    are handed to the EventTableWriter thread and appended to the table as
+    one block. Arrays that have been written are reused.
+    """
+    def __init__(self,table,dtype,block_size):
+        self.table=table
+        self.dtype=N.dtype(dtype)
+        self.block_size=block_size
+        self.array=N.empty(block_size,dtype=self.dtype)
+        self.count=0
+        self.first_event_time=None
+        self._free_arrays=[]
+
+    def add(self,event):
+        if self.count==0:
+            self.first_event_time=getTime()
+        self.array[self.count]=tuple(event)
+        self.count+=1
+        return self.count==self.block_size
+
+    def takeBlock(self):
+        # Returns the filled part of the staging array and replaces the array
+        # with one that has already been written, if there is one.
+        block=self.array[:self.count]
+        if self._free_arrays:
+            self.array=self._free_arrays.pop()
+        else:
+            self.array=N.empty(self.block_size,dtype=self.dtype)
+        self.count=0
+        self.first_event_time=None
+        return block
+
+    def releaseBlock(self,block):
+        # called by the writer thread once block has been appended.
+        if block.base is not None and len(block.base)==self.block_size:
+            self._free_arrays.append(block.base)
+
+
+class EventTableWriter(threading.Thread):
+    """
+    Thread that appends blocks of events from the EventStagingBuffers of an
+    ioHubpyTablesFile to their hdf5 tables, so that the ioHub Server's device
+    polling never waits on disk I/O. Staging buffers holding events older than
+    max_latency sec.msec are also written, so events are saved even when a
+    block does not fill.
+    """
+    _STOP=None
+    def __init__(self,datastore_file,max_latency):
+        threading.Thread.__init__(self,name='ioHubDataStoreWriter')
+        self.daemon=True
+        self._datastore_file=datastore_file
+        self._max_latency=max(max_latency,0.001)
+        self._queue=Queue.Queue()
+
+    def put(self,staging_buffer,block):
+        self._queue.put((staging_buffer,block))
+
+    def stop(self):
+        self._queue.put(self._STOP)
+        self.join()
+
+    def waitUntilWritten(self):
+        self._queue.join()
+
+    def run(self):
+        datastore_file=self._datastore_file
+        while True:
+            try:
+                item=self._queue.get(timeout=self._max_latency/2.0)
+            except Queue.Empty:
+                datastore_file._stageAgedBlocks(self._max_latency)
+                continue
+            try:
+                if item is self._STOP:
+                    return
+                staging_buffer,block=item
+                datastore_file._appendBlock(staging_buffer.table,block)
+                staging_buffer.releaseBlock(block)
+            except:
+                printExceptionDetailsToStdErr()
+            finally:
+                self._queue.task_done()
+            datastore_file._stageAgedBlocks(self._max_latency)
+
+
 class ioHubpyTablesFile():
     
     def __init__(self,fileName,folderPath,fmode='a',ioHubsettings=None):
@@ -58,22 +165,61 @@ class ioHubpyTablesFile():
         
         self.flushCounter=self.settings.get('flush_interval',32)
         self._eventCounter=0
+
+        # events are copied into per table staging buffers of
+        # write_block_size events, which are written by a background
+        # EventTableWriter thread. A write_block_size of 1 saves each event
+        # as it is received, without the writer thread.
+        self.writeBlockSize=max(1,self.settings.get('write_block_size',128))
+        self.maxWriteLatency=self.settings.get('write_max_latency',0.25)
+        self._stagingBuffers=dict()
+        self._stagingLock=threading.Lock()
+        self._fileLock=threading.RLock()
+        self._writer=None
+        self._writtenEventCount=0
+        self._writeDuration=0.0
         
         self.TABLES=dict()
         self._eventGroupMappings=dict()
         self.emrtFile = openFile(self.filePath, mode = fmode)
+
+        if self.writeBlockSize>1:
+            self._writer=EventTableWriter(self,self.maxWriteLatency)
+            self._writer.start()
                
         atexit.register(close_open_data_files, False)
         
         if len(self.emrtFile.title) == 0:
             self.buildOutTemplate()
-            self.flush()
+            self._flushFile()
         else:
             self.loadTableMappings()
     
+    def getEventTableSettings(self,event_table_label):
+        """
+        Returns the compression and chunking settings used when the event table
+        for event_table_label (an event class IOHUB_DATA_TABLE value) is created:
+        the 'default' entry of the data_store event_table_settings, updated with
+        any settings given for the table itself.
+        """
+        all_settings=self.settings.get('event_table_settings') or {}
+        table_settings=dict(complib='zlib',complevel=0,shuffle=False,expectedrows=10000,chunkshape=None)
+        table_settings.update(all_settings.get('default') or {})
+        table_settings.update(all_settings.get(event_table_label) or {})
+        return table_settings
+
+    def _createEventTableFilters(self,event_table_label,table_settings):
+        complib=table_settings['complib']
+        complevel=table_settings['complevel']
+        if complevel and tables.whichLibVersion(complib) is None:
+            # zlib is much slower than blosc, so use its fastest level.
+            print2err("ioDataStore: compression library '%s' is not available for the %s table; using zlib with complevel 1."%(complib,event_table_label))
+            complib='zlib'
+            complevel=1
+        return Filters(complevel=complevel, complib=complib, shuffle=bool(table_settings['shuffle']), fletcher32=False)
+
+    @_withFileLock
     def updateDataStoreStructure(self,device_instance,event_class_dict):
-        dfilter = Filters(complevel=0, complib='zlib', shuffle=False, fletcher32=False)
-        
         def eventTableLabel2ClassName(event_table_label):
             tokens=str(event_table_label[0]+event_table_label[1:].lower()+'Event').split('_') 
             return ''.join([t[0].upper()+t[1:] for t in tokens])
@@ -82,8 +228,14 @@ class ioHubpyTablesFile():
             if event_cls.IOHUB_DATA_TABLE:
                 event_table_label=event_cls.IOHUB_DATA_TABLE
                 if event_table_label not in self.TABLES:
-                    self.TABLES[event_table_label]=self.emrtFile.createTable(self._eventGroupMappings[event_table_label],eventTableLabel2ClassName(event_table_label),event_cls.NUMPY_DTYPE, title="%s Data"%(device_instance.__class__.__name__,),filters=dfilter.copy())
-                    self.flush()
+                    table_settings=self.getEventTableSettings(event_table_label)
+                    chunkshape=table_settings['chunkshape']
+                    if chunkshape:
+                        chunkshape=(int(chunkshape),)
+                    self.TABLES[event_table_label]=self.emrtFile.createTable(self._eventGroupMappings[event_table_label],eventTableLabel2ClassName(event_table_label),event_cls.NUMPY_DTYPE, title="%s Data"%(device_instance.__class__.__name__,),
+                                                                            filters=self._createEventTableFilters(event_table_label,table_settings),
+                                                                            expectedrows=table_settings['expectedrows'],chunkshape=chunkshape or None)
+                    self._flushFile()
     
                 self.addClassMapping(event_cls,self.TABLES[event_table_label])
 
@@ -208,17 +360,17 @@ class ioHubpyTablesFile():
         self.TABLES['CLASS_TABLE_MAPPINGS']=self.emrtFile.createTable(self.emrtFile.root,'class_table_mapping', ClassTableMappings, title='Mapping of ioHub DeviceEvent Classes to ioHub DataStore Tables.')
 
         self.emrtFile.createGroup(self.emrtFile.root, 'data_collection', title='Data Collected using the ioHub Event Framework.')
-        self.flush()
+        self._flushFile()
 
         self.emrtFile.createGroup(self.emrtFile.root.data_collection, 'events', title='All Events that were Saved During Experiment Sessions.')
 
         self.emrtFile.createGroup(self.emrtFile.root.data_collection, 'condition_variables', title="Tables created to Hold Experiment DV and IV's Values Saved During an Experiment Session.")
-        self.flush()
+        self._flushFile()
 
         
         self.TABLES['EXPERIMENT_METADETA']=self.emrtFile.createTable(self.emrtFile.root.data_collection,'experiment_meta_data', ExperimentMetaData, title='Information About Experiments Saved to This ioHub DataStore File.')
         self.TABLES['SESSION_METADETA']=self.emrtFile.createTable(self.emrtFile.root.data_collection,'session_meta_data', SessionMetaData, title='Information About Sessions Saved to This ioHub DataStore File.')
-        self.flush()
+        self._flushFile()
 
 
         self.emrtFile.createGroup(self.emrtFile.root.data_collection.events, 'experiment', title='Experiment Device Events.')
@@ -228,7 +380,7 @@ class ioHubpyTablesFile():
         self.emrtFile.createGroup(self.emrtFile.root.data_collection.events, 'gamepad', title='GamePad Device Events.')
         self.emrtFile.createGroup(self.emrtFile.root.data_collection.events, 'analog_input', title='AnalogInput Device Events.')
         self.emrtFile.createGroup(self.emrtFile.root.data_collection.events, 'eyetracker', title='EyeTracker Device Events.')
-        self.flush()
+        self._flushFile()
 
         self._buildEventGroupMappingDict()
         
@@ -252,6 +404,7 @@ class ioHubpyTablesFile():
         self._eventGroupMappings['BLINK_END']=self.emrtFile.root.data_collection.events.eyetracker
 
     
+    @_withFileLock
     def addClassMapping(self,ioClass,ctable):
         names = [ x['class_id'] for x in self.TABLES['CLASS_TABLE_MAPPINGS'].where("(class_id == %d)"%(ioClass.EVENT_TYPE_ID)) ]
         if len(names)==0:
@@ -261,8 +414,9 @@ class ioHubpyTablesFile():
             trow['class_name'] = ioClass.__name__
             trow['table_path']  = ctable._v_pathname
             trow.append()            
-            self.flush()    
+            self._flushFile()    
           
+    @_withFileLock
     def createOrUpdateExperimentEntry(self,experimentInfoList):
         #ioHub.print2err("createOrUpdateExperimentEntry called with: ",experimentInfoList)
         experiment_metadata=self.TABLES['EXPERIMENT_METADETA']
@@ -282,10 +436,11 @@ class ioHubpyTablesFile():
         self.active_experiment_id=max_id+1
         experimentInfoList[0]=self.active_experiment_id
         experiment_metadata.append([experimentInfoList,])
-        self.flush()
+        self._flushFile()
         #ioHub.print2err("Experiment ID set to: ",self.active_experiment_id)
         return self.active_experiment_id
     
+    @_withFileLock
     def createExperimentSessionEntry(self,sessionInfoDict):
         #ioHub.print2err("createExperimentSessionEntry called with: ",sessionInfoDict)
         session_metadata=self.TABLES['SESSION_METADETA']
@@ -299,11 +454,12 @@ class ioHubpyTablesFile():
         
         values=(self.active_session_id,self.active_experiment_id,sessionInfoDict['code'],sessionInfoDict['name'],sessionInfoDict['comments'],sessionInfoDict['user_variables'])
         session_metadata.append([values,])
-        self.flush()
+        self._flushFile()
 
         #ioHub.print2err("Session ID set to: ",self.active_session_id)
         return self.active_session_id
 
+    @_withFileLock
     def _initializeConditionVariableTable(self,experiment_id,np_dtype):
         experimentConditionVariableTable=None
         self._EXP_COND_DTYPE=N.dtype(np_dtype)
@@ -315,7 +471,7 @@ class ioHubpyTablesFile():
             try:
                 experimentConditionVariableTable=self.emrtFile.createTable(self.emrtFile.root.data_collection.condition_variables,expCondTableName,self._EXP_COND_DTYPE,title='Condition Variable Values for Experiment ID %d'%(experiment_id))
                 self.TABLES['EXP_CV']=experimentConditionVariableTable
-                self.emrtFile.flush()
+                self._flushFile()
             except:
                 printExceptionDetailsToStdErr()
                 return False
@@ -326,6 +482,7 @@ class ioHubpyTablesFile():
         self._activeRunTimeConditionVariableTable=experimentConditionVariableTable
         return True
 
+    @_withFileLock
     def _addRowToConditionVariableTable(self,session_id,data):
         if self.emrtFile and 'EXP_CV' in self.TABLES and self._EXP_COND_DTYPE is not None:
             try:
@@ -362,6 +519,7 @@ class ioHubpyTablesFile():
             return False
         return True
         
+    @_withFileLock
     def checkIfSessionCodeExists(self,sessionCode):
         if self.emrtFile:
             sessionsForExperiment=self.emrtFile.root.data_collection.session_meta_data.where("experiment_id == %d"%(self.active_experiment_id,))
@@ -386,10 +544,18 @@ class ioHubpyTablesFile():
             event[DeviceEvent.EVENT_EXPERIMENT_ID_INDEX]=self.active_experiment_id
             event[DeviceEvent.EVENT_SESSION_ID_INDEX]=self.active_session_id
 
-            np_array= N.array([tuple(event),],dtype=eventClass.NUMPY_DTYPE)
-            etable.append(np_array)
+            if self._writer:
+                self._stagingLock.acquire()
+                try:
+                    staging_buffer=self._getStagingBuffer(eventClass.IOHUB_DATA_TABLE,etable,eventClass.NUMPY_DTYPE)
+                    if staging_buffer.add(event):
+                        self._writer.put(staging_buffer,staging_buffer.takeBlock())
+                finally:
+                    self._stagingLock.release()
+                return
 
-            self.bufferedFlush()
+            np_array= N.array([tuple(event),],dtype=eventClass.NUMPY_DTYPE)
+            self._appendBlock(etable,np_array)
 
         except:
             print2err("Error saving event: ",event)
@@ -420,24 +586,87 @@ class ioHubpyTablesFile():
 
             np_array= N.array(np_events,dtype=eventClass.NUMPY_DTYPE)
             #ioHub.print2err('np_array:',np_array)
-            etable.append(np_array)
-
-            self.bufferedFlush(len(np_events))
+            if self._writer:
+                self._stagingLock.acquire()
+                try:
+                    # events already staged for the table must be written first.
+                    staging_buffer=self._getStagingBuffer(eventClass.IOHUB_DATA_TABLE,etable,eventClass.NUMPY_DTYPE)
+                    if staging_buffer.count:
+                        self._writer.put(staging_buffer,staging_buffer.takeBlock())
+                    self._writer.put(staging_buffer,np_array)
+                finally:
+                    self._stagingLock.release()
+                return
+
+            self._appendBlock(etable,np_array)
 
         except ioHubError, e:
             print2err(e)
         except:
             printExceptionDetailsToStdErr()
 
+    def _getStagingBuffer(self,table_label,etable,dtype):
+        staging_buffer=self._stagingBuffers.get(table_label)
+        if staging_buffer is None:
+            staging_buffer=EventStagingBuffer(etable,dtype,self.writeBlockSize)
+            self._stagingBuffers[table_label]=staging_buffer
+        return staging_buffer
+
+    def _stageAgedBlocks(self,max_age=None):
+        # Hands any staged events older than max_age sec.msec (all staged
+        # events if max_age is None) to the writer thread.
+        if self._writer is None:
+            return
+        self._stagingLock.acquire()
+        try:
+            ctime=getTime()
+            for staging_buffer in self._stagingBuffers.itervalues():
+                if staging_buffer.count and (max_age is None or ctime-staging_buffer.first_event_time>=max_age):
+                    self._writer.put(staging_buffer,staging_buffer.takeBlock())
+        finally:
+            self._stagingLock.release()
+
+    @_withFileLock
+    def _appendBlock(self,etable,np_array):
+        stime=getTime()
+        etable.append(np_array)
+        self.bufferedFlush(len(np_array))
+        self._writeDuration+=getTime()-stime
+        self._writtenEventCount+=len(np_array)
+
+    def getWriteStats(self):
+        """
+        Returns a dict with the number of events written to the file's event
+        tables (written_event_count), the sec.msec spent writing them, including
+        any flushes (write_duration), the resulting write_rate in events / sec,
+        and the events waiting to be written: staged_event_count events in
+        staging buffers and queued_block_count blocks queued for the writer
+        thread.
+        """
+        staged_event_count=0
+        queued_block_count=0
+        if self._writer:
+            staged_event_count=sum(sb.count for sb in self._stagingBuffers.values())
+            queued_block_count=self._writer._queue.qsize()
+        write_rate=0.0
+        if self._writeDuration>0.0:
+            write_rate=self._writtenEventCount/self._writeDuration
+        return dict(written_event_count=self._writtenEventCount,
+                    write_duration=self._writeDuration,
+                    write_rate=write_rate,
+                    staged_event_count=staged_event_count,
+                    queued_block_count=queued_block_count,
+                    write_block_size=self.writeBlockSize)
+
     def bufferedFlush(self,eventCount=1):
         # if flushCounter threshold is >=0 then do some checks. If it is < 0, then
         # flush only occurs when command is sent to ioHub, so do nothing here.
         if self.flushCounter>=0:
             if self.flushCounter==0:
-                self.flush()
+                self._flushFile()
                 return True
             if self.flushCounter<=self._eventCounter:
-                self.flush()
+                self._flushFile()
                 self._eventCounter=0
                 return True
             self._eventCounter+=eventCount
@@ -445,6 +674,16 @@ class ioHubpyTablesFile():
 
 
     def flush(self):
+        # staged events are written before the file is flushed.
+        if self._writer and self._writer.isAlive():
+            self._stageAgedBlocks()
+            self._writer.waitUntilWritten()
+        self._flushFile()
+
+    def _flushFile(self):
+        # Flushes the hdf5 file without waiting for staged events to be
+        # written; used by methods that already hold the file lock.
+        self._fileLock.acquire()
         try:
             if self.emrtFile:
                 self.emrtFile.flush()
@@ -452,9 +691,14 @@ class ioHubpyTablesFile():
             pass
         except:
             printExceptionDetailsToStdErr()
+        finally:
+            self._fileLock.release()
 
     def close(self):
         self.flush()
+        if self._writer:
+            self._writer.stop()
+            self._writer=None
         self._activeRunTimeConditionVariableTable=None
         self.emrtFile.close()
         
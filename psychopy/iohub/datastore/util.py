@@ -12,11 +12,12 @@ Distributed under the terms of the GNU General Public License (GPL version 3 or
 
 from tables import *
 import os
+import numpy
 from collections import namedtuple
 import json
 
 from psychopy import gui, iohub
-from psychopy.iohub import FileDialog
+from psychopy.iohub import FileDialog, OrderedDict
 
 global _hubFiles
 
@@ -92,11 +93,13 @@ class ExperimentDataAccessUtility(object):
         experimentCode (str): If multi-experiment support is enabled for the DataStore file, this arguement can be used to specify what experiment data to load based on the experiment_code given. NOTE: Multi-experiment data file support is not well tested and should not be used at this point. 
         
         sessionCodes (str or list): The experiment session code to filter data by. If a list of codes is given, then all codes in the list will be used.
+
+        autoIndex (bool): If True, column indexes are created for each event table the first time it is queried; see createIndexes.
     
     Returns:
         object: the created instance of the ExperimentDataAccessUtility, ready to get your data!
     """
-    def __init__(self, hdfFilePath, hdfFileName, experimentCode=None,sessionCodes=[],mode='r'):
+    def __init__(self, hdfFilePath, hdfFileName, experimentCode=None,sessionCodes=[],mode='r',autoIndex=False):
         """
         An instance of the ExperimentDataAccessUtility class is created by providing
         the location and name of the file to read, as well as any session code
@@ -111,6 +114,8 @@ class ExperimentDataAccessUtility(object):
             
             sessionCodes (str or list): The experiment session code to filter data by. If a list of codes is given, then all codes in the list will be used.
 
+            autoIndex (bool): If True, the first time an event table is queried by getEventAttributeValues, indexes are created for its experiment_id, session_id, type and time columns (see createIndexes). Requires mode 'a' or 'r+'.
+
         Returns:
             object: the created instance of the ExperimentDataAccessUtility, ready to get your data!
         """        
@@ -122,6 +127,8 @@ class ExperimentDataAccessUtility(object):
         self._experimentCode=experimentCode
         self._sessionCodes=sessionCodes
         self._lastWhereClause=None
+        self.autoIndex=autoIndex and mode != 'r'
+        self._indexedTables=set()
 
         try:
             self.hdfFile=openHubFile(hdfFilePath,hdfFileName,mode)
@@ -349,6 +356,139 @@ class ExperimentDataAccessUtility(object):
         else:
             raise ExperimentDataAccessException("Unhandled value type !: {0} is not a valid type for value {1}".format(type(value),value))
             
+    def createIndexes(self,event_type=None,columns=('experiment_id','session_id','type','time')):
+        """
+        Create PyTables column indexes for the given columns of an event table,
+        making the where clauses used by getEventAttributeValues much faster
+        on large tables. Indexes are saved in the DataStore file, so they only
+        need to be created once; columns that are already indexed are skipped.
+        The DataStore file must have been opened with mode 'a' or 'r+'.
+
+        Args:
+            event_type (str or int): The event type (see getEventTable) to index the table of. If None, all event tables in the file are indexed.
+
+            columns (list): The names of the columns to index.
+
+        Returns:
+            int: The number of indexes created.
+        """
+        if self.mode == 'r':
+            raise ExperimentDataAccessException("createIndexes: the DataStore file must be opened with mode 'a' or 'r+' to create column indexes.")
+        if event_type is None:
+            table_paths=set([m.table_path for m in self.getEventMappingInformation().itervalues()])
+            event_tables=[self.hdfFile.getNode(p) for p in table_paths]
+        else:
+            event_tables=[self.getEventTable(event_type),]
+        created=0
+        for table in event_tables:
+            created+=self._indexEventTable(table,columns)
+        return created
+
+    def _indexEventTable(self,table,columns=('experiment_id','session_id','type','time')):
+        created=0
+        for cname in columns:
+            if cname in table.colnames:
+                column=table.cols._f_col(cname)
+                if column.index is None:
+                    column.createIndex()
+                    created+=1
+        if created:
+            table.flush()
+        self._indexedTables.add(table._v_pathname)
+        return created
+
+    def _buildWhereClause(self,cv,event_type_id,filter_id,startConditions,endConditions,cvNames):
+        wclause="( experiment_id == {0} ) & ( session_id == {1} )".format(self._experimentID,cv.session_id)
+
+        wclause+=" & ( type == {0} ) ".format(event_type_id)
+
+        if filter_id is not None:
+            wclause += "& ( filter_id == {0} ) ".format(filter_id)
+
+        # start Conditions need to be added to where clause
+        if startConditions is not None:
+            wclause += "& ("
+            for conditionAttributeName, conditionAttributeComparitor in startConditions.iteritems():
+                avComparison,value=conditionAttributeComparitor
+                value=self.getValuesForVariables(cv,value, cvNames)
+                wclause += " ( {0} {1} {2} ) & ".format(conditionAttributeName,avComparison,value)
+            wclause=wclause[:-3]
+            wclause+=" ) "
+
+        # end Conditions need to be added to where clause
+        if endConditions is not None:
+            wclause += " & ("
+            for conditionAttributeName, conditionAttributeComparitor in endConditions.iteritems():
+                avComparison,value=conditionAttributeComparitor
+                value=self.getValuesForVariables(cv,value, cvNames)
+                wclause += " ( {0} {1} {2} ) & ".format(conditionAttributeName,avComparison,value)
+            wclause=wclause[:-3]
+            wclause+=" ) "
+        return wclause
+
+    # searchsorted side giving the first index (for a lower bound) or the
+    # stop index (for an upper bound) of the events matching a time comparison.
+    _TIME_COMPARISONS={'>=':(True,'left'),'>':(True,'right'),'<=':(False,'right'),'<':(False,'left')}
+
+    def _getTimeWindowConditions(self,startConditions,endConditions):
+        # Returns a list of (is_lower_bound, searchsorted side, value) for each
+        # start / end condition, or None if a condition is not a comparison of
+        # the event time that can be done with searchsorted.
+        conditions=[]
+        for cdict in (startConditions,endConditions):
+            if cdict is None:
+                continue
+            for conditionAttributeName, (avComparison, value) in cdict.iteritems():
+                comparison=self._TIME_COMPARISONS.get(avComparison.strip())
+                if conditionAttributeName != 'time' or comparison is None or isinstance(value,(list,tuple)):
+                    return None
+                conditions.append((comparison[0],comparison[1],value))
+        return conditions
+
+    def _getEventAttributeValuesByTime(self,deviceEventTable,event_type_id,event_attribute_names,filter_id,
+                                       conditionVariableList,startConditions,endConditions,cvNames,
+                                       timeConditions,EventAttributeResults):
+        # Reads the events for each session once, sorted by time, and uses
+        # searchsorted to find the events within the time window of each
+        # condition variable row. The returned attribute arrays are views of
+        # the arrays read for the session.
+        resultSetList=[None]*len(conditionVariableList)
+        cv_rows_by_session=dict()
+        for i,cv in enumerate(conditionVariableList):
+            cv_rows_by_session.setdefault(cv.session_id,[]).append(i)
+
+        for session_id,cv_rows in cv_rows_by_session.iteritems():
+            wclause="( experiment_id == {0} ) & ( session_id == {1} ) & ( type == {2} )".format(self._experimentID,session_id,event_type_id)
+            if filter_id is not None:
+                wclause += " & ( filter_id == {0} )".format(filter_id)
+            events=deviceEventTable.readWhere(wclause)
+            times=events['time'].astype(numpy.float64)
+            if len(times)>1 and (times[1:]<times[:-1]).any():
+                order=numpy.argsort(times,kind='mergesort')
+                events=events[order]
+                times=times[order]
+            columns=[events[ename] for ename in event_attribute_names]
+
+            starts=numpy.zeros(len(cv_rows),dtype=numpy.intp)
+            stops=numpy.empty(len(cv_rows),dtype=numpy.intp)
+            stops.fill(len(times))
+            for is_lower_bound,side,value in timeConditions:
+                values=numpy.asarray([self.getValuesForVariables(conditionVariableList[i],value,cvNames) for i in cv_rows],dtype=numpy.float64)
+                bounds=times.searchsorted(values,side)
+                if is_lower_bound:
+                    numpy.maximum(starts,bounds,starts)
+                else:
+                    numpy.minimum(stops,bounds,stops)
+            numpy.maximum(stops,starts,stops)
+
+            for i,start,stop in zip(cv_rows,starts,stops):
+                cv=conditionVariableList[i]
+                values=[c[start:stop] for c in columns]
+                values.append(self._buildWhereClause(cv,event_type_id,filter_id,startConditions,endConditions,cvNames))
+                values.append(cv)
+                resultSetList[i]=EventAttributeResults(*values)
+        return resultSetList
+
     def getEventAttributeValues(self,event_type_id,event_attribute_names,filter_id=None, conditionVariablesFilter=None, startConditions=None,endConditions=None):
         """
         **Docstr TBC.**
@@ -362,6 +502,11 @@ class ExperimentDataAccessUtility(object):
             
         Returns:
             Values for the specified event type and event attribute columns which match the provided experiment condition variable filter, starting condition filer, and ending condition filter criteria.
+
+        When the start and end conditions only compare the event 'time' to a
+        value (using >=, >, <= or <), the events of each session are read once
+        and split into the time window of each condition variable row using
+        numpy.searchsorted, instead of being read once per row and attribute.
         """
         if self.hdfFile:
             klassTables=self.hdfFile.root.class_table_mapping
@@ -373,12 +518,18 @@ class ExperimentDataAccessUtility(object):
                 raise ExperimentDataAccessException("event_type_id passed to getEventAttribute should only return one row from CLASS_MAPPINGS.")
             tablePathString=result[0][3]
             deviceEventTable=self.hdfFile.getNode(tablePathString)
-  
+
+            if not isinstance(event_attribute_names, (list,tuple)):
+                event_attribute_names=[event_attribute_names,]
+
             for ename in event_attribute_names:
                 if ename not in deviceEventTable.colnames:
                     raise ExperimentDataAccessException("getEventAttribute: %s does not have a column named %s"%(deviceEventTable.title,event_attribute_names))
                     return None
-          
+
+            if self.autoIndex and tablePathString not in self._indexedTables:
+                self._indexEventTable(deviceEventTable)
+
             resultSetList=[]            
 
             csier=list(event_attribute_names)
@@ -387,9 +538,6 @@ class ExperimentDataAccessUtility(object):
             EventAttributeResults=namedtuple('EventAttributeResults',csier)
             
             if deviceEventTable is not None:
-                if not isinstance(event_attribute_names, (list,tuple)):
-                    event_attribute_names=[event_attribute_names,]
-
                 filteredConditionVariableList=None
                 if conditionVariablesFilter is None:
                     filteredConditionVariableList= self.getConditionVariables()
@@ -398,62 +546,20 @@ class ExperimentDataAccessUtility(object):
                 
                 cvNames=self.getConditionVariableNames()
 
-                # no futher where clause building needed; get reseults and return
-                if startConditions is None and endConditions is None:
-                    for cv in filteredConditionVariableList:    
-                
-                        wclause="( experiment_id == {0} ) & ( session_id == {1} )".format(self._experimentID,cv.session_id)
-        
-                        wclause+=" & ( type == {0} ) ".format(event_type_id)
-        
-                        if filter_id is not None:
-                            wclause += "& ( filter_id == {0} ) ".format(filter_id)
-
-                        resultSetList.append([])
-
-                        for ename in event_attribute_names:
-                            resultSetList[-1].append(deviceEventTable.readWhere(wclause, field=ename))
-                        resultSetList[-1].append(wclause)
-                        resultSetList[-1].append(cv)
-
-                        eventAttributeResults=EventAttributeResults(*resultSetList[-1])
-                        resultSetList[-1]=eventAttributeResults
-                        
-                    return resultSetList
+                timeConditions=self._getTimeWindowConditions(startConditions,endConditions)
+                if timeConditions is not None:
+                    return self._getEventAttributeValuesByTime(deviceEventTable,event_type_id,event_attribute_names,filter_id,
+                                                               filteredConditionVariableList,startConditions,endConditions,cvNames,
+                                                               timeConditions,EventAttributeResults)
 
-                #start or end conditions exist....
                 for cv in filteredConditionVariableList:    
                     resultSetList.append([])
 
-                    wclause="( experiment_id == {0} ) & ( session_id == {1} )".format(self._experimentID,cv.session_id)
-    
-                    wclause+=" & ( type == {0} ) ".format(event_type_id)
-    
-                    if filter_id is not None:
-                        wclause += "& ( filter_id == {0} ) ".format(filter_id)
-                        
-                    # start Conditions need to be added to where clause
-                    if startConditions is not None:
-                        wclause += "& ("
-                        for conditionAttributeName, conditionAttributeComparitor in startConditions.iteritems():
-                            avComparison,value=conditionAttributeComparitor
-                            value=self.getValuesForVariables(cv,value, cvNames)                                    
-                            wclause += " ( {0} {1} {2} ) & ".format(conditionAttributeName,avComparison,value)
-                        wclause=wclause[:-3]
-                        wclause+=" ) "
-    
-                    # end Conditions need to be added to where clause
-                    if endConditions is not None:
-                        wclause += " & ("
-                        for conditionAttributeName, conditionAttributeComparitor in endConditions.iteritems():
-                            avComparison,value=conditionAttributeComparitor
-                            value=self.getValuesForVariables(cv,value, cvNames)                                                                        
-                            wclause += " ( {0} {1} {2} ) & ".format(conditionAttributeName,avComparison,value)
-                        wclause=wclause[:-3]
-                        wclause+=" ) "
+                    wclause=self._buildWhereClause(cv,event_type_id,filter_id,startConditions,endConditions,cvNames)
 
+                    events=deviceEventTable.readWhere(wclause)
                     for ename in event_attribute_names:
-                        resultSetList[-1].append(deviceEventTable.readWhere(wclause, field=ename))
+                        resultSetList[-1].append(events[ename])
                     resultSetList[-1].append(wclause)
                     resultSetList[-1].append(cv)
 
@@ -476,6 +582,165 @@ class ExperimentDataAccessUtility(object):
         """
         return self.getEventTable(event_type).iterrows()
         
+    def exportColumnar(self,exportDir,chunkSize=65536,trialStartVariable=None,trialEndVariable=None):
+        """
+        Export every table of the DataStore file to a columnar format that
+        can be loaded without PyTables: each column of each table is saved as
+        a numpy .npy file, and a manifest.json file in exportDir lists the
+        exported tables, their row counts and the file, dtype and shape of
+        each column. Use loadColumnarExport to load an export, with the
+        columns memory mapped.
+
+        Tables are read and written chunkSize rows at a time, so the memory
+        used by the export is bounded by the chunk size, not the file size.
+
+        If trialStartVariable and trialEndVariable are given, they are the
+        names of the condition variables holding the start and end time of
+        each trial. Each exported event table then gets a 'condition_row'
+        column, giving the index of the condition variable row whose trial
+        time window (for the event's session) contains the event's time,
+        or -1 if the event did not occur during a trial.
+
+        Args:
+            exportDir (str): The folder to save the export to. It is created if it does not exist.
+
+            chunkSize (int): The number of table rows read and written at a time.
+
+            trialStartVariable (str): The condition variable holding the start time of each trial.
+
+            trialEndVariable (str): The condition variable holding the end time of each trial.
+
+        Returns:
+            dict: The export manifest, as saved to manifest.json.
+        """
+        if not os.path.isdir(exportDir):
+            os.makedirs(exportDir)
+
+        data_collection=self.hdfFile.root.data_collection
+        export_tables=[('experiment_meta_data',data_collection.experiment_meta_data),
+                       ('session_meta_data',data_collection.session_meta_data)]
+
+        cv_group=data_collection.condition_variables
+        ecv="EXP_CV_%d"%(self._experimentID,)
+        ecvTable=cv_group._v_leaves.get(ecv)
+        if ecvTable is not None:
+            export_tables.append(('condition_variables',ecvTable))
+
+        trial_windows=None
+        if trialStartVariable and trialEndVariable and ecvTable is not None:
+            trial_windows=self._getTrialWindows(ecvTable,trialStartVariable,trialEndVariable)
+
+        table_paths=sorted(set([m.table_path for m in self.getEventMappingInformation().itervalues()]))
+        for table_path in table_paths:
+            table=self.hdfFile.getNode(table_path)
+            export_tables.append(('events/%s'%(table.name),table))
+
+        manifest=dict(format_version=1,
+                      source_file=os.path.join(self.hdfFilePath,self.hdfFileName),
+                      experiment_id=int(self._experimentID),
+                      chunk_size=chunkSize,
+                      trial_start_variable=trialStartVariable,
+                      trial_end_variable=trialEndVariable,
+                      tables=dict())
+
+        for table_key,table in export_tables:
+            join_windows=None
+            if trial_windows is not None and table_key.startswith('events/'):
+                join_windows=trial_windows
+            manifest['tables'][table_key]=self._exportTableColumns(table,exportDir,table_key,chunkSize,join_windows)
+
+        manifest_file=open(os.path.join(exportDir,'manifest.json'),'w')
+        try:
+            json.dump(manifest,manifest_file,indent=1,sort_keys=True)
+        finally:
+            manifest_file.close()
+        return manifest
+
+    def _getTrialWindows(self,ecvTable,trialStartVariable,trialEndVariable):
+        # Returns {session_id: (start times, end times, condition row indexes)},
+        # sorted by start time. If the condition variables have no session_id
+        # column, all rows are used for every session (key None).
+        cvdata=ecvTable.read()
+        for cname in (trialStartVariable,trialEndVariable):
+            if cname not in cvdata.dtype.names:
+                raise ExperimentDataAccessException("exportColumnar: %s is not a condition variable name"%(cname))
+        if 'session_id' in cvdata.dtype.names:
+            sessions=cvdata['session_id']
+        else:
+            sessions=numpy.zeros(len(cvdata),dtype=numpy.int64)
+        trial_windows=dict()
+        for session_id in numpy.unique(sessions):
+            rows=numpy.flatnonzero(sessions==session_id)
+            starts=cvdata[trialStartVariable][rows].astype(numpy.float64)
+            order=numpy.argsort(starts,kind='mergesort')
+            key=int(session_id) if 'session_id' in cvdata.dtype.names else None
+            trial_windows[key]=(starts[order],cvdata[trialEndVariable][rows][order].astype(numpy.float64),rows[order])
+        return trial_windows
+
+    @staticmethod
+    def _getConditionRows(trial_windows,session_ids,times):
+        condition_rows=numpy.empty(len(times),dtype=numpy.int32)
+        condition_rows.fill(-1)
+        if None in trial_windows:
+            session_masks=[(trial_windows[None],None)]
+        else:
+            session_masks=[(trial_windows[s],session_ids==s) for s in numpy.unique(session_ids) if int(s) in trial_windows]
+        for (starts,ends,rows),mask in session_masks:
+            t=times if mask is None else times[mask]
+            i=starts.searchsorted(t,'right')-1
+            in_trial=i>=0
+            i[~in_trial]=0
+            in_trial&=t<=ends[i]
+            values=numpy.where(in_trial,rows[i],-1)
+            if mask is None:
+                condition_rows[:]=values
+            else:
+                condition_rows[mask]=values
+        return condition_rows
+
+    def _exportTableColumns(self,table,exportDir,table_key,chunkSize,trial_windows=None):
+        table_dir=os.path.join(exportDir,*table_key.split('/'))
+        if not os.path.isdir(table_dir):
+            os.makedirs(table_dir)
+        nrows=table.nrows
+
+        columns=OrderedDict()
+        for cname in table.colnames:
+            coldtype=table.coldtypes[cname]
+            columns[cname]=(coldtype.base,(nrows,)+coldtype.shape)
+        if trial_windows is not None and 'time' in table.colnames and 'session_id' in table.colnames:
+            columns['condition_row']=(numpy.dtype(numpy.int32),(nrows,))
+        else:
+            trial_windows=None
+
+        table_info=dict(source=table._v_pathname,rows=nrows,columns=dict())
+        column_files=dict()
+        try:
+            for cname,(dtype,shape) in columns.iteritems():
+                file_name='%s.npy'%(cname)
+                file_path=os.path.join(table_dir,file_name)
+                if nrows:
+                    column_files[cname]=numpy.lib.format.open_memmap(file_path,mode='w+',dtype=dtype,shape=shape)
+                else:
+                    numpy.save(file_path,numpy.empty(shape,dtype=dtype))
+                table_info['columns'][cname]=dict(file='/'.join(table_key.split('/')+[file_name,]),
+                                                  dtype=dtype.str,shape=list(shape))
+
+            for start in xrange(0,nrows,chunkSize):
+                stop=min(start+chunkSize,nrows)
+                chunk=table.read(start,stop)
+                for cname in table.colnames:
+                    column_files[cname][start:stop]=chunk[cname]
+                if trial_windows is not None:
+                    column_files['condition_row'][start:stop]=self._getConditionRows(trial_windows,chunk['session_id'],
+                                                                                      chunk['time'].astype(numpy.float64))
+                del chunk
+        finally:
+            for column_file in column_files.itervalues():
+                column_file.flush()
+            column_files.clear()
+        return table_info
+
     def close(self):
         """
         Close the ExperimentDataAccessUtility and associated DataStore File.
@@ -498,4 +763,32 @@ class ExperimentDataAccessUtility(object):
             pass
         
 class ExperimentDataAccessException(Exception):
-    pass
\ No newline at end of file
+    pass
+
+def loadColumnarExport(exportDir,mmapMode='r'):
+    """
+    Load a DataStore export created by ExperimentDataAccessUtility.exportColumnar.
+    PyTables is not used, and by default each column is memory mapped, so
+    only the parts of a column that are used are read from disk.
+
+    Args:
+        exportDir (str): The folder the export was saved to.
+
+        mmapMode (str): The numpy.load mmap_mode used for each column; None loads the columns into memory.
+
+    Returns:
+        dict: Maps each exported table name (e.g. 'condition_variables' or 'events/BinocularEyeSampleEvent') to a dict of column name -> numpy array.
+    """
+    manifest_file=open(os.path.join(exportDir,'manifest.json'),'r')
+    try:
+        manifest=json.load(manifest_file)
+    finally:
+        manifest_file.close()
+    tables=dict()
+    for table_key,table_info in manifest['tables'].iteritems():
+        columns=dict()
+        for cname,column_info in table_info['columns'].iteritems():
+            file_path=os.path.join(exportDir,*column_info['file'].split('/'))
+            columns[str(cname)]=numpy.load(file_path,mmap_mode=mmapMode if table_info['rows'] else None)
+        tables[str(table_key)]=columns
+    return tables
\ No newline at end of file
@@ -16,6 +16,8 @@ import gc, os, sys
 import collections
 from collections import deque
 from operator import itemgetter
+from itertools import islice
+import heapq
 import numpy as N
 
 global _psutil_available
@@ -795,6 +797,7 @@ class Device(ioObject):
     DEVICE_TYPE_STRING=None
     
     __slots__=[e[0] for e in _newDataTypes]+['_native_event_buffer',
+                                            '_native_events_dropped',
                                             '_event_listeners',
                                             '_iohub_event_buffer',
                                             '_last_poll_time',
@@ -859,12 +862,13 @@ class Device(ioObject):
         ioObject.__init__(self,*args,**kwargs)
 
         self._is_reporting_events=kwargs.get('auto_report_events')
-        self._iohub_event_buffer=dict()
+        self._iohub_event_buffer=DeviceEventBuffer()
         self._event_listeners=dict()
         self._configuration=kwargs
         self._last_poll_time=0
         self._last_callback_time=0
         self._native_event_buffer=deque(maxlen=self.event_buffer_length)
+        self._native_events_dropped=0
 
         
     def getConfiguration(self):
@@ -899,6 +903,10 @@ class Device(ioObject):
             event_type_id (int): If specified, provides the ioHub DeviceEvent ID for which events should be returned for.  Events that have occurred but do not match the event ID specified are ignored. Event type ID's can be accessed via the EventConstants class; all available event types are class atttributes of EventConstants.
             
             clearEvents (int): Can be used to indicate if the events being returned should also be removed from the device event buffer. True (the defualt) indicates to remove events being returned. False results in events being left in the device event buffer. 
+
+            start_time (float): Optional kwarg; only events with an ioHub time >= start_time are returned (and cleared).
+
+            end_time (float): Optional kwarg; only events with an ioHub time <= end_time are returned (and cleared).
         
             asType (str): Optional kwarg giving the object type to return events as. Valid values are 'namedtuple' (the default), 'dict', 'list', or 'object'.
 
@@ -917,19 +925,12 @@ class Device(ioObject):
                 eventTypeID=kwargs.get('event_type',None)    
             clearEvents=kwargs.get('clearEvents',True)
 
-        currentEvents=[]
-        if eventTypeID:
-            currentEvents=list(self._iohub_event_buffer.get(eventTypeID,[]))
-            if clearEvents is True and len(currentEvents)>0:
-                self._iohub_event_buffer[eventTypeID]=[]
-        else:
-            [currentEvents.extend(l) for l in self._iohub_event_buffer.values()]
-            if clearEvents is True and len(currentEvents)>0:
-                self.clearEvents()
-
-        if len(currentEvents)>0:
-            currentEvents=sorted(currentEvents, key=itemgetter(DeviceEvent.EVENT_HUB_TIME_INDEX))
-        return currentEvents
+        # events are kept time ordered per event type, so they only need to
+        # be merged, not sorted.
+        return self._iohub_event_buffer.getEvents(eventTypeID or None,
+                                                  kwargs.get('start_time',None),
+                                                  kwargs.get('end_time',None),
+                                                  clearEvents is True)
 
 
     def clearEvents(self):
@@ -976,14 +977,18 @@ class Device(ioObject):
         return self._is_reporting_events
 
     def _handleEvent(self,e):
-        self._iohub_event_buffer.setdefault(e[DeviceEvent.EVENT_TYPE_ID_INDEX],[]).append(e)
+        self._iohub_event_buffer.append(e)
         
     def _getNativeEventBuffer(self):
         return self._native_event_buffer
 
     def _addNativeEventToBuffer(self,e):
         if self.isReportingEvents():
-            self._native_event_buffer.append(e)
+            native_buffer=self._native_event_buffer
+            if len(native_buffer)==native_buffer.maxlen:
+                # the deque drops its oldest event to make room.
+                self._native_events_dropped+=1
+            native_buffer.append(e)
 
     def _addEventListener(self,l,eventTypeIDs):
         for ei in eventTypeIDs:
@@ -1069,7 +1074,15 @@ class Device(ioObject):
         such high polling rates will result in many calls to Device._poll that do
         not find any new events to process, causing extra processing overhead that
         is not needed in many cases.
-        
+
+        To reduce that overhead, the ioHub Server can adapt each device's polling
+        interval to the rate events are being received, between the optional
+        device_timer min_interval and max_interval settings (both default to
+        interval). Polling is done at min_interval as soon as a poll finds more
+        than one new event, and slows towards max_interval while polls find no
+        new events. A max_interval larger than interval therefore means the
+        first event after an idle period can take up to max_interval to be read.
+
         Args:
             None
             
@@ -1357,6 +1370,162 @@ class DeviceEvent(ioObject):
     @classmethod
     def createEventAsNamedTuple(cls,valueList):
         return cls.namedTupleClass(*valueList)
+
+########### Time ordered event buffer used by the ioHub Server and Devices ##########
+
+class DeviceEventBuffer(object):
+    """
+    Holds ioHub events (event value lists) in one deque per event type. Each
+    event type is generated by a single device, in time order, so every deque
+    is kept sorted by ioHub time as events are added (the rare event that
+    arrives out of order, e.g. a MessageEvent given an earlier sec_time, is
+    inserted in place, searching from the newest event).
+
+    Retrieving events therefore never needs a full sort: the deques for the
+    requested event types are merged using a k-way heap merge, which is
+    O(n log k) for k event types (and O(n) when only one type is requested).
+    Events can be filtered by event type and by a [start_time, end_time]
+    window of ioHub times without copying the buffer.
+
+    If maxlen is given, the buffer holds at most maxlen events over all event
+    types; adding an event to a full buffer removes the oldest event in the
+    buffer (as a deque with a maxlen does).
+    """
+    def __init__(self,maxlen=None):
+        self._queues=dict()
+        self._maxlen=maxlen
+        self._length=0
+        #: Number of events removed because the buffer was full.
+        self.dropped_count=0
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return iter(self.getEvents(clear=False))
+
+    def append(self,event):
+        time_index=DeviceEvent.EVENT_HUB_TIME_INDEX
+        event_type=event[DeviceEvent.EVENT_TYPE_ID_INDEX]
+        queue=self._queues.get(event_type)
+        if queue is None:
+            queue=self._queues[event_type]=deque()
+        if queue and event[time_index] < queue[-1][time_index]:
+            self._insertInOrder(queue,event)
+        else:
+            queue.append(event)
+        self._length+=1
+        if self._maxlen and self._length > self._maxlen:
+            self._removeOldest()
+
+    def getEvents(self,event_types=None,start_time=None,end_time=None,clear=True):
+        """
+        Return the events in the buffer as a list sorted by ioHub time.
+
+        Args:
+            event_types (int or list): Only return events of these event type ids. None (the default) returns all event types.
+
+            start_time (float): Only return events with an ioHub time >= start_time.
+
+            end_time (float): Only return events with an ioHub time <= end_time.
+
+            clear (bool): If True (the default), the returned events are removed from the buffer. Events that were not returned are kept.
+
+        Returns:
+            list: The matching events, oldest first.
+        """
+        time_index=DeviceEvent.EVENT_HUB_TIME_INDEX
+        if event_types is None:
+            queues=self._queues.values()
+        else:
+            if isinstance(event_types,(int,long)):
+                event_types=(event_types,)
+            queues=[self._queues[et] for et in event_types if et in self._queues]
+
+        windows=[]
+        for queue in queues:
+            if queue:
+                first,count=self._getWindow(queue,start_time,end_time)
+                if count:
+                    windows.append((queue,first,count))
+
+        if len(windows)==0:
+            return []
+        elif len(windows)==1:
+            queue,first,count=windows[0]
+            events=list(islice(queue,first,first+count))
+        else:
+            events=[e for t,e in heapq.merge(*[((e[time_index],e) for e in islice(queue,first,first+count))
+                                                for queue,first,count in windows])]
+
+        if clear:
+            for queue,first,count in windows:
+                self._removeRange(queue,first,count)
+            self._length-=len(events)
+        return events
+
+    def clear(self):
+        """
+        Remove all events from the buffer. Returns the number of events removed.
+        """
+        cleared=self._length
+        self._queues.clear()
+        self._length=0
+        return cleared
+
+    @staticmethod
+    def _getWindow(queue,start_time,end_time):
+        # Returns the index of the first event in the time window and the
+        # number of events in it. Only the events up to the end of the window
+        # are looked at.
+        time_index=DeviceEvent.EVENT_HUB_TIME_INDEX
+        if start_time is None and (end_time is None or queue[-1][time_index] <= end_time):
+            return 0,len(queue)
+        first=0
+        count=0
+        for e in queue:
+            etime=e[time_index]
+            if start_time is not None and etime < start_time:
+                first+=1
+            elif end_time is not None and etime > end_time:
+                break
+            else:
+                count+=1
+        return first,count
+
+    @staticmethod
+    def _insertInOrder(queue,event):
+        time_index=DeviceEvent.EVENT_HUB_TIME_INDEX
+        etime=event[time_index]
+        after=0
+        for e in reversed(queue):
+            if e[time_index] <= etime:
+                break
+            after+=1
+        queue.rotate(after)
+        queue.append(event)
+        queue.rotate(-after)
+
+    @staticmethod
+    def _removeRange(queue,first,count):
+        if first==0 and count==len(queue):
+            queue.clear()
+            return
+        queue.rotate(-first)
+        for i in xrange(count):
+            queue.popleft()
+        queue.rotate(first)
+
+    def _removeOldest(self):
+        time_index=DeviceEvent.EVENT_HUB_TIME_INDEX
+        oldest=None
+        for queue in self._queues.itervalues():
+            if queue and (oldest is None or queue[0][time_index] < oldest[0][time_index]):
+                oldest=queue
+        oldest.popleft()
+        self._length-=1
+        self.dropped_count+=1
+
 #
 # Import Devices and DeviceEvents
 #
@@ -218,7 +218,7 @@ class RemoteEventSubscriber(Device):
                     data[6]=logged_time #update logged time
                     remote_hub_time=data[7]
                     data[7]=time_sync_state.remote2LocalTime(remote_hub_time)
-                    data[8]=time_sync_state.getAccuracy()*2.0 
+                    data[8]=time_sync_state.getConversionError(data[7])
                     network_delay=time_sync_state.local2RemoteTime(logged_time)-remote_logged_time
                     data[9]+=network_delay
 
@@ -14,7 +14,8 @@ from gevent import socket,sleep,Greenlet
 import msgpack
 import struct
 from weakref import proxy
-from psychopy.iohub.util import NumPyRingBuffer as RingBuffer
+from collections import deque
+import numpy
 from psychopy.iohub import Computer
 getTime=Computer.getTime
 
@@ -52,13 +53,27 @@ class SocketConnection(object):
         self.sock.setblocking(blocking)
 
     def sendTo(self,data,address=None):
+        return self.sendPackedTo(self.pack(data),address)
+
+    def sendPackedTo(self,packed_data,address=None):
+        # send data that has already been packed, e.g. a request built one
+        # item at a time using packArrayHeader().
         if address is None:
             address=self._remote_host, self._remote_port
-        d=self.pack(data)
-        byte_count=len(d)
-        self.sock.sendto(d,address)
+        byte_count=len(packed_data)
+        self.sock.sendto(packed_data,address)
         return byte_count
 
+    @staticmethod
+    def packArrayHeader(length):
+        # msgpack header for an array of length items; followed by the
+        # packed items it gives the same bytes as packing the whole array.
+        if length<16:
+            return struct.pack('B',0x90|length)
+        elif length<0x10000:
+            return struct.pack('>BH',0xdc,length)
+        return struct.pack('>BI',0xdd,length)
+
     def receive(self):
         try:
             data, address = self.sock.recvfrom(self._rcvBufferLength)
@@ -152,11 +167,18 @@ class ioHubTimeGreenSyncManager(Greenlet):
     monitors and calculates the ongoing offset and drift between the local ioHub
     instance and a remote ioHub instance running on another computer that is 
     publishing events that are being received by the local ioHubRemoteEventSubscriber.
+
+    Time sync batches are done every initial_sync_interval sec.msec until
+    initial_sample_count samples have been added to the TimeSyncState, and
+    every sync_interval sec.msec after that, so the state's sync window
+    covers window_size * sync_interval seconds of drift.
     """
     
-    def __init__(self,remote_address,sync_state_target):
+    def __init__(self,remote_address,sync_state_target,sync_interval=1.0,initial_sample_count=10):
         Greenlet.__init__(self)
         self.initial_sync_interval=0.2
+        self.sync_interval=sync_interval
+        self.initial_sample_count=initial_sample_count
         self._remote_address=remote_address
         self._sync_socket=ioHubTimeSyncConnection(remote_address)
         self.sync_state_target=proxy(sync_state_target)
@@ -167,28 +189,18 @@ class ioHubTimeGreenSyncManager(Greenlet):
         self._sync(False)
         self._sync(False)
         while self._running is True:
-            sleep(self.initial_sync_interval)
+            if self.sync_state_target.getSampleCount()<self.initial_sample_count:
+                sleep(self.initial_sync_interval)
+            else:
+                sleep(self.sync_interval)
             self._sync()
         self._close()
         
     def _sync(self,calc_drift_and_offset=True):
         if self._sync_socket:
             min_delay, min_local_time, min_remote_time=self._sync_socket.sync()     
-            sync_state_target=self.sync_state_target
-            sync_state_target.RTTs.append(min_delay)
-            sync_state_target.L_times.append(min_local_time)
-            sync_state_target.R_times.append(min_remote_time)
-            
-            if calc_drift_and_offset is True:
-                l1=sync_state_target.L_times[-2]
-                l2=sync_state_target.L_times[-1]
-                r1=sync_state_target.R_times[-2]
-                r2=sync_state_target.R_times[-1]
-                self.sync_state_target.drifts.append((r2-r1)/(l2-l1))
-    
-                l=sync_state_target.L_times[-1]
-                r=sync_state_target.R_times[-1]
-                self.sync_state_target.offsets=(r-l)
+            # the sync state refits the drift and offset for each sample.
+            self.sync_state_target.addSample(min_delay, min_local_time, min_remote_time)
 
     def _close(self):           
         if self._sync_socket:        
@@ -210,21 +222,8 @@ class ioHubTimeSyncManager(object):
     def sync(self,calc_drift_and_offset=True):
         if self._sync_socket:
             min_delay, min_local_time, min_remote_time=self._sync_socket.sync()     
-            sync_state_target=self.sync_state_target
-            sync_state_target.RTTs.append(min_delay)
-            sync_state_target.L_times.append(min_local_time)
-            sync_state_target.R_times.append(min_remote_time)
-            
-            if calc_drift_and_offset is True:
-                l1=sync_state_target.L_times[-2]
-                l2=sync_state_target.L_times[-1]
-                r1=sync_state_target.R_times[-2]
-                r2=sync_state_target.R_times[-1]
-                self.sync_state_target.drifts.append((r2-r1)/(l2-l1))
-    
-                l=sync_state_target.L_times[-1]
-                r=sync_state_target.R_times[-1]
-                self.sync_state_target.offsets=(r-l)
+            # the sync state refits the drift and offset for each sample.
+            self.sync_state_target.addSample(min_delay, min_local_time, min_remote_time)
 
     def close(self):           
         if self._sync_socket:        
@@ -240,24 +239,106 @@ class TimeSyncState(object):
     Container class used by an ioHubSyncManager to hold the data necessary to
     calculate the current time base offset and drift between an ioHub Server
     and a ioHubRemoteEventSubscriber client.
+
+    The min. round trip time (RTT) sample of the last window_size time sync
+    batches is kept. Each time a sample is added, the remote time is modelled
+    as a linear function of the local time (remote = drift * local + offset)
+    using a robust weighted linear regression over the window: samples are
+    weighted by 1 / RTT**2, and Huber weights are used to down weight samples
+    whose residual is much larger than the median absolute residual, so a
+    few delayed replies do not bias the fit.
+
+    local2RemoteTime and remote2LocalTime accept a single time or a numpy
+    array of times, so whole event arrays can be converted at once, and
+    getConversionError gives the accuracy bound of converted times.
     """
-    RTTs=RingBuffer(10)
-    L_times=RingBuffer(10)
-    R_times=RingBuffer(10)
-    drifts=RingBuffer(20)
-    offsets=RingBuffer(20)
-    
+    def __init__(self,window_size=256,robust_iterations=3):
+        self.window_size=window_size
+        self.robust_iterations=robust_iterations
+        self.RTTs=deque(maxlen=window_size)
+        self.L_times=deque(maxlen=window_size)
+        self.R_times=deque(maxlen=window_size)
+        # fitted model: remote - local = _a + _b * (local - _ref)
+        self._ref=0.0
+        self._a=0.0
+        self._b=0.0
+        # used to calculate the standard error of the model at a local time.
+        self._unit_variance=0.0
+        self._sum_weights=1.0
+        self._weighted_mean_x=0.0
+        self._sxx=0.0
+
+    def addSample(self,rtt,local_time,remote_time):
+        """
+        Add the min. RTT local / remote time pair of a time sync batch and
+        update the drift and offset model.
+        """
+        self.RTTs.append(rtt)
+        self.L_times.append(local_time)
+        self.R_times.append(remote_time)
+        self._fit()
+
+    def getSampleCount(self):
+        return len(self.L_times)
+
+    def _fit(self):
+        local=numpy.asarray(self.L_times,dtype=numpy.float64)
+        remote=numpy.asarray(self.R_times,dtype=numpy.float64)
+        rtt=numpy.asarray(self.RTTs,dtype=numpy.float64)
+        n=len(local)
+        if n==0:
+            return
+        # fitting the remote - local difference against the centred local
+        # time keeps the regression well conditioned for large time values.
+        self._ref=ref=local.mean()
+        x=local-ref
+        y=remote-local
+        if n<3 or x.ptp()<=0.0:
+            self._a=y[rtt.argmin()]
+            self._b=0.0
+            self._unit_variance=0.0
+            self._sum_weights=1.0
+            self._weighted_mean_x=0.0
+            self._sxx=0.0
+            return
+
+        rtt_weights=1.0/numpy.maximum(rtt,1.0e-6)**2
+        rtt_weights/=rtt_weights.max()
+        weights=rtt_weights
+        for i in xrange(self.robust_iterations+1):
+            sw=weights.sum()
+            xm=(weights*x).sum()/sw
+            ym=(weights*y).sum()/sw
+            sxx=(weights*(x-xm)**2).sum()
+            b=(weights*(x-xm)*(y-ym)).sum()/sxx
+            a=ym-b*xm
+            residuals=y-(a+b*x)
+            if i==self.robust_iterations:
+                break
+            # Huber weights, using the median absolute deviation as the scale.
+            scale=max(1.4826*numpy.median(numpy.abs(residuals-numpy.median(residuals))),1.0e-7)
+            u=numpy.abs(residuals)/(1.345*scale)
+            weights=rtt_weights*numpy.where(u<=1.0,1.0,1.0/numpy.maximum(u,1.0))
+
+        self._a=a
+        self._b=b
+        self._unit_variance=(weights*residuals**2).sum()/(n-2)
+        self._sum_weights=sw
+        self._weighted_mean_x=xm
+        self._sxx=sxx
+
     def getDrift(self):
         """
         Current drift between two time bases.
         """
-        return self.drifts.mean()
+        return 1.0+self._b
         
     def getOffset(self):
         """
-        Current offset between two time bases.
+        Current offset between two time bases, such that
+        remote_time = drift * local_time + offset.
         """
-        return self.offsets.mean()
+        return self._a-self._b*self._ref
 
     def getAccuracy(self):
         """
@@ -265,20 +346,48 @@ class TimeSyncState(object):
         average of the last 10 round trip time sync request - response delays
         divided by two.
         """
-        return self.RTTs.mean()/2.0
-        
+        if len(self.RTTs)==0:
+            return 0.0
+        return numpy.mean(list(self.RTTs)[-10:])/2.0
+
+    def getConversionError(self,local_time=None,include_rtt=True):
+        """
+        The accuracy bound (in sec.msec) of a time converted using the current
+        model: two standard errors of the fitted remote time at local_time,
+        plus (if include_rtt is True) half of the smallest RTT in the sync
+        window, the largest error that an asymmetric network delay can cause.
+
+        local_time can be a single time or a numpy array of times.
+        """
+        if local_time is None:
+            local_time=Computer.currentSec()
+        x=numpy.asarray(local_time,dtype=numpy.float64)-self._ref
+        variance=self._unit_variance/self._sum_weights
+        if self._sxx>0.0:
+            variance=variance+self._unit_variance*(x-self._weighted_mean_x)**2/self._sxx
+        error=2.0*numpy.sqrt(variance)
+        if include_rtt and len(self.RTTs):
+            error=error+min(self.RTTs)/2.0
+        return error
+
     def local2RemoteTime(self,local_time=None):
         """
         Converts a local time (sec.msec format) to the corresponding remote
         computer time, using the current offset and drift measures.
+        local_time can be a single time or a numpy array of times.
         """        
         if local_time is None:
             local_time=Computer.currentSec()
-        return self.getDrift()*local_time+self.getOffset()
+        if not isinstance(local_time,float):
+            local_time=numpy.asarray(local_time,dtype=numpy.float64)
+        return local_time+self._a+self._b*(local_time-self._ref)
           
     def remote2LocalTime(self,remote_time):
         """
         Converts a remote computer time (sec.msec format) to the corresponding local
-        time, using the current offset and drift measures.       
+        time, using the current offset and drift measures.
+        remote_time can be a single time or a numpy array of times.
         """
-        return (remote_time-self.getOffset())/self.getDrift()
\ No newline at end of file
+        if not isinstance(remote_time,float):
+            remote_time=numpy.asarray(remote_time,dtype=numpy.float64)
+        return (remote_time-self._a+self._b*self._ref)/(1.0+self._b)
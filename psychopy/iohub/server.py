@@ -15,10 +15,15 @@ from gevent import Greenlet
 import os,sys
 from operator import itemgetter
 from collections import deque
+from weakref import proxy
+from bisect import bisect_right
+from itertools import islice
 import psychopy.iohub
 from psychopy.iohub import OrderedDict,print2err, printExceptionDetailsToStdErr, ioHubError, createErrorResult,convertCamelToSnake, DeviceConstants,EventConstants,Computer, DeviceEvent, import_device, IO_HUB_DIRECTORY, load, dump, Loader, Dumper
+from psychopy.iohub.devices import DeviceEventBuffer
 from psychopy.iohub.devices.deviceConfigValidation import validateDeviceConfiguration
 from psychopy.iohub.net import MAX_PACKET_SIZE
+from psychopy.iohub.shmem import SharedEventBufferWriter
 currentSec= Computer.currentSec
 
 import json
@@ -57,7 +62,15 @@ class udpServer(DatagramServer):
                 self.sendResponse(["PING_BACK",ctime,msg_id,payload,replyTo],replyTo)
                 return True
         elif request_type == 'GET_EVENTS':
-            return self.handleGetEvents(replyTo)
+            return self.handleGetEvents(request,replyTo)
+        elif request_type == 'GET_STATS':
+            return self.handleGetStats(request,replyTo)
+        elif request_type == 'REGISTER_EVENT_CLIENT':
+            return self.handleRegisterEventClient(request,replyTo)
+        elif request_type == 'UNREGISTER_EVENT_CLIENT':
+            self.iohub.eventLog.removeClient(replyTo)
+            self.sendResponse(('UNREGISTER_EVENT_CLIENT_RESULT',True),replyTo)
+            return True
         elif request_type == 'EXP_DEVICE':
             return self.handleExperimentDeviceRequest(request,replyTo)
         elif request_type == 'RPC':
@@ -121,13 +134,20 @@ class udpServer(DatagramServer):
                                 replyTo)
             return False
             
-    def handleGetEvents(self,replyTo):
+    def handleGetEvents(self,request,replyTo):
+        event_log=self.iohub.eventLog
+        if event_log.hasClient(replyTo) or event_log.wasUnregistered(replyTo):
+            return self.handleGetClientEvents(replyTo)
         try:
-            currentEvents=list(self.iohub.eventBuffer)
-            self.iohub.eventBuffer.clear()
+            # optional filters: [event_types, start_time, end_time]
+            event_types,start_time,end_time=(list(request)+[None,None,None])[:3]
+            filtered=event_types is not None or start_time is not None or end_time is not None
+            currentEvents=self.iohub.eventBuffer.getEvents(event_types,start_time,end_time)
+            if self.iohub.sharedEventBuffer:
+                self.iohub.sharedEventBuffer.setUDPEventCount(len(self.iohub.eventBuffer) if filtered else 0)
 
             if len(currentEvents)>0:
-                currentEvents=sorted(currentEvents, key=itemgetter(DeviceEvent.EVENT_HUB_TIME_INDEX))
+                self.iohub.recordDeliveryLatency(currentEvents)
                 self.sendResponse(('GET_EVENTS_RESULT',currentEvents),replyTo)
             else:
                 self.sendResponse(('GET_EVENTS_RESULT', None),replyTo)
@@ -139,6 +159,56 @@ class udpServer(DatagramServer):
                                 replyTo)
             return False
 
+    def handleGetClientEvents(self,replyTo):
+        event_log=self.iohub.eventLog
+        if event_log.wasUnregistered(replyTo):
+            self.sendResponse(createErrorResult('IOHUB_EVENT_CLIENT_UNREGISTERED',
+                                    msg="The event client fell more than log_length events behind and was unregistered by the ioHub Server",
+                                    drop_policy=event_log.drop_policy,
+                                    log_length=event_log.log_length),
+                                replyTo)
+            return False
+        try:
+            currentEvents=event_log.getEvents(replyTo)
+            # event clients are also sent their lost event count.
+            self.sendResponse(('GET_EVENTS_RESULT',currentEvents or None,event_log.getLostCount(replyTo)),replyTo)
+            return True
+        except Exception,e:
+            self.sendResponse(createErrorResult('IOHUB_GET_EVENTS_ERROR',
+                                    msg="An error occurred while events were being retrived from the ioHub Server",
+                                    exception=str(e)),
+                                replyTo)
+            return False
+
+    def handleRegisterEventClient(self,request,replyTo):
+        try:
+            # optional: [event_types], the event type ids the client wants.
+            event_types=(list(request)+[None])[0]
+            self.iohub.eventLog.addClient(replyTo,event_types)
+            # the client imports the device classes to convert events.
+            self.sendResponse(('REGISTER_EVENT_CLIENT_RESULT',self.iohub.deviceClassPaths),replyTo)
+            return True
+        except Exception,e:
+            self.sendResponse(createErrorResult('IOHUB_REGISTER_EVENT_CLIENT_ERROR',
+                                    msg="An error occurred while registering an event client with the ioHub Server",
+                                    exception=str(e)),
+                                replyTo)
+            return False
+
+    def handleGetStats(self,request,replyTo):
+        try:
+            # optional: [reset], if True the latency histograms are cleared
+            # after being read.
+            reset=(list(request)+[False])[0]
+            self.sendResponse(('GET_STATS_RESULT',self.iohub.getStats(reset is True)),replyTo)
+            return True
+        except Exception,e:
+            self.sendResponse(createErrorResult('IOHUB_GET_STATS_ERROR',
+                                    msg="An error occurred while the ioHub Server statistics were being collected",
+                                    exception=str(e)),
+                                replyTo)
+            return False
+
     def handleExperimentDeviceRequest(self,request,replyTo):
         request_type= request.pop(0)
         if request_type == 'EVENT_TX':
@@ -147,6 +217,13 @@ class udpServer(DatagramServer):
                 ioServer.deviceDict['Experiment']._nativeEventCallback(eventAsTuple)
             self.sendResponse(('EVENT_TX_RESULT',len(exp_events)),replyTo)
             return True
+        elif request_type == 'EVENT_TX_NR':
+            # batched MessageEvents from ioHubConnection.flushMessages(); the
+            # client does not wait for a reply, so none is sent.
+            exp_events=request.pop(0)
+            for eventAsTuple in exp_events:
+                ioServer.deviceDict['Experiment']._nativeEventCallback(eventAsTuple)
+            return True
         elif request_type == 'DEV_RPC':
             dclass=request.pop(0)
             dmethod=request.pop(0)
@@ -362,6 +439,14 @@ class udpServer(DatagramServer):
     def clearEventBuffer(self):
         return self.iohub.clearEventBuffer()
 
+    def getSharedEventBufferPath(self):
+        if self.iohub.sharedEventBuffer:
+            return self.iohub.sharedEventBuffer.directory
+        return None
+
+    def disableSharedEventBuffer(self):
+        self.iohub.disableSharedEventBuffer()
+
     def enableHighPriority(self,disable_gc=True):
         Computer.enableHighPriority(disable_gc)
 
@@ -374,9 +459,12 @@ class udpServer(DatagramServer):
     def setProcessAffinity(self, processorList):
         return Computer.setCurrentProcessAffinity(processorList)
 
+    def getDevicePollingStats(self):
+        return self.iohub.pollScheduler.getStats()
+
     def flushIODataStoreFile(self):
         if self.iohub.emrt_file:
-            self.iohub.emrt_file.emrtFile.flush()
+            self.iohub.emrt_file.flush()
             return True
         return False
 
@@ -391,20 +479,298 @@ class udpServer(DatagramServer):
             printExceptionDetailsToStdErr()
             sys.exit(1)
 
-class DeviceMonitor(Greenlet):
-    def __init__(self, device,sleep_interval):
+class ClientEventLog(object):
+    """
+    Bounded log of the events received by the ioHub Server, read by the event
+    clients registered with a REGISTER_EVENT_CLIENT request (for example an
+    online monitoring display running beside the experiment). Each client is
+    identified by its address, and has its own read position and event type
+    filter, so clients never take events from each other, or from the
+    experiment process, which keeps using the global event buffer.
+
+    Events are kept until every client has read them, so memory use depends
+    on the slowest client, up to log_length events. When a new event is added
+    to a full log, drop_policy decides what happens to the clients that have
+    not read the oldest event yet:
+        * 'drop_oldest': the oldest event is dropped; it is counted in the lost_count of each of those clients it was not filtered out for.
+        * 'unregister': those clients are unregistered, and get an error on their next GET_EVENTS request.
+    Events are not logged while no clients are registered.
+    """
+    DROP_POLICIES=('drop_oldest','unregister')
+
+    def __init__(self,log_length=8192,drop_policy='drop_oldest'):
+        if drop_policy not in self.DROP_POLICIES:
+            raise ioHubError("event_clients drop_policy must be one of %s, not %s"%(self.DROP_POLICIES,drop_policy))
+        self.log_length=max(1,log_length)
+        self.drop_policy=drop_policy
+        self._events=deque()
+        # log index of self._events[0]
+        self._first_index=0
+        self._clients=dict()
+        self._unregistered=set()
+
+    def __len__(self):
+        return len(self._events)
+
+    def addClient(self,client_id,event_types=None):
+        """
+        Register client_id. The client gets the events logged from now on,
+        only of the given event type ids if event_types is given.
+        """
+        if event_types:
+            event_types=frozenset(event_types)
+        self._clients[client_id]=dict(next_index=self._first_index+len(self._events),
+                                      event_types=event_types or None,
+                                      read_count=0,
+                                      lost_count=0)
+        self._unregistered.discard(client_id)
+
+    def removeClient(self,client_id):
+        self._unregistered.discard(client_id)
+        if self._clients.pop(client_id,None) is not None:
+            self._trim()
+
+    def hasClient(self,client_id):
+        return client_id in self._clients
+
+    def wasUnregistered(self,client_id):
+        """
+        True if client_id was unregistered because of the 'unregister'
+        drop_policy, and has not registered again since.
+        """
+        return client_id in self._unregistered
+
+    def append(self,event):
+        if not self._clients:
+            return
+        self._events.append(event)
+        if len(self._events)>self.log_length:
+            self._dropOldest()
+
+    def getEvents(self,client_id):
+        """
+        Return the events client_id has not read yet that pass its event type
+        filter, oldest first, and move its read position to the end of the log.
+        """
+        client=self._clients[client_id]
+        events=islice(self._events,client['next_index']-self._first_index,None)
+        event_types=client['event_types']
+        if event_types:
+            type_index=DeviceEvent.EVENT_TYPE_ID_INDEX
+            events=[e for e in events if e[type_index] in event_types]
+        else:
+            events=list(events)
+        client['next_index']=self._first_index+len(self._events)
+        client['read_count']+=len(events)
+        self._trim()
+        return events
+
+    def getLostCount(self,client_id):
+        return self._clients[client_id]['lost_count']
+
+    def getStats(self):
+        """
+        Returns a dict of 'host:port' -> read_count, lost_count and
+        backlog (unread events, before filtering) for each registered client.
+        """
+        end_index=self._first_index+len(self._events)
+        stats=dict()
+        for client_id,client in self._clients.iteritems():
+            stats['%s:%s'%tuple(client_id[:2])]=dict(read_count=client['read_count'],
+                                                    lost_count=client['lost_count'],
+                                                    backlog=end_index-client['next_index'])
+        return stats
+
+    def _dropOldest(self):
+        oldest=self._events[0]
+        type_index=DeviceEvent.EVENT_TYPE_ID_INDEX
+        for client_id,client in self._clients.items():
+            if client['next_index']>self._first_index:
+                continue
+            if self.drop_policy=='unregister':
+                del self._clients[client_id]
+                self._unregistered.add(client_id)
+            else:
+                client['next_index']+=1
+                if client['event_types'] is None or oldest[type_index] in client['event_types']:
+                    client['lost_count']+=1
+        self._events.popleft()
+        self._first_index+=1
+        self._trim()
+
+    def _trim(self):
+        # removes the events every client has read.
+        if self._clients:
+            read_count=min(c['next_index'] for c in self._clients.itervalues())-self._first_index
+        else:
+            read_count=len(self._events)
+        for i in xrange(read_count):
+            self._events.popleft()
+        self._first_index+=read_count
+
+class DurationHistogram(object):
+    """
+    Counts sec.msec durations in fixed, roughly log spaced bins so that
+    latencies can be tracked for every event without keeping the durations.
+    BIN_EDGES gives the msec lower edge of each bin; the last bin counts all
+    durations >= its edge. Negative durations are counted in the first bin.
+    """
+    BIN_EDGES=(0.0,0.1,0.25,0.5,1.0,2.0,4.0,8.0,16.0,32.0,64.0,128.0,256.0)
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts=[0]*len(self.BIN_EDGES)
+        self.count=0
+        self.total=0.0
+        self.min=None
+        self.max=None
+
+    def add(self,duration):
+        msec=duration*1000.0
+        self.counts[max(0,bisect_right(self.BIN_EDGES,msec)-1)]+=1
+        self.count+=1
+        self.total+=msec
+        if self.min is None or msec<self.min:
+            self.min=msec
+        if self.max is None or msec>self.max:
+            self.max=msec
+
+    def getStats(self):
+        """
+        Returns a dict with the bin_edges and counts of the histogram, and the
+        count, mean, min and max of the durations added. Times are in msec.
+        """
+        mean=None
+        if self.count:
+            mean=self.total/self.count
+        return dict(bin_edges=list(self.BIN_EDGES),counts=list(self.counts),
+                    count=self.count,mean=mean,min=self.min,max=self.max)
+
+class PolledDeviceState(object):
+    """
+    Polling interval and statistics for one device polled by the
+    DevicePollScheduler.
+    """
+    # consecutive empty polls before the poll interval is increased.
+    EMPTY_POLLS_BEFORE_BACKOFF=4
+    BACKOFF_FACTOR=1.5
+
+    def __init__(self,device,min_interval,max_interval):
+        self.device=device
+        self.min_interval=min_interval
+        self.max_interval=max(min_interval,max_interval)
+        self.interval=min_interval
+        self.next_poll_time=0.0
+        self.poll_count=0
+        self.empty_poll_count=0
+        self.event_count=0
+        self.buffer_high_water=0
+        self._empty_streak=0
+
+    def poll(self,poll_time):
+        device=self.device
+        native_buffer=getattr(device,'_native_event_buffer',None)
+        buffered=len(native_buffer) if native_buffer is not None else 0
+        dropped=getattr(device,'_native_events_dropped',0)
+        device._poll()
+        new_events=0
+        if native_buffer is not None:
+            after=len(native_buffer)
+            # once the native buffer is full its length stops changing, so
+            # also count the events it dropped to make room for new ones.
+            dropped=getattr(device,'_native_events_dropped',0)-dropped
+            new_events=max(0,after-buffered)+dropped
+            if after>self.buffer_high_water:
+                self.buffer_high_water=after
+
+        self.poll_count+=1
+        if new_events:
+            self.event_count+=new_events
+            self._empty_streak=0
+            # go back to polling as fast as allowed as soon as events arrive,
+            # or if the native buffer is getting full.
+            capacity=getattr(native_buffer,'maxlen',None)
+            if new_events>1 or (capacity and len(native_buffer)*2>=capacity):
+                self.interval=self.min_interval
+            else:
+                self.interval=max(self.min_interval,self.interval/2.0)
+        else:
+            self.empty_poll_count+=1
+            self._empty_streak+=1
+            if self._empty_streak>=self.EMPTY_POLLS_BEFORE_BACKOFF:
+                self.interval=min(self.max_interval,self.interval*self.BACKOFF_FACTOR)
+        self.next_poll_time=poll_time+self.interval
+        return new_events
+
+    def getStats(self):
+        native_buffer=getattr(self.device,'_native_event_buffer',None)
+        return dict(poll_count=self.poll_count,
+                    event_count=self.event_count,
+                    empty_poll_count=self.empty_poll_count,
+                    empty_poll_ratio=self.empty_poll_count/float(self.poll_count) if self.poll_count else 0.0,
+                    poll_interval=self.interval,
+                    min_interval=self.min_interval,
+                    max_interval=self.max_interval,
+                    buffer_high_water=self.buffer_high_water,
+                    buffer_length=getattr(native_buffer,'maxlen',None))
+
+class DevicePollScheduler(Greenlet):
+    """
+    Polls every device that needs polling from a single greenlet. Each
+    device's poll interval adapts to its event rate: it drops towards
+    min_interval when a poll returns events (straight to min_interval if more
+    than one event was read or the device's native event buffer is half
+    full), and grows towards max_interval after several empty polls in a row.
+
+    When a poll returns events, the ioServer processes device events right
+    away instead of waiting for its processDeviceEvents loop.
+    """
+    def __init__(self,server):
         Greenlet.__init__(self)
-        self.device = device
-        self.sleep_interval=sleep_interval
+        self._server=proxy(server)
+        self._device_states=[]
         self.running=False
-        
+
+    def addDevice(self,device,min_interval,max_interval=None):
+        if max_interval is None:
+            max_interval=min_interval
+        self._device_states.append(PolledDeviceState(device,min_interval,max_interval))
+
+    def getStats(self):
+        """
+        Returns a dict of device name -> polling statistics: poll_count,
+        event_count, empty_poll_count, empty_poll_ratio, poll_interval
+        (current), min_interval, max_interval, buffer_high_water (the most
+        events seen in the device's native event buffer after a poll) and
+        buffer_length (the native event buffer's event_buffer_length).
+        """
+        stats=dict()
+        for ds in self._device_states:
+            name=getattr(ds.device,'name',None) or ds.device.__class__.__name__
+            stats[name]=ds.getStats()
+        return stats
+
     def _run(self):
         self.running = True
         ctime=Computer.currentSec
         while self.running is True:
-            stime=ctime()
-            self.device._poll()
-            i=self.sleep_interval-(ctime()-stime)
+            now=ctime()
+            next_poll_time=now+0.01
+            new_events=0
+            for ds in self._device_states:
+                if ds.next_poll_time<=now:
+                    try:
+                        new_events+=ds.poll(now)
+                    except:
+                        printExceptionDetailsToStdErr()
+                        ds.next_poll_time=now+ds.interval
+                if ds.next_poll_time<next_poll_time:
+                    next_poll_time=ds.next_poll_time
+            if new_events:
+                self._server._processDeviceEventIteration()
+            i=next_poll_time-ctime()
             if i > 0.0:
                 gevent.sleep(i)
             else:
@@ -412,6 +778,7 @@ class DeviceMonitor(Greenlet):
 
 class ioServer(object):
     eventBuffer=None
+    sharedEventBuffer=None
     deviceDict={}
     _logMessageBuffer=deque(maxlen=128)
     def __init__(self, rootScriptPathDir, config=None):
@@ -424,14 +791,34 @@ class ioServer(object):
         self.emrt_file=None
         self.config=config
         self.devices=[]
-        self.deviceMonitors=[]
+        # (device name, device module path, device class name) of each device.
+        self.deviceClassPaths=[]
+        self.pollScheduler=DevicePollScheduler(self)
+        self.deviceMonitors=[self.pollScheduler]
+        self.deviceLatency=DurationHistogram()
+        self.deliveryLatency=DurationHistogram()
+        self.iterationDuration=DurationHistogram()
+        self._statsResetTime=currentSec()
         self.sessionInfoDict=None
         self.experimentInfoList=None
         self.filterLookupByInput={}
         self.filterLookupByOutput={}
         self.filterLookupByName={}  
         self._hookDevice=None
-        ioServer.eventBuffer=deque(maxlen=config.get('global_event_buffer',2048))
+        ioServer.eventBuffer=DeviceEventBuffer(maxlen=config.get('global_event_buffer',2048))
+        event_clients_config=config.get('event_clients',{})
+        self.eventLog=ClientEventLog(event_clients_config.get('log_length',8192),
+                                     event_clients_config.get('drop_policy','drop_oldest'))
+
+        shared_events_config=config.get('shared_memory_events',{})
+        if shared_events_config.get('enable',False):
+            try:
+                self.sharedEventBuffer=SharedEventBufferWriter(EventConstants.getClass,
+                                                               shared_events_config.get('ring_length',4096))
+                self.log("Shared memory event buffers created in: %s"%(self.sharedEventBuffer.directory))
+            except:
+                print2err("Error creating shared memory event buffers, using UDP for events ....")
+                printExceptionDetailsToStdErr()
 
         self._running=True
         
@@ -449,6 +836,19 @@ class ioServer(object):
                 for default_key,default_value in default_datastore_config.iteritems():
                     if default_key not in experiment_datastore_config:
                         experiment_datastore_config[default_key]=default_value
+                    elif default_key == 'event_table_settings':
+                        # settings given for an event table only replace
+                        # the matching default settings for the table. A
+                        # 'default' given by the experiment is used instead
+                        # of the per table defaults.
+                        table_settings=experiment_datastore_config[default_key] or {}
+                        for table_label,default_table_settings in default_value.iteritems():
+                            if table_label!='default' and 'default' in table_settings:
+                                continue
+                            merged_settings=dict(default_table_settings or {})
+                            merged_settings.update(table_settings.get(table_label) or {})
+                            table_settings[table_label]=merged_settings
+                        experiment_datastore_config[default_key]=table_settings
                                 
                 if experiment_datastore_config.get('enable', True):
                     #print2err("Creating ioDataStore....")
@@ -609,8 +1009,7 @@ class ioServer(object):
         
                     #print2err("Creating pyHook Monitor......")
                     self._hookDevice=pyHookDevice()
-                    hookMonitor=DeviceMonitor(self._hookDevice,0.00375)
-                    self.deviceMonitors.append(hookMonitor)
+                    self.pollScheduler.addDevice(self._hookDevice,0.00375)
                 
                     #print2err("Created pyHook Monitor.")
                 else:
@@ -680,15 +1079,13 @@ class ioServer(object):
                     
                 if  device_class_name == 'Mouse' and 'Mouse' not in self._hookDevice:
                     #print2err("Hooking OSX Mouse.....")
-                    mouseHookMonitor=DeviceMonitor(deviceDict['Mouse'],0.004)
-                    self.deviceMonitors.append(mouseHookMonitor)
+                    self.pollScheduler.addDevice(deviceDict['Mouse'],0.004)
                     deviceDict['Mouse']._CGEventTapEnable(deviceDict['Mouse']._tap, True)
                     self._hookDevice.append('Mouse')
                     #print2err("Done Hooking OSX Mouse.....")
                 if device_class_name == 'Keyboard'  and 'Keyboard' not in self._hookDevice:
                     #print2err("Hooking OSX Keyboard.....")
-                    kbHookMonitor=DeviceMonitor(deviceDict['Keyboard'],0.004)
-                    self.deviceMonitors.append(kbHookMonitor)
+                    self.pollScheduler.addDevice(deviceDict['Keyboard'],0.004)
                     deviceDict['Keyboard']._CGEventTapEnable(deviceDict['Keyboard']._tap, True)
                     self._hookDevice.append('Keyboard')
                     #print2err("DONE Hooking OSX Keyboard.....")
@@ -760,12 +1157,19 @@ class ioServer(object):
 
             self.devices.append(deviceInstance)
             ioServer.deviceDict[device_class_name]=deviceInstance
+            self.deviceClassPaths.append((deviceInstance.name,device_module_path,device_class_name))
 
             if 'device_timer' in device_config:
-                interval = device_config['device_timer']['interval']
-                self.log("%s has requested a timer with period %.5f"%(device_class_name, interval))
-                dPoller=DeviceMonitor(deviceInstance,interval)
-                self.deviceMonitors.append(dPoller)
+                device_timer=device_config['device_timer']
+                interval = device_timer['interval']
+                # the poll interval adapts between min_interval and
+                # max_interval, both interval by default; a larger
+                # max_interval saves CPU when the device is idle but delays
+                # the first event after an idle period by up to max_interval.
+                min_interval=device_timer.get('min_interval',interval)
+                max_interval=device_timer.get('max_interval',max(min_interval,interval))
+                self.log("%s has requested a timer with period %.5f (adaptive range %.5f - %.5f)"%(device_class_name, interval, min_interval, max_interval))
+                self.pollScheduler.addDevice(deviceInstance,min_interval,max_interval)
 
             monitoringEventIDs=[]
             monitor_events_list=device_config.get('monitor_event_types',[])
@@ -827,15 +1231,21 @@ class ioServer(object):
             gevent.sleep(sleep_interval)
 
     def _processDeviceEventIteration(self):
+        stime=currentSec()
+        event_count=0
         for device in self.devices:
             try:
                 events=device._getNativeEventBuffer()
                 #if events and len(events)>0:
                 #    ioHub.print2err("_processDeviceEventIteration.....", device._event_listeners)
+                if len(events)==0:
+                    continue
                 while len(events)>0:
                     evt=events.popleft()
                     e=device._getIOHubEventObject(evt)
                     if e is not None:
+                        event_count+=1
+                        self.deviceLatency.add(e[DeviceEvent.EVENT_LOGGED_TIME_INDEX]-e[DeviceEvent.EVENT_HUB_TIME_INDEX])
                         for l in device._getEventListeners(e[DeviceEvent.EVENT_TYPE_ID_INDEX]):
                             l._handleEvent(e)
             except:
@@ -843,15 +1253,89 @@ class ioServer(object):
                 print2err("Error in processDeviceEvents: ", device, " : ", len(events), " : ", e)
                 print2err("Event type ID: ",e[DeviceEvent.EVENT_TYPE_ID_INDEX], " : " , EventConstants.getName(e[DeviceEvent.EVENT_TYPE_ID_INDEX]))
                 print2err("--------------------------------------")
+        # iterations that found no events are not counted, so the histogram
+        # shows the cost of processing events.
+        if event_count:
+            self.iterationDuration.add(currentSec()-stime)
 
     def _handleEvent(self,event):
+        self.eventLog.append(event)
+        if self.sharedEventBuffer:
+            if self.sharedEventBuffer.write(event):
+                self.deliveryLatency.add(currentSec()-event[DeviceEvent.EVENT_LOGGED_TIME_INDEX])
+                return
+            # event could not be packed, so it is sent using GET_EVENTS
+            self.eventBuffer.append(event)
+            self.sharedEventBuffer.setUDPEventCount(len(self.eventBuffer))
+            return
         self.eventBuffer.append(event)
 
+    def recordDeliveryLatency(self,events):
+        ctime=currentSec()
+        for e in events:
+            self.deliveryLatency.add(ctime-e[DeviceEvent.EVENT_LOGGED_TIME_INDEX])
+
+    def getStats(self,reset=False):
+        """
+        Returns a dict of ioHub Server performance statistics:
+
+        * device_latency: DurationHistogram stats of the msec between an event's hub time and its logged time (when the ioHub Server received it).
+        * delivery_latency: DurationHistogram stats of the msec between the ioHub Server receiving an event (its logged time) and the event being sent to the experiment process in a GET_EVENTS reply, or written to the shared memory event buffers.
+        * iteration_duration: DurationHistogram stats of the msec taken by each _processDeviceEventIteration that processed events.
+        * buffer_overflows: events dropped because a buffer was full, for the global_event_buffer and for each device's native_event_buffer.
+        * buffer_lengths: events currently in the global_event_buffer and in each device's native_event_buffer.
+        * datastore: the ioDataStore getWriteStats(), or None if the ioDataStore is not enabled.
+        * device_polling: the DevicePollScheduler getStats().
+        * event_clients: the ClientEventLog getStats().
+
+        time is the ioHub time the stats were collected, and period the sec.msec
+        since the histograms were last reset. If reset is True, the histograms
+        are cleared after being read. Overflow counts are not reset.
+        """
+        ctime=currentSec()
+        device_overflows=dict()
+        device_lengths=dict()
+        for device in self.devices:
+            name=getattr(device,'name',None) or device.__class__.__name__
+            device_overflows[name]=device._native_events_dropped
+            device_lengths[name]=len(device._getNativeEventBuffer())
+
+        stats=dict(time=ctime,
+                   period=ctime-self._statsResetTime,
+                   device_latency=self.deviceLatency.getStats(),
+                   delivery_latency=self.deliveryLatency.getStats(),
+                   iteration_duration=self.iterationDuration.getStats(),
+                   buffer_overflows=dict(global_event_buffer=self.eventBuffer.dropped_count,
+                                         native_event_buffer=device_overflows),
+                   buffer_lengths=dict(global_event_buffer=len(self.eventBuffer),
+                                       native_event_buffer=device_lengths),
+                   datastore=None,
+                   device_polling=self.pollScheduler.getStats(),
+                   event_clients=self.eventLog.getStats())
+        if self.emrt_file:
+            stats['datastore']=self.emrt_file.getWriteStats()
+
+        if reset:
+            self.deviceLatency.reset()
+            self.deliveryLatency.reset()
+            self.iterationDuration.reset()
+            self._statsResetTime=ctime
+        return stats
+
     def clearEventBuffer(self):
         l= len(self.eventBuffer)
         self.eventBuffer.clear()
+        if self.sharedEventBuffer:
+            self.sharedEventBuffer.setUDPEventCount(0)
         return l
 
+    def disableSharedEventBuffer(self):
+        # used when the ioHubConnection could not attach to the ring buffers,
+        # so that all events go to the global event buffer again.
+        if self.sharedEventBuffer:
+            self.sharedEventBuffer.close()
+            self.sharedEventBuffer=None
+
     def shutdown(self):
         try:
             self._running=False
@@ -865,6 +1349,7 @@ class ioServer(object):
                 m.running=False
             if self.eventBuffer:
                 self.clearEventBuffer()
+            self.disableSharedEventBuffer()
             try:
                 self.closeDataStoreFile()
             except:
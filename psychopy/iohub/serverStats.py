@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+ioHub
+.. file: ioHub/serverStats.py
+
+Prints the performance statistics of a running ioHub Server, as returned by
+ioHubConnection.getServerStats(), every few seconds until ctrl-c is pressed.
+Each dump covers the time since the previous one.
+
+Usage:
+    python serverStats.py [udp_port [interval]] [--json] [--reset]
+
+udp_port is the ioHub Server udp_port setting (default 9034) and interval the
+sec.msec between dumps (default 2.0). With --json, each dump is printed as one
+line of JSON instead of as tables.
+
+By default the latency and loop time histograms are read without resetting
+them, and the counts for each dump are the difference from the previous read,
+so an experiment calling ioHubConnection.getServerStats() at the same time is
+not affected. The min and max of each period are not known that way, so are
+not shown. With --reset, the histograms are reset by every dump instead, which
+gives the min and max, but also resets them for any other client.
+
+Distributed under the terms of the GNU General Public License (GPL version 3 or any later version).
+"""
+import sys, time, json
+from psychopy.iohub.net import UDPClientConnection
+
+HISTOGRAMS=['device_latency','delivery_latency','iteration_duration']
+
+def getServerStats(udp_client,reset=False):
+    udp_client.sendTo(('GET_STATS',reset))
+    result,address=udp_client.receive()
+    if result[0] != 'GET_STATS_RESULT':
+        raise RuntimeError("ioHub Server error reply: %s"%(str(result)))
+    return result[1]
+
+def histogramDifference(hist,previous):
+    """
+    Returns the part of histogram hist added since previous, an earlier read
+    of the same histogram. min and max are None as they can't be worked out.
+    """
+    if hist['count']<previous['count']:
+        # the histogram has been reset since, so it only holds new times.
+        return dict(hist,min=None,max=None)
+    count=hist['count']-previous['count']
+    mean=None
+    if count:
+        mean=(hist['mean']*hist['count']-(previous['mean'] or 0.0)*previous['count'])/count
+    return dict(bin_edges=hist['bin_edges'],
+                counts=[c-p for c,p in zip(hist['counts'],previous['counts'])],
+                count=count,mean=mean,min=None,max=None)
+
+def statsDifference(stats,previous):
+    """
+    Returns stats with the histograms and period covering only the time since
+    previous was read.
+    """
+    diff=dict(stats)
+    diff['period']=stats['time']-previous['time']
+    for key in HISTOGRAMS:
+        diff[key]=histogramDifference(stats[key],previous[key])
+    return diff
+
+def formatMsec(value):
+    if value is None:
+        return '{0:>9s}'.format('-')
+    return '{0:>9.3f}'.format(value)
+
+def formatHistogram(label,hist):
+    if hist['count']==0:
+        return '{0:<20s} {1:>8d}'.format(label,0)
+    lines=['{0:<20s} {1:>8d} {2} {3} {4}'.format(label,hist['count'],formatMsec(hist['mean']),formatMsec(hist['min']),formatMsec(hist['max']))]
+    edges=hist['bin_edges']
+    for i,c in enumerate(hist['counts']):
+        if c:
+            upper='%g'%(edges[i+1]) if i+1<len(edges) else 'inf'
+            lines.append('    [{0:>6g}, {1:>6s}) msec {2:>8d} {3:>6.1f}%'.format(edges[i],upper,c,c*100.0/hist['count']))
+    return '\n'.join(lines)
+
+def printStats(stats):
+    print
+    print 'ioHub time %.3f, stats for the last %.3f sec.'%(stats['time'],stats['period'])
+    print '{0:<20s} {1:>8s} {2:>9s} {3:>9s} {4:>9s}'.format('msec','count','mean','min','max')
+    print formatHistogram('device -> hub',stats['device_latency'])
+    print formatHistogram('hub -> client',stats['delivery_latency'])
+    print formatHistogram('event loop',stats['iteration_duration'])
+
+    overflows=stats['buffer_overflows']
+    lengths=stats['buffer_lengths']
+    print '{0:<30s} {1:>10s} {2:>10s}'.format('Buffer','events','dropped')
+    print '{0:<30s} {1:>10d} {2:>10d}'.format('global event buffer',lengths['global_event_buffer'],overflows['global_event_buffer'])
+    for name in sorted(overflows['native_event_buffer']):
+        print '{0:<30s} {1:>10d} {2:>10d}'.format(name,lengths['native_event_buffer'].get(name,0),overflows['native_event_buffer'][name])
+
+    polling=stats['device_polling']
+    if polling:
+        print '{0:<30s} {1:>10s} {2:>10s} {3:>12s}'.format('Polled device','polls','events','interval ms')
+        for name in sorted(polling):
+            p=polling[name]
+            print '{0:<30s} {1:>10d} {2:>10d} {3:>12.2f}'.format(name,p['poll_count'],p['event_count'],p['poll_interval']*1000.0)
+
+    event_clients=stats['event_clients']
+    if event_clients:
+        print '{0:<30s} {1:>10s} {2:>10s} {3:>10s}'.format('Event client','read','lost','backlog')
+        for client_id in sorted(event_clients):
+            c=event_clients[client_id]
+            print '{0:<30s} {1:>10d} {2:>10d} {3:>10d}'.format(client_id,c['read_count'],c['lost_count'],c['backlog'])
+
+    datastore=stats['datastore']
+    if datastore:
+        print 'DataStore: %d events written, %.0f events / sec while writing, %d staged, %d blocks queued.'%(
+                datastore['written_event_count'],datastore['write_rate'],datastore['staged_event_count'],datastore['queued_block_count'])
+
+if __name__ == '__main__':
+    args=[a for a in sys.argv[1:] if not a.startswith('--')]
+    as_json='--json' in sys.argv[1:]
+    reset='--reset' in sys.argv[1:]
+    udp_port=int(args[0]) if len(args)>0 else 9034
+    interval=float(args[1]) if len(args)>1 else 2.0
+
+    udp_client=UDPClientConnection(remote_port=udp_port)
+    udp_client.sock.settimeout(5.0)
+    try:
+        # the first dump covers the time from this read.
+        previous=getServerStats(udp_client,reset)
+        while True:
+            time.sleep(interval)
+            stats=getServerStats(udp_client,reset)
+            if not reset:
+                stats,previous=statsDifference(stats,previous),stats
+            if as_json:
+                print json.dumps(stats)
+            else:
+                printStats(stats)
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        udp_client.close()
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""
+ioHub
+.. file: ioHub/shmem.py
+
+Copyright (C) 2012-2013 iSolver Software Solutions
+Distributed under the terms of the GNU General Public License (GPL version 3 or any later version).
+
+.. moduleauthor:: Sol Simpson <sol@isolver-software.com> + contributors, please see credits section of documentation.
+.. fileauthor:: Sol Simpson <sol@isolver-software.com>
+
+Shared memory event transport between the ioHub Process and the PsychoPy
+Process.
+
+When enabled (shared_memory_events: enable: True in the iohub config), the
+ioHub Process writes each event that would be added to the global event buffer
+into a memory mapped ring buffer for the event's type, as a fixed size record
+using the event class NUMPY_DTYPE. The PsychoPy Process reads the ring buffers
+directly, so getEvents() does not need a GET_EVENTS UDP request / reply for
+every call. UDP is still used for all other requests.
+
+Each ring buffer has a single writer (the ioHub Process) and a single reader
+(the ioHubConnection). The writer never blocks; if the reader falls
+ring_length events behind for a given event type, the oldest events are
+overwritten, just like the global event buffer deque does when it is full.
+The number of events lost this way is counted by the reader.
+
+Events that can not be packed into the fixed size record (for example a
+MessageEvent with non ascii text) are put into the standard global event buffer
+instead, and are retrieved over UDP the next time getEvents() is called.
+"""
+
+import os
+import shutil
+import tempfile
+from operator import itemgetter
+import numpy as N
+
+# index of the event type id and ioHub time in an event list
+# (see DeviceEvent.EVENT_TYPE_ID_INDEX and DeviceEvent.EVENT_HUB_TIME_INDEX)
+EVENT_TYPE_ID_INDEX=4
+EVENT_HUB_TIME_INDEX=7
+
+SHMEM_MAGIC=0x694f4875625368
+# ring buffer file header fields (uint64)
+RING_MAGIC_INDEX=0
+RING_RECORD_SIZE_INDEX=1
+RING_LENGTH_INDEX=2
+RING_WRITE_COUNT_INDEX=3
+RING_EVENT_TYPE_INDEX=4
+RING_HEADER_LENGTH=8
+# control file fields (uint64). The control file also has one flag
+# per event type id, set when the ring buffer for that type has been created.
+CONTROL_MAGIC_INDEX=0
+CONTROL_RING_COUNT_INDEX=1
+CONTROL_UDP_EVENT_COUNT_INDEX=2
+CONTROL_HEADER_LENGTH=8
+MAX_EVENT_TYPE_ID=256
+
+CONTROL_FILE_NAME='control.shm'
+
+def getEventTransportDtype(event_dtype):
+    """
+    Return the numpy dtype used to store events in a shared memory ring buffer,
+    given the NUMPY_DTYPE of the event class. The event class dtypes use
+    float32 for time fields, which is fine for the hdf5 file but is not
+    precise enough to pass event times to the experiment, so float32 fields
+    are stored as float64.
+    """
+    fields=[]
+    for field in event_dtype.descr:
+        name,ftype=field[0],field[1]
+        if isinstance(ftype,str) and ftype[1:]=='f4':
+            ftype=ftype[0]+'f8'
+        elif isinstance(ftype,list):
+            ftype=getEventTransportDtype(N.dtype(ftype))
+        fields.append((name,ftype)+tuple(field[2:]))
+    return N.dtype(fields)
+
+def getRingFileName(event_type_id):
+    return 'events_%d.shm'%(event_type_id)
+
+class SharedEventRingBuffer(object):
+    """
+    A memory mapped ring buffer of fixed size event records for one event type.
+    The ioHub Process creates the ring buffer file (create=True) and appends
+    events to it. The experiment Process opens the same file and reads events
+    from it, keeping track of its own read position.
+    """
+    def __init__(self, file_path, dtype, ring_length=None, event_type_id=0, create=False):
+        self.file_path=file_path
+        self.dtype=dtype
+        header_bytes=RING_HEADER_LENGTH*8
+        if create:
+            f=open(file_path,'wb')
+            f.truncate(header_bytes+dtype.itemsize*ring_length)
+            f.close()
+            mode='r+'
+        else:
+            mode='r'
+        self._header=N.memmap(file_path,dtype=N.uint64,mode=mode,
+                              shape=(RING_HEADER_LENGTH,))
+        if create:
+            self._header[RING_RECORD_SIZE_INDEX]=dtype.itemsize
+            self._header[RING_LENGTH_INDEX]=ring_length
+            self._header[RING_EVENT_TYPE_INDEX]=event_type_id
+            self._header[RING_WRITE_COUNT_INDEX]=0
+            self._header[RING_MAGIC_INDEX]=SHMEM_MAGIC
+        else:
+            if self._header[RING_MAGIC_INDEX]!=SHMEM_MAGIC:
+                raise ValueError("%s is not an ioHub shared memory event buffer."%(file_path))
+            if self._header[RING_RECORD_SIZE_INDEX]!=dtype.itemsize:
+                raise ValueError("The event record size in %s does not match the event type dtype."%(file_path))
+        self.ring_length=int(self._header[RING_LENGTH_INDEX])
+        self._records=N.memmap(file_path,dtype=dtype,mode=mode,
+                               offset=header_bytes,shape=(self.ring_length,))
+
+    def getWriteCount(self):
+        """
+        The total number of events that have been written to the ring buffer.
+        """
+        return int(self._header[RING_WRITE_COUNT_INDEX])
+
+    def append(self,event):
+        """
+        Write the event (an event value list) into the next record. The write
+        count is only updated once the record is complete, so a reader never
+        sees a partly written event.
+        """
+        write_count=int(self._header[RING_WRITE_COUNT_INDEX])
+        self._records[write_count%self.ring_length]=tuple(event)
+        self._header[RING_WRITE_COUNT_INDEX]=write_count+1
+
+    def read(self,read_count):
+        """
+        Return the events written since read_count (the write count at the
+        end of the last read) as a numpy record array, along with the new
+        read count and the number of events that were overwritten before they
+        could be read.
+        """
+        ring_length=self.ring_length
+        write_count=int(self._header[RING_WRITE_COUNT_INDEX])
+        lost_count=0
+        # the writer may already be overwriting the oldest record in the
+        # ring (write_count-ring_length), so it is not read.
+        if write_count-read_count>=ring_length:
+            lost_count=write_count-ring_length-read_count+1
+            read_count=write_count-ring_length+1
+        if write_count==read_count:
+            return self._records[:0].copy(),write_count,lost_count
+
+        start=read_count%ring_length
+        count=write_count-read_count
+        if start+count<=ring_length:
+            events=N.array(self._records[start:start+count])
+        else:
+            events=N.concatenate((self._records[start:],self._records[:start+count-ring_length]))
+
+        # if the writer wrapped around while the events were being copied,
+        # the oldest of the copied records may have been overwritten (or be
+        # part way through being overwritten).
+        new_write_count=int(self._header[RING_WRITE_COUNT_INDEX])
+        if new_write_count-read_count>=ring_length:
+            overwritten=min(count,new_write_count-ring_length-read_count+1)
+            events=events[overwritten:]
+            lost_count+=overwritten
+        return events,write_count,lost_count
+
+    def close(self):
+        self._records=None
+        self._header=None
+
+class SharedEventBufferWriter(object):
+    """
+    Used by the ioHub Server to write events to the shared memory ring buffers.
+    One ring buffer file is created for each event type the first time an
+    event of that type is written.
+
+    getEventClass is a function that returns the DeviceEvent class for
+    an event type id (i.e. EventConstants.getClass).
+    """
+    def __init__(self,getEventClass,ring_length=4096,directory=None):
+        if directory is None:
+            # use a memory backed file system for the files when there is one
+            shm_root=None
+            if os.path.isdir('/dev/shm'):
+                shm_root='/dev/shm'
+            directory=tempfile.mkdtemp(prefix='iohub_events_',dir=shm_root)
+        self.directory=directory
+        self.ring_length=ring_length
+        self._getEventClass=getEventClass
+        self._rings={}
+        self._failed_event_types=set()
+        control_path=os.path.join(directory,CONTROL_FILE_NAME)
+        f=open(control_path,'wb')
+        f.truncate((CONTROL_HEADER_LENGTH+MAX_EVENT_TYPE_ID)*8)
+        f.close()
+        self._control=N.memmap(control_path,dtype=N.uint64,mode='r+',
+                               shape=(CONTROL_HEADER_LENGTH+MAX_EVENT_TYPE_ID,))
+        self._control[CONTROL_MAGIC_INDEX]=SHMEM_MAGIC
+
+    def write(self,event):
+        """
+        Write the event to the ring buffer for its event type. Returns False if
+        the event could not be written, in which case it should be sent using
+        the standard event buffer.
+        """
+        event_type_id=event[EVENT_TYPE_ID_INDEX]
+        ring=self._rings.get(event_type_id)
+        try:
+            if ring is None:
+                if event_type_id in self._failed_event_types:
+                    return False
+                ring=self._createRing(event_type_id)
+            ring.append(event)
+            return True
+        except Exception:
+            return False
+
+    def setUDPEventCount(self,count):
+        """
+        Tell the reader how many events are waiting in the ioHub global event
+        buffer (i.e. events that could not be written to a ring buffer).
+        """
+        self._control[CONTROL_UDP_EVENT_COUNT_INDEX]=count
+
+    def _createRing(self,event_type_id):
+        try:
+            eclass=self._getEventClass(event_type_id)
+            dtype=getEventTransportDtype(eclass.NUMPY_DTYPE)
+            ring=SharedEventRingBuffer(os.path.join(self.directory,getRingFileName(event_type_id)),
+                                       dtype,self.ring_length,event_type_id,create=True)
+        except Exception:
+            self._failed_event_types.add(event_type_id)
+            raise
+        self._rings[event_type_id]=ring
+        self._control[CONTROL_HEADER_LENGTH+event_type_id]=1
+        self._control[CONTROL_RING_COUNT_INDEX]=len(self._rings)
+        return ring
+
+    def close(self):
+        for ring in self._rings.values():
+            ring.close()
+        self._rings.clear()
+        self._control=None
+        try:
+            shutil.rmtree(self.directory)
+        except Exception:
+            # the files can not be removed on Windows while they are
+            # still mapped by the experiment process.
+            pass
+
+class SharedEventBufferReader(object):
+    """
+    Used by the ioHubConnection to read events from the shared memory ring
+    buffers created by the ioHub Server in directory.
+
+    getEventClass is a function that returns the DeviceEvent class for
+    an event type id (i.e. EventConstants.getClass).
+    """
+    def __init__(self,directory,getEventClass):
+        self.directory=directory
+        self._getEventClass=getEventClass
+        self._rings={}
+        self._ring_count=0
+        self.lost_event_count=0
+        control_path=os.path.join(directory,CONTROL_FILE_NAME)
+        self._control=N.memmap(control_path,dtype=N.uint64,mode='r',
+                               shape=(CONTROL_HEADER_LENGTH+MAX_EVENT_TYPE_ID,))
+        if self._control[CONTROL_MAGIC_INDEX]!=SHMEM_MAGIC:
+            raise ValueError("%s is not an ioHub shared memory event buffer."%(directory))
+
+    def getUDPEventCount(self):
+        """
+        The number of events waiting in the ioHub Server global event buffer,
+        which must be retrieved with a GET_EVENTS request.
+        """
+        return int(self._control[CONTROL_UDP_EVENT_COUNT_INDEX])
+
+    def getEvents(self,as_array=False):
+        """
+        Return all events written since the last call, as a list of event value
+        lists sorted by ioHub time. If as_array is True, a dict of event
+        type id : numpy record array is returned instead.
+        """
+        self._updateRings()
+        arrays={}
+        for event_type_id,ring_and_count in self._rings.iteritems():
+            events,ring_and_count[1],lost_count=ring_and_count[0].read(ring_and_count[1])
+            self.lost_event_count+=lost_count
+            if len(events):
+                arrays[event_type_id]=events
+        if as_array:
+            return arrays
+
+        event_lists=[]
+        for event_type_id,events in arrays.iteritems():
+            array_fields=self._rings[event_type_id][2]
+            events=[list(e) for e in events.tolist()]
+            if array_fields:
+                # array fields are returned as numpy arrays by tolist()
+                for e in events:
+                    for i in array_fields:
+                        e[i]=e[i].tolist()
+            event_lists.extend(events)
+        if len(arrays)>1:
+            event_lists.sort(key=itemgetter(EVENT_HUB_TIME_INDEX))
+        return event_lists
+
+    def clear(self):
+        """
+        Discard all events that have not been read yet. Returns the number of
+        events discarded.
+        """
+        self._updateRings()
+        cleared=0
+        for ring_and_count in self._rings.itervalues():
+            write_count=ring_and_count[0].getWriteCount()
+            cleared+=min(write_count-ring_and_count[1],ring_and_count[0].ring_length)
+            ring_and_count[1]=write_count
+        return cleared
+
+    def _updateRings(self):
+        ring_count=int(self._control[CONTROL_RING_COUNT_INDEX])
+        if ring_count==self._ring_count:
+            return
+        flags=self._control[CONTROL_HEADER_LENGTH:]
+        for event_type_id in N.nonzero(flags)[0]:
+            event_type_id=int(event_type_id)
+            if event_type_id not in self._rings:
+                eclass=self._getEventClass(event_type_id)
+                if eclass is None:
+                    # not a device type known to this process (yet), so
+                    # try again next time.
+                    continue
+                dtype=getEventTransportDtype(eclass.NUMPY_DTYPE)
+                ring=SharedEventRingBuffer(os.path.join(self.directory,getRingFileName(event_type_id)),dtype)
+                array_fields=[i for i,name in enumerate(dtype.names) if dtype[name].shape]
+                # [ring buffer, read count, indexes of any array fields]
+                self._rings[event_type_id]=[ring,0,array_fields]
+        if len(self._rings)==ring_count:
+            self._ring_count=ring_count
+
+    def close(self):
+        for ring_and_count in self._rings.values():
+            ring_and_count[0].close()
+        self._rings.clear()
+        self._control=None
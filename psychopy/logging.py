@@ -19,17 +19,28 @@ messages, (which PsychoPy doesn't use) using the commands::
     from psychopy import logging
     logging.console.setLevel(logging.CRITICAL)
 
+Messages are stored until :func:`flush` is called (e.g. at the end of a trial)
+so that no files are written while drawing. For long runs you can also have the
+formatting and writing done by a background thread, so that a flush returns
+almost immediately::
+
+    logging.root.setBackgroundFlush(True)
+
+Only the most recent flushed messages are kept in memory (see
+:meth:`_Logger.setMaxFlushed`).
+
 """
 # Part of the PsychoPy library
 # Copyright (C) 2013 Jonathan Peirce
 # Distributed under the terms of the GNU General Public License (GPL).
 
 #Much of the code below is based conceptually, if not syntactically, on the
-#python logging module but it's simpler (no threading) and maintaining a stack
+#python logging module but it's simpler (threading is optional) and maintaining a stack
 #of log entries for later writing (don't want files written while drawing)
 
 from os import path
-import sys, codecs, weakref
+import sys, codecs, weakref, threading, Queue, struct
+from collections import deque
 import clock
 
 _packagePath = path.split(__file__)[0]
@@ -103,14 +114,29 @@ def setDefaultClock(clock):
     global defaultClock
     defaultClock = clock
 
-class _LogEntry:
+class _LogEntry(object):
+    __slots__ = ['t', 'level', 'message', 'obj']
+    #keep a reference so that entries can still be formatted (e.g. flushed by
+    #_Logger.__del__) while the module is being torn down at exit
+    _levelNames = _levelNames
     def __init__(self, level, message, t=None, obj=None):
         self.t=t
-        self.t_ms=t*1000
         self.level=level
-        self.levelname = getLevel(level)
         self.message=message
         self.obj=obj
+    #these are only needed when formatting, so don't compute them for every entry
+    @property
+    def t_ms(self):
+        return self.t*1000
+    @property
+    def levelname(self):
+        return self._levelNames.get(self.level, ("Level %s" % self.level))
+    def __getitem__(self, key):
+        #so that an entry can be used directly in format %(t)s etc
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
 
 class LogFile:
     """A text stream to receive inputs from the logging system
@@ -162,22 +188,290 @@ class LogFile:
             self.stream.flush()
         except:
             pass
+
+_binaryLogMagic = 'PSYLOGB1'
+#t, level, message id, object id (little-endian and unpadded)
+_binaryLogRecord = struct.Struct('<diiq')
+_binaryLogDtype = [('t','<f8'), ('level','<i4'), ('msgId','<i4'), ('objId','<i8')]
+
+class BinaryLogFile:
+    """A binary file to receive inputs from the logging system, for logs that
+    need full time precision or will be too large to parse as text.
+
+    Each entry is written as a fixed-width record (float64 time, int32
+    level, int32 message id and int64 object id, or -1 if no object was
+    given). Messages are stored once each in a string table, written to a
+    second file with the same name plus '.strings'. Use
+    :class:`BinaryLogReader` to read the file (as numpy arrays) or
+    :func:`binaryLogToText` to convert it to a standard text log.
+    """
+    def __init__(self, f, level=DEBUG, filemode='a', logger=None,
+                 maxInterned=10000):
+        """Create a binary log file as a target for logged entries of a given level
+
+        :parameters:
+
+            - f:
+                a path to the file, that will be created if it doesn't exist
+
+            - level:
+                The minimum level of importance that a message must have to be
+                logged by this target.
+
+            - mode: 'a', 'w'
+                Append or overwrite existing log file
+
+            - maxInterned:
+                How many distinct messages to remember in order to reuse
+                their string table entries (a message that has been forgotten
+                just gets stored again)
+        """
+        self.fileName=f
+        appending = filemode=='a' and path.isfile(f) and path.getsize(f)>0
+        self.stream=open(f, filemode+'b')
+        self.strings=open(f+'.strings', filemode+'b')
+        if appending:
+            self.nStrings=len(_readBinaryLogStrings(f+'.strings'))
+        else:
+            self.stream.write(_binaryLogMagic)
+            self.nStrings=0
+        self._interned={}
+        self.maxInterned=maxInterned
+        self.level=level
+        if logger is None:
+            logger = root
+        self.logger=weakref.ref(logger)
+        self.logger().addTarget(self)
+
+    def setLevel(self, level):
+        """Set a new minimal level for the log file
+        """
+        self.level = level
+        self.logger()._calcLowestTarget()
+    def _getMessageId(self, message):
+        if not isinstance(message, basestring):
+            message=unicode(message)
+        msgId=self._interned.get(message)
+        if msgId is None:
+            if isinstance(message, unicode):
+                txt=message.encode('utf-8')
+            else:
+                txt=str(message)
+            self.strings.write(struct.pack('<I', len(txt))+txt)
+            msgId=self.nStrings
+            self.nStrings+=1
+            if len(self._interned)>=self.maxInterned:
+                self._interned.clear()#start again rather than grow forever
+            self._interned[message]=msgId
+        return msgId
+    def writeEntries(self, entries):
+        """Write a list of log entries (called by the logger during a flush)
+        """
+        pack=_binaryLogRecord.pack
+        records=[]
+        for thisEntry in entries:
+            if thisEntry.obj is None:
+                objId=-1
+            else:
+                objId=id(thisEntry.obj)
+            records.append(pack(thisEntry.t, thisEntry.level,
+                                self._getMessageId(thisEntry.message), objId))
+        #strings first, so a record never refers to a string not on disk
+        self.strings.flush()
+        self.stream.write(''.join(records))
+        self.stream.flush()
+    def close(self):
+        """Stop logging to this file and close it
+        """
+        if self.logger() is not None:
+            self.logger().removeTarget(self)
+        self.strings.close()
+        self.stream.close()
+
+def _readBinaryLogStrings(fileName):
+    """Returns the list of messages from the string table of a BinaryLogFile
+    """
+    strings=[]
+    f=open(fileName, 'rb')
+    dat=f.read()
+    f.close()
+    pos=0
+    while pos+4<=len(dat):
+        length,=struct.unpack_from('<I', dat, pos)
+        if pos+4+length>len(dat):
+            break#incomplete string at the end of a crashed session
+        strings.append(dat[pos+4:pos+4+length].decode('utf-8', 'replace'))
+        pos+=4+length
+    return strings
+
+class BinaryLogReader:
+    """Reads a file written by :class:`BinaryLogFile`
+
+    The records are memory-mapped as a numpy structured array with fields
+    't', 'level', 'msgId' and 'objId', so selecting entries by level or time
+    doesn't need the whole file to be parsed::
+
+        log = logging.BinaryLogReader('session.log')
+        keys = log.select(level=logging.DATA, tStart=10, tEnd=20)
+        for record in keys:
+            print record['t'], log.messages[record['msgId']]
+    """
+    def __init__(self, fileName):
+        import numpy
+        self.fileName=fileName
+        f=open(fileName, 'rb')
+        magic=f.read(len(_binaryLogMagic))
+        f.close()
+        if magic!=_binaryLogMagic:
+            raise IOError("%s is not a PsychoPy binary log file" %fileName)
+        dtype=numpy.dtype(_binaryLogDtype)
+        nRecords=(path.getsize(fileName)-len(_binaryLogMagic))//dtype.itemsize
+        if nRecords:
+            self.records=numpy.memmap(fileName, dtype=dtype, mode='r',
+                                      offset=len(_binaryLogMagic), shape=(nRecords,))
+        else:
+            self.records=numpy.zeros(0, dtype)
+        self.messages=_readBinaryLogStrings(fileName+'.strings')
+    def __len__(self):
+        return len(self.records)
+    def select(self, level=None, tStart=None, tEnd=None):
+        """Returns the records (as a structured array) with at least the given
+        level and with tStart <= t < tEnd (any of which can be None)
+        """
+        import numpy
+        keep=numpy.ones(len(self.records), bool)
+        if level is not None:
+            keep&=self.records['level']>=level
+        if tStart is not None:
+            keep&=self.records['t']>=tStart
+        if tEnd is not None:
+            keep&=self.records['t']<tEnd
+        return self.records[keep]
+    def getMessages(self, records=None):
+        """Returns the message text for each record (default all records)
+        """
+        if records is None:
+            records=self.records
+        messages=self.messages
+        return [messages[msgId] for msgId in records['msgId']]
+    def toText(self, f, level=None, tStart=None, tEnd=None,
+               format="%(t).4f \t%(levelname)s \t%(message)s"):
+        """Write the (selected) records to f (a file name or stream) in the
+        same format as a standard :class:`LogFile`
+        """
+        if hasattr(f, 'write'):
+            stream=f
+        else:
+            stream=codecs.open(f, 'w', 'utf8')
+        records=self.select(level=level, tStart=tStart, tEnd=tEnd)
+        messages=self.messages
+        for t, thisLevel, msgId in zip(records['t'].tolist(),
+                                       records['level'].tolist(),
+                                       records['msgId'].tolist()):
+            stream.write(format %{'t':t, 't_ms':t*1000, 'level':thisLevel,
+                                  'levelname':getLevel(thisLevel),
+                                  'message':messages[msgId]}+'\n')
+        if stream is not f:
+            stream.close()
+
+def binaryLogToText(binaryFileName, textFileName, level=None):
+    """Convert a file written by :class:`BinaryLogFile` into a text log file,
+    in the same format as :class:`LogFile` would have written
+    """
+    BinaryLogReader(binaryFileName).toText(textFileName, level=level)
+
+class _LogWriterThread(threading.Thread):
+    """Formats and writes batches of log entries for a :class:`_Logger`
+    (see :meth:`_Logger.setBackgroundFlush`)
+    """
+    def __init__(self, logger, interval=None):
+        threading.Thread.__init__(self, name='PsychoPyLogWriter')
+        self.daemon=True#don't keep the process alive
+        self.logger=weakref.ref(logger)
+        self.interval=interval
+        self.batches=Queue.Queue()
+        self._done=threading.Condition()
+        self.nSubmitted=0
+        self.nWritten=0
+        self._stopping=False
+    def submit(self, entries):
+        """Queue a batch of entries and return its number (for :meth:`wait`)
+        """
+        self._done.acquire()
+        self.nSubmitted+=1
+        batchN=self.nSubmitted
+        self._done.release()
+        self.batches.put(entries)
+        return batchN
+    def wait(self, batchN, timeout=None):
+        """Wait (up to timeout secs) for batchN to be written.
+        Returns True if it has been.
+        """
+        if timeout is not None:
+            endTime=clock.getTime()+timeout
+        self._done.acquire()
+        try:
+            while self.nWritten<batchN and self.isAlive():
+                if timeout is None:
+                    self._done.wait(0.1)
+                else:
+                    remaining=endTime-clock.getTime()
+                    if remaining<=0:
+                        break
+                    self._done.wait(remaining)
+            return self.nWritten>=batchN
+        finally:
+            self._done.release()
+    def run(self):
+        while not self._stopping:
+            try:
+                entries=self.batches.get(timeout=self.interval)
+            except Queue.Empty:
+                #nothing flushed for a while so fetch what's waiting
+                logger=self.logger()
+                if logger is None:
+                    break
+                self.submit(logger._takeEntries())
+                continue
+            if entries is None:#the signal to stop
+                break
+            logger=self.logger()
+            if logger is None:
+                break
+            try:
+                logger._writeEntries(entries)
+            finally:
+                del logger
+                self._done.acquire()
+                self.nWritten+=1
+                self._done.notifyAll()
+                self._done.release()
+    def stop(self):
+        self._stopping=True
+        self.batches.put(None)
+
 class _Logger:
     """Maintains a set of log targets (text streams such as files of stdout)
 
     self.targets is a list of dicts {'stream':stream, 'level':level}
 
     """
-    def __init__(self, format="%(t).4f \t%(levelname)s \t%(message)s"):
+    def __init__(self, format="%(t).4f \t%(levelname)s \t%(message)s",
+                 maxFlushed=1000):
         """The string-formatted elements %(xxxx)f can be used, where
         each xxxx is an attribute of the LogEntry.
         e.g. t, t_ms, level, levelname, message
+
+        The most recent `maxFlushed` entries are kept (in `self.flushed`)
+        after they have been written (0 keeps none, None keeps them all).
         """
         self.targets=[]
-        self.flushed=[]
-        self.toFlush=[]
+        self.flushed=deque(maxlen=maxFlushed)
+        self.toFlush=deque()
         self.format=format
         self.lowestTarget=50
+        self._writer=None
+        self._writeLock=threading.Lock()
     def __del__(self):
         self.flush()
         # unicode logged to coder output window can cause logger failure, with
@@ -212,32 +506,104 @@ class _Logger:
             t=defaultClock.getTime()
         #add message to list
         self.toFlush.append(_LogEntry(t=t, level=level, message=message, obj=obj))
-    def flush(self):
+    def setMaxFlushed(self, maxFlushed):
+        """Set how many of the most recent (already written) entries are kept
+        in `self.flushed`. 0 keeps none and None keeps all of them (which will
+        use ever more memory during a long run)
+        """
+        self.flushed=deque(self.flushed, maxlen=maxFlushed)
+    def setBackgroundFlush(self, enabled=True, interval=None):
+        """Have entries formatted and written to the targets by a background
+        thread rather than by the thread that calls :meth:`flush`.
+
+        :parameters:
+
+            - enabled: True or False
+
+            - interval: None or a time in secs.
+                If given, the thread will also write out any waiting entries
+                when nothing has been flushed for that long.
+        """
+        if self._writer is not None:
+            self._writer.stop()
+            self._writer.join()
+            self._writer=None
+        if enabled:
+            self._writer=_LogWriterThread(self, interval=interval)
+            self._writer.start()
+    def _takeEntries(self):
+        """Remove and return the entries waiting to be flushed (safe to call
+        while other threads are logging)
+        """
+        entries=[]
+        popleft=self.toFlush.popleft
+        for n in xrange(len(self.toFlush)):
+            entries.append(popleft())
+        return entries
+    def _writeEntries(self, entries):
+        """Format the entries and write them to the targets
+        """
+        self._writeLock.acquire()
+        try:
+            #keep a list of formatted messages - so each is formatted only once
+            #and only if some target wants it
+            formatted=[None]*len(entries)
+            for target in self.targets:
+                if hasattr(target, 'writeEntries'):
+                    #e.g. a BinaryLogFile, which doesn't need the text
+                    target.writeEntries([thisEntry for thisEntry in entries
+                                         if thisEntry.level>=target.level])
+                    continue
+                lines=[]
+                for n, thisEntry in enumerate(entries):
+                    if thisEntry.level>=target.level:
+                        if formatted[n] is None:
+                            #convert the entry into a formatted string
+                            formatted[n]=self.format %thisEntry+'\n'
+                        lines.append(formatted[n])
+                if lines:
+                    #one write (and one stream flush) per target
+                    try:
+                        txt=''.join(lines)
+                    except UnicodeError:#mix of unicode and non-ascii str
+                        for line in lines:
+                            target.write(line)
+                    else:
+                        target.write(txt)
+                elif hasattr(target.stream, 'flush'):
+                    target.stream.flush()
+            #finished processing entries - keep the most recent in self.flushed
+            self.flushed.extend(entries)
+        finally:
+            self._writeLock.release()
+    def flush(self, timeout=None):
         """Process all current messages to each target
+
+        If a background thread is writing the entries (see
+        :meth:`setBackgroundFlush`) then this waits up to `timeout` secs
+        for them to be written (None waits until they are and 0 doesn't
+        wait at all). Returns True if all the entries have been written.
         """
-        #loop through targets then entries in toFlush
-        #so that stream.flush can be called just once
-        formatted={}#keep a dict of formatted messages - so only do the formatting once
-        for target in self.targets:
-            for thisEntry in self.toFlush:
-                if thisEntry.level>=target.level:
-                    if not thisEntry in formatted:
-                        #convert the entry into a formatted string
-                        formatted[thisEntry]= self.format %thisEntry.__dict__
-                    target.write(formatted[thisEntry]+'\n')
-            if hasattr(target.stream, 'flush'):
-                target.stream.flush()
-        #finished processing entries - move them to self.flushed
-        self.flushed.extend(self.toFlush)
-        self.toFlush=[]#a new empty list
+        entries=self._takeEntries()
+        writer=self._writer
+        if writer is None or not writer.isAlive():
+            self._writeEntries(entries)
+            return True
+        batchN=writer.submit(entries)
+        if timeout==0:
+            return writer.nWritten>=batchN
+        return writer.wait(batchN, timeout)
 
 root = _Logger()
 console = LogFile()
 
-def flush(logger=root):
+def flush(logger=root, timeout=None):
     """Send current messages in the log to all targets
+
+    See :meth:`_Logger.flush` for the `timeout` (used when writing in the
+    background)
     """
-    logger.flush()
+    return logger.flush(timeout=timeout)
 
 def critical(msg, t=None, obj=None):
     """log.critical(message)
@@ -218,6 +218,39 @@ class _baseVisualTest:
         shape.setOpacity(0.8)
         shape.draw()
         utils.compareScreenshot('shape2_%s.png' %(self.contextName), win, crit=12.5)
+    def test_shapeBatch(self):
+        win = self.win
+        def getFrame():
+            win.getMovieFrame(buffer='back')
+            frame = numpy.array(win.movieFrames.pop().getdata(), float)
+            win.flip()
+            return frame
+        shapes = []
+        for n, col in enumerate(['red', 'green', 'purple', 'orange', 'blue']):
+            shapes.append(visual.Polygon(win, edges=n+3, radius=0.1*self.scaleFactor,
+                fillColor=col, lineColor='white', lineWidth=n+1, interpolate=False,
+                pos=[(n-2)*0.3*self.scaleFactor, 0], ori=n*10))
+        shapes.append(visual.Line(win, start=(-0.5*self.scaleFactor, -0.5*self.scaleFactor),
+            end=(0.5*self.scaleFactor, -0.3*self.scaleFactor), lineColor='yellow', interpolate=False))
+        batch = visual.ShapeBatch(win, shapes)
+        assert len(batch) == len(shapes)
+        for shape in shapes:
+            shape.draw()
+        expected = getFrame()
+        batch.draw()
+        rms = (((getFrame()-expected)**2).sum()/len(expected))**0.5
+        assert rms < 5.0
+        #change one shape and check the batch follows it
+        shapes[2].setPos([0, 0.4*self.scaleFactor])
+        shapes[2].setOri(45)
+        shapes[3].setFillColor(None)
+        batch.remove(shapes[4])
+        for shape in shapes[:4] + shapes[5:]:
+            shape.draw()
+        expected = getFrame()
+        batch.draw()
+        rms = (((getFrame()-expected)**2).sum()/len(expected))**0.5
+        assert rms < 5.0
     def test_radial(self):
         if self.win.winType=='pygame':
             pytest.skip("RadialStim dodgy on pygame")
@@ -282,6 +315,26 @@ class _baseVisualTest:
         assert not numpy.alltrue(prevPosRend==dots._fieldPosRendered), \
             "dots._fieldPosRendered failed to change after dots.setPos()"
 
+    def test_dots_field(self):
+        #dots should stay (uniformly) within a circular field for all noise types
+        win = self.win
+        fieldRadius = 0.5*self.scaleFactor
+        for noiseDots in ['direction', 'position', 'walk']:
+            dots = visual.DotStim(win, nDots=20000, fieldShape='circle',
+                fieldSize=2*fieldRadius, dotLife=5, signalDots='different',
+                noiseDots=noiseDots, speed=0.01*self.scaleFactor, coherence=0.5)
+            for frameN in range(10):
+                dots._update_dotsXY()
+            assert dots._dotsXY.dtype == numpy.float32
+            radii = numpy.hypot(dots._dotsXY[:,0], dots._dotsXY[:,1])/fieldRadius
+            assert radii.max() <= 1.0001, \
+                "dots outside the field with noiseDots='%s'" %noiseDots
+            #a quarter of the area of the disc is within half its radius
+            assert abs((radii<0.5).mean()-0.25) < 0.02, \
+                "dots not uniform within the field with noiseDots='%s'" %noiseDots
+            assert dots._signalDots.sum() == 10000
+        dots.draw()
+
     def test_element_array(self):
         win = self.win
         if not win._haveShaders or utils._under_xvfb:
@@ -299,6 +352,39 @@ class _baseVisualTest:
         spiral.draw()
         utils.compareScreenshot('elarray1_%s.png' %(self.contextName), win)
         win.flip()
+        #the same spiral from vertex buffers, built up by changing some elements
+        spiral = visual.ElementArrayStim(win, nElements=N,sizes=0.5*self.scaleFactor,
+            sfs=3.0, xys=numpy.zeros([N,2]), oris=0, useVBOs=True)
+        spiral.draw()
+        spiral.setXYs(xys[:N//2], indices=range(N//2))
+        spiral.setOris(thetas[:N//2], indices=range(N//2))
+        spiral.draw()
+        spiral.setXYs(xys[N//2:], indices=range(N//2, N))
+        spiral.setOris(thetas[N//2:], indices=range(N//2, N))
+        spiral.draw()
+        win.flip()
+        spiral.draw()
+        utils.compareScreenshot('elarray1_%s.png' %(self.contextName), win)
+        win.flip()
+        #the buffers are removed while VBOs are off and rebuilt when back on
+        spiral.useVBOs = False
+        spiral.setOris(0)
+        spiral.draw()
+        assert spiral._vbos == {}
+        spiral.setOris(thetas)
+        spiral.useVBOs = True
+        spiral.draw()
+        win.flip()
+        spiral.draw()
+        utils.compareScreenshot('elarray1_%s.png' %(self.contextName), win)
+        win.flip()
+        spiral.setOpacities(0.5, indices=[0, 5])
+        spiral.setSizes([1, 2], indices=[3])
+        assert numpy.all(spiral.opacities[[0, 5]] == 0.5) and numpy.all(spiral.opacities[1:5] == 1)
+        assert numpy.all(spiral.sizes[3] == [1, 2])
+        assert numpy.all(spiral.sizes[4] == 0.5*self.scaleFactor)
+        spiral.draw()
+        win.flip()
     def test_aperture(self):
         win = self.win
         if not win.allowStencil:
@@ -0,0 +1,98 @@
+"""Test the TextureCache used by visual.helpers.createTexture
+
+py.test -k textureCache --cov-report term-missing --cov visual/helpers.py
+"""
+
+import os, shutil
+from tempfile import mkdtemp
+import numpy
+import pytest
+from psychopy.visual.helpers import TextureCache, ImagePrefetcher, GL
+from psychopy.tests import utils
+
+
+class _stim(object):
+    pass
+
+def test_builtinKeys():
+    cache = TextureCache()
+    key = cache.getKey('gauss', 128, GL.GL_ALPHA, GL.GL_UNSIGNED_BYTE)
+    assert key == cache.getKey('gauss', 128, GL.GL_ALPHA, GL.GL_UNSIGNED_BYTE)
+    assert key != cache.getKey('gauss', 256, GL.GL_ALPHA, GL.GL_UNSIGNED_BYTE)
+    assert key != cache.getKey('gauss', 128, GL.GL_RGB, GL.GL_UNSIGNED_BYTE)
+    assert key != cache.getKey('gauss', 128, GL.GL_ALPHA, GL.GL_FLOAT)
+    assert key != cache.getKey('gauss', 128, GL.GL_ALPHA, GL.GL_UNSIGNED_BYTE, forcePOW2=False)
+    assert (cache.getKey('raisedCos', 128, GL.GL_ALPHA, GL.GL_UNSIGNED_BYTE, {'fringeWidth': 0.2}) !=
+            cache.getKey('raisedCos', 128, GL.GL_ALPHA, GL.GL_UNSIGNED_BYTE, {'fringeWidth': 0.3}))
+    assert cache.getKey(None, 128, GL.GL_ALPHA, GL.GL_UNSIGNED_BYTE) is not None
+
+def test_uncachedSources():
+    cache = TextureCache()
+    # arrays can change in place, so are never cached
+    assert cache.getKey(numpy.ones((4, 4)), 4, GL.GL_RGB, GL.GL_FLOAT) is None
+    assert cache.getKey('noSuchFile.png', 128, GL.GL_RGB, GL.GL_FLOAT) is None
+    assert cache.get(None) is None
+    assert cache.getStats()['misses'] == 0
+
+def test_fileKeys():
+    tmp = mkdtemp(prefix='psychopy-tests-textureCache')
+    try:
+        path = os.path.join(tmp, 'image.png')
+        open(path, 'wb').close()
+        key = TextureCache().getKey(path, 128, GL.GL_RGB, GL.GL_FLOAT)
+        assert key[0] == (os.path.abspath(path), os.path.getmtime(path))
+        os.utime(path, (0, 0))
+        assert TextureCache().getKey(path, 128, GL.GL_RGB, GL.GL_FLOAT) != key
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def test_lruEviction():
+    arrayBytes = numpy.zeros((16, 16), numpy.float32).nbytes
+    cache = TextureCache(maxBytes=arrayBytes*2)
+    keys = [cache.getKey(name, 16, GL.GL_ALPHA, GL.GL_UNSIGNED_BYTE)
+            for name in ('sin', 'sqr', 'gauss')]
+    cache.add(keys[0], numpy.zeros((16, 16), numpy.float32), True)
+    cache.add(keys[1], numpy.zeros((16, 16), numpy.float32), True)
+    assert cache.get(keys[0]) is not None  # keys[1] is now the oldest
+    cache.add(keys[2], numpy.zeros((16, 16), numpy.float32), True)
+    assert cache.get(keys[1]) is None
+    intensity, wasLum, origSize = cache.get(keys[0])
+    assert wasLum and origSize is None
+    assert not intensity.flags.writeable
+    stats = cache.getStats()
+    assert stats['nArrays'] == 2 and stats['nBytes'] == arrayBytes*2
+    assert (stats['hits'], stats['misses'], stats['evictions']) == (2, 1, 1)
+    # too big to cache at all
+    cache.add(keys[1], numpy.zeros((32, 32), numpy.float32), True)
+    assert cache.get(keys[1]) is None
+    cache.clear()
+    assert cache.getStats()['nBytes'] == 0
+
+def test_uploads():
+    cache = TextureCache()
+    stim, other = _stim(), _stim()
+    uploadKey = (cache.getKey('sin', 16, GL.GL_RGB, GL.GL_FLOAT), True, True)
+    assert not cache.isUploaded(stim, 1, uploadKey)
+    cache.setUploaded(stim, 1, uploadKey)
+    assert cache.isUploaded(stim, 1, uploadKey)
+    assert not cache.isUploaded(stim, 2, uploadKey)
+    assert not cache.isUploaded(other, 1, uploadKey)
+    assert not cache.isUploaded(stim, 1, None)
+    # uploading something that can't be cached replaces the texture
+    cache.setUploaded(stim, 1, None)
+    assert not cache.isUploaded(stim, 1, uploadKey)
+    assert cache.getStats()['uploadHits'] == 1
+
+def test_prefetcher():
+    cache = TextureCache()
+    prefetcher = ImagePrefetcher(nThreads=2, cache=cache)
+    image = os.path.join(utils.TESTS_DATA_PATH, 'greyscale.jpg')
+    assert prefetcher.preload([image, image]) == 1
+    assert prefetcher.waitUntilDone(timeout=10.0)
+    assert prefetcher.preload(image) == 0  # already cached
+    assert prefetcher.preload('noSuchFile.png') == 0
+    key = cache.getKey(image, 128, GL.GL_RGB, GL.GL_UNSIGNED_BYTE, None, False)
+    intensity, wasLum, origSize = cache.get(key)
+    assert not wasLum
+    assert intensity.shape == (origSize[1], origSize[0], 4)
+    assert prefetcher.nLoaded == 1 and not prefetcher.errors
@@ -1,6 +1,6 @@
 from psychopy import data, logging
 from numpy import random
-import os, glob, shutil
+import os, glob, shutil, csv
 logging.console.setLevel(logging.DEBUG)
 
 from tempfile import mkdtemp
@@ -61,5 +61,71 @@ def test_ExperimentHandler():
         print e
     print 'done'
 
+class TestExperimentHandlerStreaming:
+    def setup_class(self):
+        self.temp_dir = mkdtemp(prefix='psychopy-tests-testExpStream')
+
+    def teardown_class(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_streamWideText(self):
+        fileName = os.path.join(self.temp_dir, 'streamed')
+        exp = data.ExperimentHandler(name='testExp',
+                        extraInfo={'participant':'jwp'},
+                        savePickle=False,
+                        dataFileName=fileName,
+                        streamWideText=True)
+        trials=data.TrialHandler(trialList=[{'ori':0},{'ori':90}], nReps=2,
+                        name='trials', method='sequential')
+        exp.addLoop(trials)
+        for trialN, trial in enumerate(trials):
+            exp.addData('resp.rt', trialN*0.1)
+            if trialN>=2:
+                exp.addData('resp.key', 'a,b')#a new column mid-session
+            exp.nextEntry()
+            #each row should be on disk and not kept in memory
+            assert len(exp.entries)==0
+            lines = open(fileName+'.csv').readlines()
+            assert len(lines)==trialN+2
+        assert os.path.exists(fileName+'.csv.header')
+        exp.saveAsWideText(fileName+'.csv')
+        assert not os.path.exists(fileName+'.csv.header')
+        lines = open(fileName+'.csv').read().splitlines()
+        header = lines[0].split(',')
+        assert header[-2:]==['resp.key', '']
+        assert 'resp.rt' in header and 'participant' in header
+        #all rows padded to the same width as the header
+        for line in lines[1:3]:
+            assert line.count(',')==lines[0].count(',')
+        assert lines[3].endswith('"a,b",')
+
+    def test_streamWideText_multiline_values(self):
+        fileName = os.path.join(self.temp_dir, 'streamedText')
+        exp = data.ExperimentHandler(name='testExp', savePickle=False,
+                        dataFileName=fileName, streamWideText=True)
+        texts = [u'one', u'two\nlines', u'say "hi"\x0b\u2028', u'three\r\nmore\nlines']
+        for trialN, text in enumerate(texts):
+            exp.addData('trialN', trialN)
+            if trialN>=1:
+                exp.addData('text', text)#a new column mid-session
+            exp.nextEntry()
+        exp.saveAsWideText(fileName+'.csv')
+        f = open(fileName+'.csv', 'rb')
+        rows = list(csv.reader(f))
+        f.close()
+        assert rows[0]==['trialN', 'text', '']
+        assert [row[0] for row in rows[1:]]==['0', '1', '2', '3']
+        assert [row[1].decode('utf-8') for row in rows[1:]]==[u'']+texts[1:]
+        #every row padded to the width of the header
+        assert all([len(row)==3 for row in rows])
+        #copies can leave out the header and be appended to another file
+        copyName = os.path.join(self.temp_dir, 'copied.csv')
+        exp.saveAsWideText(copyName)
+        exp.saveAsWideText(copyName, matrixOnly=True, appendFile=True)
+        f = open(copyName, 'rb')
+        copied = list(csv.reader(f))
+        f.close()
+        assert copied==rows+rows[1:]
+
 if __name__=='__main__':
     test_ExperimentHandler()
@@ -4,6 +4,7 @@ from os.path import join as pjoin
 import shutil
 from pytest import raises
 from tempfile import mkdtemp
+import numpy, cPickle
 from numpy.random import random
 
 from psychopy import data
@@ -139,6 +140,80 @@ class TestTrialHandler:
         trials.saveAsWideText(pjoin(self.temp_dir, 'testRandom.csv'), delim=',', appendFile=False)#this omits values
         utils.compareTextFiles(pjoin(self.temp_dir, 'testRandom.csv'), pjoin(fixturesPath,'corrRandom.csv'))
 
+    def test_typed_columns(self):
+        conditions=[{'trialType':0}, {'trialType':1}]
+        trials= data.TrialHandler(trialList=conditions, seed=100, nReps=50,
+                                  method='random')
+        for thisTrial in trials:
+            trials.addData('corr', thisTrial['trialType']==1)
+            trials.addData('resp', 'resp%i' %thisTrial['trialType'])
+            trials.addData('nKeys', trials.thisRepN)
+        #each condition was recorded once per rep, in the right place
+        assert trials.data.getColumn('ran').sum()==100
+        assert (trials.data['ran']==1).all()
+        #typed columns keep the dtype of the values
+        corr = trials.data.getColumn('corr')
+        assert corr.dtype==bool and corr[1].all() and not corr[0].any()
+        assert trials.data.getColumn('nKeys').dtype.kind=='i'
+        assert trials.data.getColumn('resp')[0,0]=='resp0'
+        #and the old representation is kept for outputs
+        assert trials.data['resp'].dtype=='O'
+        assert trials.data['nKeys'].dtype=='f'
+
+    def test_seeded_sequence_and_lookahead(self):
+        conditions=[{'trialType':n} for n in range(10)]
+        seqs = []
+        for method in ['random', 'fullRandom']:
+            for repeat in range(2):
+                trials = data.TrialHandler(trialList=conditions, seed=100,
+                                           nReps=20, method=method)
+                seqs.append(trials.sequenceIndices)
+                order = []
+                nextTrial = None
+                for thisTrial in trials:
+                    order.append(thisTrial['trialType'])
+                    #the trial we looked ahead to is the one we got (also
+                    #across the boundaries between reps)
+                    if trials.thisN>0:
+                        assert thisTrial == nextTrial
+                    nextTrial = trials.getFutureTrial(1)
+                    if trials.thisN>=3:
+                        assert trials.getEarlierTrial(-3)['trialType'] == order[-4]
+                assert nextTrial is None#no trials after the last
+                #the order matches sequenceIndices, one rep at a time
+                assert order == trials.sequenceIndices.transpose().flatten().tolist()
+                for rep in range(20):
+                    assert sorted(order[rep*10:rep*10+10]) == range(10) or method=='fullRandom'
+        assert (seqs[0]==seqs[1]).all() and (seqs[2]==seqs[3]).all()
+
+    def test_data_beyond_nReps(self):
+        dat = data.DataHandler(dataTypes=['rt'], dataShape=[2,3])
+        dat.add('rt', 0.5, position=[1,4])
+        dat.add('rt', 'slow', position=[0,0])
+        assert dat['rt'].shape==(2,5)
+        assert dat['rt'][1,3]=='--'
+        rt = dat.getColumn('rt')
+        assert rt.dtype=='O' and rt.shape==(2,5) and rt.mask.sum()==8
+        assert rt[1,4]==0.5 and rt[0,0]=='slow'
+        #the dict itself holds the arrays
+        assert dict(dat)['rt'] is dat['rt'] and dat.copy()['rt'] is dat['rt']
+
+    def test_explicit_ran_position(self):
+        trials = data.TrialHandler([{'a':0}], nReps=3)
+        trials.next()
+        assert trials.data['ran'][0,0]==1
+        #marking a rep as ran by hand is counted for the next trial
+        trials.data.add('ran', 1, position=[0,1])
+        trials.next()
+        trials.addData('rt', 0.3)
+        assert trials.data['ran'].sum()==3
+        assert trials.data['rt'][0,2]==numpy.float32(0.3)
+        #the arrays and columns are pickled and restored together
+        pickled = cPickle.loads(cPickle.dumps(trials.data, 2))
+        assert pickled['rt'][0,2]==numpy.float32(0.3)
+        pickled.add('rt', 0.4, position=[0,0])
+        assert pickled['rt'][0,0]==numpy.float32(0.4)
+
 class TestMultiStairs:
     def setup_class(self):
         self.temp_dir = mkdtemp(prefix='psychopy-tests-testdata')
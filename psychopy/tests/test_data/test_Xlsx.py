@@ -52,6 +52,34 @@ def test_TrialTypeImport():
                 print header, trialCSV[header], trialXLSX[header]
             assert trialXLSX[header] == trialCSV[header]
 
+def test_importConditionsCache():
+    tempDir = mkdtemp(prefix='psychopy-tests-testdata')
+    try:
+        for name in ['trialTypes.csv', 'trialTypes.xlsx']:
+            fileName = os.path.join(tempDir, name)
+            shutil.copy(os.path.join(fixturesPath, name), fileName)
+            orig = data.importConditions(fileName)
+            first = data.importConditions(fileName, useCache=True)
+            assert os.path.isfile(os.path.join(tempDir, '.%s.psycache' %name))
+            cached = data.importConditions(fileName, useCache=True)
+            assert repr(orig) == repr(first) == repr(cached)
+            #a changed file mustn't use the old cache
+            if name.endswith('.csv'):
+                f = open(fileName, 'w')
+                f.write('letter,n\nA,1\nB,2\n')
+                f.close()
+                expected = [{'letter':u'A', 'n':1}, {'letter':u'B', 'n':2}]
+            else:
+                newFile = os.path.join(fixturesPath, 'multiStairConds.xlsx')
+                shutil.copy(newFile, fileName)
+                expected = data.importConditions(newFile)
+            changed = data.importConditions(fileName, useCache=True)
+            assert changed == expected and changed != first
+            #and the new contents are what get cached
+            assert data.importConditions(fileName, useCache=True) == expected
+    finally:
+        shutil.rmtree(tempDir)
+
 if __name__=='__main__':
     t=TestXLSX()
     t.setup_class()
@@ -94,6 +94,67 @@ def test_logistic():
         pylab.plot([thresh,thresh],[0.,0.75],'--b')#vert
         pylab.title('Fitting Logistic (thresh=%.2f)' %(fit.inverse(0.75)))
 
+def test_bootStraps():
+    dat = numpy.random.random((3,20))
+    resamples = data.bootStraps(dat, n=50, randomState=1)
+    assert resamples.shape == (3,20,50)
+    for stimN in range(3):#each resample only contains that stim's values
+        assert numpy.in1d(resamples[stimN], dat[stimN]).all()
+    assert (resamples == data.bootStraps(dat, n=50, randomState=1)).all()
+
+def test_functionFromStaircase():
+    intensities = [0.1,0.3,0.2,0.1,0.3,0.2]
+    responses = [0,1,1,0,1,0]
+    inten, resp, n = data.functionFromStaircase(intensities, responses, bins='unique')
+    assert numpy.allclose(inten, [0.1,0.2,0.3]) and numpy.allclose(resp, [0,0.5,1])
+    assert n == [2,2,2]
+    inten, resp, n = data.functionFromStaircase(intensities, responses, bins=2)
+    assert numpy.allclose(inten, [0.4/3,0.8/3]) and numpy.allclose(resp, [1/3.,2/3.])
+    assert n == [3,3]
+
+def test_bootStrapFit():
+    intensities = numpy.repeat(contrasts, 40)
+    probs = cumNorm(intensities, noise=sd, thresh=thresh)
+    responses = (numpy.random.RandomState(0).random_sample(len(intensities))<probs)*1
+    params = data.bootStrapFit(data.FitCumNormal, intensities, responses,
+                               n=20, randomState=2)
+    assert params.shape == (20,2)
+    assert abs(numpy.median(params[:,0])-thresh)<0.05
+    #a process pool gives the same fits
+    pooled = data.bootStrapFit(data.FitCumNormal, intensities, responses,
+                               n=20, randomState=2, nProcesses=2)
+    assert numpy.allclose(params, pooled)
+
+def test_jacobians():
+    xx = numpy.linspace(0.05, 0.5, 10)
+    data._chance = 0.5
+    for fitClass, params in [(data.FitWeibull, [0.2,3.0]), (data.FitLogistic, [0.2,20.0]),
+                             (data.FitCumNormal, [0.2,0.1]),
+                             (data.FitNakaRushton, [0.2,3.0,0.5,1.0])]:
+        numeric = []
+        for paramN in range(len(params)):
+            above, below = list(params), list(params)
+            above[paramN] += 1e-6
+            below[paramN] -= 1e-6
+            numeric.append((fitClass._eval(xx,*above)-fitClass._eval(xx,*below))/2e-6)
+        assert numpy.allclose(fitClass._jacobian(xx,*params), numpy.column_stack(numeric), atol=1e-5)
+
+def test_fitBatch():
+    rng = numpy.random.RandomState(0)
+    threshes = rng.uniform(0.2, 0.4, 6)
+    responses = numpy.array([cumNorm(contrasts, noise=sd, thresh=thisThresh)
+                             for thisThresh in threshes])
+    responses += rng.normal(0, 0.02, responses.shape)
+    fits = data.fitBatch(data.FitCumNormal, contrasts, responses)
+    assert fits.shape == (6,) and fits['params'].shape == (6,2)
+    assert fits['converged'].all()
+    for thisResp, thisFit in zip(responses, fits):#same as individual fit objects
+        fit = data.FitCumNormal(contrasts, thisResp)
+        assert numpy.allclose(fit.params, thisFit['params'], atol=1e-4)
+        assert numpy.allclose(fit.ssq, thisFit['ssq'])
+    pooled = data.fitBatch(data.FitCumNormal, contrasts, responses, nProcesses=2)
+    assert numpy.allclose(fits['params'], pooled['params'], atol=1e-4)
+
 def teardown():
     if PLOTTING:
         pylab.show()
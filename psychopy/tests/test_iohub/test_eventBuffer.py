@@ -0,0 +1,62 @@
+"""Tests for psychopy.iohub.devices.DeviceEventBuffer"""
+from psychopy.iohub.devices import DeviceEvent, DeviceEventBuffer
+
+def makeEvent(n, event_type, time):
+    event = [0, 0, 0, n, event_type, time, time, time]
+    assert event[DeviceEvent.EVENT_TYPE_ID_INDEX] == event_type
+    assert event[DeviceEvent.EVENT_HUB_TIME_INDEX] == time
+    return event
+
+def eventIds(events):
+    return [e[3] for e in events]
+
+def test_merged_in_time_order():
+    buf = DeviceEventBuffer()
+    for n, (event_type, time) in enumerate([(1, 0.1), (2, 0.15), (1, 0.2),
+                                            (3, 0.05), (2, 0.3), (1, 0.25)]):
+        buf.append(makeEvent(n, event_type, time))
+    assert len(buf) == 6
+    assert eventIds(buf) == [3, 0, 1, 2, 5, 4]#iterating doesn't clear
+    assert eventIds(buf.getEvents(event_types=[1, 2], clear=False)) == [0, 1, 2, 5, 4]
+    assert eventIds(buf.getEvents(event_types=3)) == [3]
+    assert len(buf) == 5
+    assert eventIds(buf.getEvents()) == [0, 1, 2, 5, 4]
+    assert len(buf) == 0 and buf.getEvents() == []
+
+def test_out_of_order_insert():
+    buf = DeviceEventBuffer()
+    for n, time in enumerate([0.1, 0.2, 0.3, 0.4]):
+        buf.append(makeEvent(n, 1, time))
+    #e.g. a MessageEvent given an earlier sec_time
+    buf.append(makeEvent(4, 1, 0.25))
+    buf.append(makeEvent(5, 1, 0.0))
+    buf.append(makeEvent(6, 1, 0.4))#equal times keep the order they were added
+    assert eventIds(buf.getEvents()) == [5, 0, 1, 4, 2, 3, 6]
+
+def test_time_window():
+    buf = DeviceEventBuffer()
+    for n in range(10):
+        buf.append(makeEvent(n, n%2, n/10.0))
+    assert eventIds(buf.getEvents(start_time=0.3, end_time=0.6, clear=False)) == [3, 4, 5, 6]
+    assert eventIds(buf.getEvents(event_types=[1], end_time=0.5)) == [1, 3, 5]
+    assert len(buf) == 7
+    #only the events returned were removed
+    assert eventIds(buf.getEvents(start_time=0.75)) == [8, 9]
+    assert eventIds(buf.getEvents()) == [0, 2, 4, 6, 7]
+
+def test_maxlen_drops_oldest():
+    buf = DeviceEventBuffer(maxlen=4)
+    buf.append(makeEvent(0, 1, 0.2))
+    buf.append(makeEvent(1, 2, 0.1))
+    buf.append(makeEvent(2, 1, 0.3))
+    buf.append(makeEvent(3, 2, 0.4))
+    assert buf.dropped_count == 0
+    #the oldest event over all the event types goes
+    buf.append(makeEvent(4, 1, 0.5))
+    assert len(buf) == 4 and buf.dropped_count == 1
+    assert eventIds(buf.getEvents(clear=False)) == [0, 2, 3, 4]
+    buf.append(makeEvent(5, 2, 0.6))
+    buf.append(makeEvent(6, 3, 0.7))
+    assert len(buf) == 4 and buf.dropped_count == 3
+    assert eventIds(buf.getEvents()) == [3, 4, 5, 6]
+    assert buf.clear() == 0
@@ -0,0 +1,79 @@
+"""Tests for the event client log of psychopy.iohub.server"""
+import pytest
+
+pytest.importorskip('msgpack')
+pytest.importorskip('gevent')
+from psychopy.iohub import DeviceEvent, ioHubError
+from psychopy.iohub.server import ClientEventLog
+
+FAST = ('127.0.0.1', 9001)
+SLOW = ('127.0.0.1', 9002)
+
+def makeEvent(n, event_type=1):
+    event = [0, 0, 0, n, event_type, n, n, n]
+    assert event[DeviceEvent.EVENT_TYPE_ID_INDEX] == event_type
+    return event
+
+def eventIds(events):
+    return [e[3] for e in events]
+
+def test_clients_read_at_different_rates():
+    log = ClientEventLog(log_length=100)
+    log.append(makeEvent(0))#no clients, so not logged
+    assert len(log) == 0
+    log.addClient(FAST)
+    log.addClient(SLOW, event_types=[2])
+    for n in range(1, 11):
+        log.append(makeEvent(n, event_type=1+n%2))
+        if n%2 == 0:
+            assert eventIds(log.getEvents(FAST)) == [n-1, n]
+    #the slow client hasn't read anything, so nothing has been trimmed
+    assert len(log) == 10
+    assert eventIds(log.getEvents(SLOW)) == [1, 3, 5, 7, 9]
+    #every event has been read by every client
+    assert len(log) == 0
+    assert log.getEvents(FAST) == [] and log.getEvents(SLOW) == []
+    stats = log.getStats()
+    assert stats['127.0.0.1:9001'] == dict(read_count=10, lost_count=0, backlog=0)
+    assert stats['127.0.0.1:9002'] == dict(read_count=5, lost_count=0, backlog=0)
+
+def test_slow_client_drop_oldest():
+    log = ClientEventLog(log_length=4)
+    log.addClient(FAST)
+    log.addClient(SLOW)
+    for n in range(10):
+        log.append(makeEvent(n, event_type=1+n%2))
+        log.getEvents(FAST)
+        assert len(log) <= 4
+    #the slow client lost the events that didn't fit in the log
+    assert log.getStats()['127.0.0.1:9002']['backlog'] == 4
+    assert eventIds(log.getEvents(SLOW)) == [6, 7, 8, 9]
+    assert log.getLostCount(SLOW) == 6 and log.getLostCount(FAST) == 0
+    #a client is only told about lost events of the types it asked for
+    log.addClient(SLOW, event_types=[2])
+    for n in range(10, 16):
+        log.append(makeEvent(n, event_type=1+n%2))
+    assert eventIds(log.getEvents(SLOW)) == [13, 15]
+    assert log.getLostCount(SLOW) == 1
+
+def test_slow_client_unregister():
+    log = ClientEventLog(log_length=4, drop_policy='unregister')
+    log.addClient(FAST)
+    log.addClient(SLOW)
+    for n in range(4):
+        log.append(makeEvent(n))
+        log.getEvents(FAST)
+    assert log.hasClient(SLOW)
+    log.append(makeEvent(4))
+    assert not log.hasClient(SLOW) and log.wasUnregistered(SLOW)
+    assert eventIds(log.getEvents(FAST)) == [4]
+    assert len(log) == 0
+    #registering again clears the flag
+    log.addClient(SLOW)
+    assert not log.wasUnregistered(SLOW)
+    log.removeClient(SLOW)
+    assert not log.hasClient(SLOW)
+
+def test_drop_policy():
+    with pytest.raises(ioHubError):
+        ClientEventLog(drop_policy='block')
@@ -0,0 +1,36 @@
+"""Tests for sending queued MessageEvents from psychopy.iohub.client"""
+import socket
+import pytest
+
+msgpack = pytest.importorskip('msgpack')
+pytest.importorskip('gevent')
+from psychopy.iohub.client import ioHubConnection
+from psychopy.iohub.devices.experiment import MessageEvent
+from psychopy.iohub.net import UDPClientConnection
+
+def test_flushMessages_datagram_size():
+    #a full backlog of long messages must be split into datagrams that the
+    #ioHub Server can read whole with recvfrom(8192)
+    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    server.bind(('127.0.0.1', 0))
+    server.settimeout(5)
+    io = ioHubConnection.__new__(ioHubConnection)#no ioHub Process needed
+    io.udp_client = UDPClientConnection(remote_port=server.getsockname()[1])
+    texts = ['%03d' %n + 'x'*125 for n in range(256)]
+    io._message_backlog = [MessageEvent._createAsList(text, category='test')
+                           for text in texts]
+    try:
+        assert io.flushMessages() == 256
+        assert io._message_backlog == []
+        #unpack as the ioHub Server does, with one Unpacker for all requests
+        unpacker = msgpack.Unpacker(use_list=True)
+        received = []
+        while len(received) < len(texts):
+            unpacker.feed(server.recvfrom(8192)[0])
+            request = unpacker.unpack()
+            assert request[:2] == ['EXP_DEVICE', 'EVENT_TX_NR']
+            received.extend([msg[-1] for msg in request[2]])
+        assert received == texts
+    finally:
+        io.udp_client.close()
+        server.close()
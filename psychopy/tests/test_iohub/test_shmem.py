@@ -0,0 +1,112 @@
+"""Tests for the shared memory event ring buffers in psychopy.iohub.shmem"""
+import shutil
+from tempfile import mkdtemp
+import numpy
+
+from psychopy.iohub import shmem
+
+class FakeEvent(object):
+    NUMPY_DTYPE = numpy.dtype([('experiment_id', 'u4'), ('session_id', 'u4'),
+        ('device_id', 'u2'), ('event_id', 'u4'), ('type', 'u1'),
+        ('device_time', 'f4'), ('logged_time', 'f4'), ('time', 'f4'),
+        ('value', 'i4')])
+
+def getEventClass(event_type_id):
+    if event_type_id in [1, 2]:
+        return FakeEvent
+    return None
+
+def makeEvent(n, event_type=1, time=None):
+    if time is None:
+        time = n*0.001
+    return [0, 0, 0, n, event_type, time, time, time, n]
+
+class WritingRecords(object):
+    """Stands in for the records of a ring buffer, calling write() each time
+    they are read from, like a writer running during the copy
+    """
+    def __init__(self, records, write):
+        self.records = records
+        self.write = write
+    def __getitem__(self, index):
+        self.write()
+        return self.records[index]
+
+class TestSharedEventBuffer:
+    def setup_method(self, method):
+        self.temp_dir = mkdtemp(prefix='psychopy-tests-shmem')
+        self.writer = shmem.SharedEventBufferWriter(getEventClass,
+            ring_length=8, directory=self.temp_dir)
+        self.reader = shmem.SharedEventBufferReader(self.temp_dir, getEventClass)
+
+    def teardown_method(self, method):
+        self.reader.close()
+        self.writer.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_transport_dtype(self):
+        dtype = shmem.getEventTransportDtype(FakeEvent.NUMPY_DTYPE)
+        assert dtype['time'] == numpy.float64 and dtype['value'] == numpy.int32
+
+    def test_events_in_time_order(self):
+        self.writer.write(makeEvent(0, 1, time=1.0))
+        self.writer.write(makeEvent(1, 2, time=0.5))
+        self.writer.write(makeEvent(2, 1, time=2.0))
+        assert self.writer.write(makeEvent(3, 3)) is False#unknown type
+        events = self.reader.getEvents()
+        assert [e[3] for e in events] == [1, 0, 2]
+        assert events[0][shmem.EVENT_HUB_TIME_INDEX] == 0.5
+        assert self.reader.getEvents() == []
+        arrays = self.reader.getEvents(as_array=True)
+        assert arrays == {}
+
+    def test_wraparound(self):
+        for n in range(5):
+            self.writer.write(makeEvent(n))
+        assert [e[3] for e in self.reader.getEvents()] == range(5)
+        #the next events wrap around the end of the ring
+        for n in range(5, 12):
+            self.writer.write(makeEvent(n))
+        assert [e[3] for e in self.reader.getEvents()] == range(5, 12)
+        assert self.reader.lost_event_count == 0
+
+    def test_lost_count(self):
+        for n in range(20):
+            self.writer.write(makeEvent(n))
+        #the oldest record in a full ring may be being overwritten, so
+        #only ring_length-1 events are read
+        assert [e[3] for e in self.reader.getEvents()] == range(13, 20)
+        assert self.reader.lost_event_count == 13
+        self.writer.write(makeEvent(20))
+        assert [e[3] for e in self.reader.getEvents()] == [20]
+        assert self.reader.lost_event_count == 13
+
+    def test_overwritten_while_reading(self):
+        for n in range(4):
+            self.writer.write(makeEvent(n))
+        ring = self.writer._rings[1]
+        reader = shmem.SharedEventRingBuffer(ring.file_path, ring.dtype)
+        newEvents = iter(range(4, 100))
+        def write():
+            #the writer catches up with the start of the read
+            for n in range(4):
+                ring.append(makeEvent(newEvents.next()))
+        reader._records = WritingRecords(reader._records, write)
+        events, read_count, lost_count = reader.read(0)
+        assert read_count == 4
+        assert lost_count == 1 and events['value'].tolist() == [1, 2, 3]
+        reader.close()
+
+    def test_udp_event_count(self):
+        assert self.reader.getUDPEventCount() == 0
+        self.writer.setUDPEventCount(3)
+        assert self.reader.getUDPEventCount() == 3
+        self.writer.setUDPEventCount(0)
+        assert self.reader.getUDPEventCount() == 0
+
+    def test_clear(self):
+        for n in range(3):
+            self.writer.write(makeEvent(n))
+        assert self.reader.clear() == 3
+        self.writer.write(makeEvent(3))
+        assert [e[3] for e in self.reader.getEvents()] == [3]
@@ -0,0 +1,77 @@
+"""Tests for the drift and offset model of psychopy.iohub.net.TimeSyncState"""
+import numpy
+import pytest
+
+pytest.importorskip('msgpack')
+pytest.importorskip('gevent')
+from psychopy.iohub.net import TimeSyncState
+
+DRIFT = 1.0+20.0e-6
+OFFSET = 5.0
+
+def makeState(outliers=(), outlierRTT=0.02, outlierDelay=0.015,
+              robust_iterations=3):
+    #one sync sample per sec; the remote clock runs fast and is 5 sec ahead
+    rng = numpy.random.RandomState(1)
+    state = TimeSyncState(window_size=100, robust_iterations=robust_iterations)
+    for n in range(100):
+        local = 1000.0+n
+        rtt = 0.0005+rng.uniform(0, 0.0001)
+        remote = DRIFT*local+OFFSET+rng.normal(0, 0.00001)
+        if n in outliers:
+            #a delayed reply: the remote time is late by most of the RTT
+            rtt = outlierRTT
+            remote += outlierDelay
+        state.addSample(rtt, local, remote)
+    return state
+
+def test_fitted_model():
+    state = makeState()
+    assert state.getSampleCount() == 100
+    assert abs(state.getDrift()-DRIFT) < 1.0e-7
+    assert abs(state.getOffset()-OFFSET) < 1.0e-4
+    assert abs(state.local2RemoteTime(1050.0)-(DRIFT*1050.0+OFFSET)) < 1.0e-5
+
+def test_outliers_down_weighted():
+    state = makeState(outliers=range(5, 100, 10))
+    assert abs(state.getDrift()-DRIFT) < 1.0e-7
+    assert abs(state.local2RemoteTime(1050.0)-(DRIFT*1050.0+OFFSET)) < 5.0e-5
+    #replies delayed without a long RTT are caught by the Huber weights
+    outliers = range(60, 100, 4)
+    robust = makeState(outliers, outlierRTT=0.0006, outlierDelay=0.0003)
+    plain = makeState(outliers, outlierRTT=0.0006, outlierDelay=0.0003,
+                      robust_iterations=0)
+    assert abs(robust.getDrift()-DRIFT) < 2.0e-7 < abs(plain.getDrift()-DRIFT)
+
+def test_conversion_error():
+    state = makeState()
+    errors = state.getConversionError(numpy.array([1050.0, 1099.0, 2000.0]),
+                                      include_rtt=False)
+    assert errors.shape == (3,)
+    #smallest in the middle of the sync window, growing away from it
+    assert 0.0 < errors[0] < errors[1] < errors[2]
+    withRTT = state.getConversionError(1050.0)
+    assert abs(withRTT-errors[0]-min(state.RTTs)/2.0) < 1.0e-12
+    #the fitted remote times are within the error bound
+    assert abs(state.local2RemoteTime(1050.0)-(DRIFT*1050.0+OFFSET)) < withRTT
+
+def test_array_conversions():
+    state = makeState()
+    local = numpy.linspace(1000.0, 1100.0, 11)
+    remote = state.local2RemoteTime(local)
+    assert isinstance(remote, numpy.ndarray) and remote.shape == local.shape
+    assert numpy.allclose(remote, [state.local2RemoteTime(t) for t in local],
+                          rtol=0, atol=1.0e-9)
+    assert numpy.allclose(state.remote2LocalTime(remote), local, rtol=0,
+                          atol=1.0e-9)
+    assert numpy.allclose(state.remote2LocalTime(list(remote)), local, rtol=0,
+                          atol=1.0e-9)
+
+def test_few_samples():
+    #with less than 3 samples the offset of the min. RTT sample is used
+    state = TimeSyncState()
+    state.addSample(0.002, 10.0, 15.0)
+    state.addSample(0.001, 11.0, 16.5)
+    assert state.getDrift() == 1.0
+    assert state.local2RemoteTime(12.0) == 17.5
+    assert state.remote2LocalTime(17.5) == 12.0
@@ -0,0 +1,89 @@
+"""Tests for psychopy.logging"""
+import os, codecs, shutil, StringIO
+from tempfile import mkdtemp
+from psychopy import logging
+
+class TestLogger:
+    def setup(self):
+        self.logger = logging._Logger(maxFlushed=10)
+        self.stream = StringIO.StringIO()
+        self.target = logging.LogFile(self.stream, level=logging.INFO,
+                                      logger=self.logger)
+
+    def teardown(self):
+        self.logger.setBackgroundFlush(False)
+
+    def test_levels_and_format(self):
+        self.logger.log('an exp message', level=logging.EXP, t=1.5)
+        self.logger.log('a debug message', level=logging.DEBUG, t=2.0)
+        assert self.logger.flush()
+        lines = self.stream.getvalue().splitlines()
+        assert lines == ['1.5000 \tEXP \tan exp message']
+
+    def test_flushed_is_bounded(self):
+        for n in range(100):
+            self.logger.log('msg %i' %n, level=logging.DATA, t=n)
+        self.logger.flush()
+        assert len(self.stream.getvalue().splitlines()) == 100
+        assert len(self.logger.flushed) == 10
+        assert self.logger.flushed[-1].message == 'msg 99'
+        self.logger.setMaxFlushed(0)
+        self.logger.log('another', level=logging.DATA, t=0)
+        self.logger.flush()
+        assert len(self.logger.flushed) == 0
+
+    def test_background_flush(self):
+        self.logger.setBackgroundFlush(True)
+        for n in range(100):
+            self.logger.log(u'msg \xe9 %i' %n, level=logging.DATA, t=n)
+        assert self.logger.flush(timeout=5.0)
+        lines = self.stream.getvalue().splitlines()
+        assert len(lines) == 100
+        assert lines[-1].endswith(u'msg \xe9 99')
+        #after switching off we're back to writing straight away
+        self.logger.setBackgroundFlush(False)
+        self.logger.log('sync', level=logging.DATA, t=0)
+        self.logger.flush()
+        assert self.stream.getvalue().splitlines()[-1].endswith('sync')
+
+class TestBinaryLogFile:
+    def setup_class(self):
+        self.temp_dir = mkdtemp(prefix='psychopy-tests-logging')
+
+    def teardown_class(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_write_read_convert(self):
+        logger = logging._Logger()
+        fileName = os.path.join(self.temp_dir, 'session.log')
+        binLog = logging.BinaryLogFile(fileName, level=logging.EXP,
+                                       filemode='w', logger=logger)
+        for n in range(50):
+            logger.log(u'trial \xe9', level=logging.EXP, t=n+0.123456789)
+            logger.log('key %i' %(n%3), level=logging.DATA, t=n+0.5, obj=binLog)
+            logger.log('ignored', level=logging.DEBUG, t=n)
+        logger.flush()
+        log = logging.BinaryLogReader(fileName)
+        assert len(log) == 100
+        assert len(log.messages) == 4 #messages are only stored once
+        assert log.records['t'][0] == 0.123456789 #full precision
+        keys = log.select(level=logging.DATA, tStart=10, tEnd=20)
+        assert len(keys) == 10
+        assert (keys['objId'] == id(binLog)).all()
+        assert log.getMessages(keys)[:2] == ['key 1', 'key 2']
+        #appending continues the string table
+        binLog.close()
+        binLog = logging.BinaryLogFile(fileName, level=logging.EXP,
+                                       logger=logger)
+        logger.log('key 0', level=logging.DATA, t=100)
+        logger.log('new', level=logging.DATA, t=101)
+        logger.flush()
+        binLog.close()
+        log = logging.BinaryLogReader(fileName)
+        assert log.getMessages(log.records[-2:]) == ['key 0', 'new']
+        #and convert to text
+        textName = os.path.join(self.temp_dir, 'session.txt')
+        logging.binaryLogToText(fileName, textName, level=logging.DATA)
+        lines = codecs.open(textName, 'r', 'utf8').read().splitlines()
+        assert len(lines) == 52
+        assert lines[0] == u'0.5000 \tDATA \tkey 0'
@@ -13,7 +13,7 @@ from psychopy.constants import *
 from psychopy.visual.window import Window, getMsPerFrame
 
 # non-private helpers
-from psychopy.visual.helpers import (createTexture,
+from psychopy.visual.helpers import (createTexture, ImagePrefetcher,
                                      pointInPolygon, polygonsOverlap)
 
 # non-stimulus classes only derived from Object
@@ -24,6 +24,7 @@ from psychopy.visual.custommouse import CustomMouse
 from psychopy.visual.basevisual import BaseVisualStim
 from psychopy.visual.elementarray import ElementArrayStim
 from psychopy.visual.ratingscale import RatingScale
+from psychopy.visual.shapebatch import ShapeBatch
 from psychopy.visual.simpleimage import SimpleImageStim
 
 # stimuli derived from BaseVisualStim
@@ -50,6 +50,11 @@ class DotStim(BaseVisualStim):
 
     If further customisation is required, then the DotStim should be subclassed and its
     _update_dotsXY and _newDotsXY methods overridden.
+
+    The dot positions are kept in float32 arrays that are updated in place on each
+    frame, and the cos/sin of the dot directions are only recalculated when the
+    directions change, so that fields of tens of thousands of dots can be updated
+    within a frame.
     """
     def __init__(self,
                  win,
@@ -148,9 +153,16 @@ class DotStim(BaseVisualStim):
 
         self.coherence=round(coherence*self.nDots)/self.nDots#store actual coherence
 
-        self._dotsXY = self._newDotsXY(self.nDots) #initialise a random array of X,Y
+        #working arrays, updated in place on every frame
+        self._dotsXY = numpy.zeros([self.nDots,2], numpy.float32)
+        self._dotsXY[:] = self._newDotsXY(self.nDots) #initialise a random array of X,Y
+        self._xyBuffer = numpy.zeros([self.nDots,2], numpy.float32)
+        self._radiusBuffer = numpy.zeros(self.nDots, numpy.float32)
+        self._lifeBuffer = numpy.zeros(self.nDots, numpy.float32)
+        self._deadBuffer = numpy.zeros(self.nDots, dtype=bool)
+        self._boolBuffer = numpy.zeros(self.nDots, dtype=bool)
         self._dotsSpeed = numpy.ones(self.nDots, 'f')*self.speed#all dots have the same speed
-        self._dotsLife = abs(dotLife)*numpy.random.rand(self.nDots)#abs() means we can ignore the -1 case (no life)
+        self._dotsLife = abs(dotLife)*numpy.random.rand(self.nDots).astype(numpy.float32)#abs() means we can ignore the -1 case (no life)
         #determine which dots are signal
         self._signalDots = numpy.zeros(self.nDots, dtype=bool)
         self._signalDots[0:int(self.coherence*self.nDots)]=True
@@ -158,6 +170,9 @@ class DotStim(BaseVisualStim):
         #set directions (only used when self.noiseDots='direction')
         self._dotsDir = numpy.random.rand(self.nDots)*2*pi
         self._dotsDir[self._signalDots] = self.dir*pi/180
+        #unit vectors of _dotsDir (cos, sin), recalculated when the directions change
+        self._dotsDirXY = numpy.zeros([self.nDots,2], numpy.float32)
+        self._dirsChanged = True
 
         self._calcFieldCoordsRendered()
         self._update_dotsXY()
@@ -219,6 +234,7 @@ class DotStim(BaseVisualStim):
         if self.noiseDots in ['direction','position']:
             self._dotsDir=numpy.random.rand(self.nDots)*2*pi
             self._dotsDir[self._signalDots]=self.dir*pi/180
+            self._dirsChanged = True
     def setDir(self,val, op='', log=True):
         """Change the direction of the signal dots (units in degrees)
         """
@@ -227,6 +243,7 @@ class DotStim(BaseVisualStim):
         self._set('dir', val, op, log=log)
         #dots currently moving in the signal direction also need to update their direction
         self._dotsDir[signalDots] = self.dir*pi/180
+        self._dotsDirXY[signalDots] = [numpy.cos(self.dir*pi/180), numpy.sin(self.dir*pi/180)]
     def setSpeed(self,val, op='', log=True):
         """Change the speed of the dots (in stimulus `units` per second)
         """
@@ -259,7 +276,7 @@ class DotStim(BaseVisualStim):
             GL.glEnable(GL.GL_TEXTURE_2D)
             GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
 
-            GL.glVertexPointer(2, GL.GL_DOUBLE, 0, self._dotsXYRendered.ctypes.data_as(ctypes.POINTER(ctypes.c_double)))
+            GL.glVertexPointer(2, GL.GL_FLOAT, 0, self._dotsXYRendered.ctypes.data_as(ctypes.POINTER(ctypes.c_float)))
             desiredRGB = self._getDesiredRGB(self.rgb, self.colorSpace, self.contrast)
 
             GL.glColor4f(desiredRGB[0], desiredRGB[1], desiredRGB[2], self.opacity)
@@ -283,15 +300,24 @@ class DotStim(BaseVisualStim):
             dots = self._newDots(nDots)
 
         """
-        if self.fieldShape=='circle':#make more dots than we need and only use those that are within circle
-            while True:#repeat until we have enough
-                new=numpy.random.uniform(-1, 1, [nDots*2,2])#fetch twice as many as needed
-                inCircle= (numpy.hypot(new[:,0],new[:,1])<1)
-                if sum(inCircle)>=nDots:
-                    return new[inCircle,:][:nDots,:]*self.fieldSize/2.0
+        if self.fieldShape=='circle':
+            #uniform in the unit disc: the radius is the sqrt of a uniform variable
+            radius = numpy.sqrt(numpy.random.random(nDots)).astype(numpy.float32)
+            theta = (numpy.random.random(nDots)*(2*pi)).astype(numpy.float32)
+            new = numpy.empty([nDots,2], numpy.float32)
+            new[:,0] = radius*numpy.cos(theta)*(self.fieldSize[0]/2.0)
+            new[:,1] = radius*numpy.sin(theta)*(self.fieldSize[1]/2.0)
+            return new
         else:
             return numpy.random.uniform(-self.fieldSize/2.0, self.fieldSize/2.0, [nDots,2])
 
+    def _calcDotsDirXY(self):
+        """Recalculate the unit vectors (cos, sin) of all the dot directions
+        """
+        numpy.cos(self._dotsDir, out=self._dotsDirXY[:,0])
+        numpy.sin(self._dotsDir, out=self._dotsDirXY[:,1])
+        self._dirsChanged = False
+
     def _update_dotsXY(self):
         """
         The user shouldn't call this - its gets done within draw()
@@ -299,64 +325,75 @@ class DotStim(BaseVisualStim):
 
         """Find dead dots, update positions, get new positions for dead and out-of-bounds
         """
+        #NB masked assignments (a[mask] = b) are slow for large arrays, so the
+        #masks are combined with in-place arithmetic and only turned into
+        #indices for the dots that actually change
+        dead = self._deadBuffer
         #renew dead dots
         if self.dotLife>0:#if less than zero ignore it
             self._dotsLife -= 1 #decrement. Then dots to be reborn will be negative
-            dead = (self._dotsLife<=0.0)
-            self._dotsLife[dead]=self.dotLife
+            numpy.less_equal(self._dotsLife, 0.0, out=dead)
+            #reborn dots live for dotLife frames again
+            self._dotsLife *= numpy.logical_not(dead, out=self._boolBuffer)
+            self._dotsLife += numpy.multiply(dead, self.dotLife, out=self._lifeBuffer)
         else:
-            dead=numpy.zeros(self.nDots, dtype=bool)
+            dead[:] = False
 
         ##update XY based on speed and dir
         #NB self._dotsDir is in radians, but self.dir is in degs
         #update which are the noise/signal dots
+        if self._dirsChanged:
+            self._calcDotsDirXY()
         if self.signalDots =='different':
             #  **up to version 1.70.00 this was the other way around, not in keeping with Scase et al**
             #noise and signal dots change identity constantly
-            numpy.random.shuffle(self._dotsDir)
+            order = numpy.random.permutation(self.nDots)
+            self._dotsDir = self._dotsDir[order]
+            numpy.take(self._dotsDirXY, order, axis=0, out=self._xyBuffer)
+            self._dotsDirXY, self._xyBuffer = self._xyBuffer, self._dotsDirXY
             self._signalDots = (self._dotsDir==(self.dir*pi/180))#and then update _signalDots from that
 
         #update the locations of signal and noise
         if self.noiseDots=='walk':
             # noise dots are ~self._signalDots
-            self._dotsDir[~self._signalDots] = numpy.random.rand((~self._signalDots).sum())*pi*2
-            #then update all positions from dir*speed
-            self._dotsXY[:,0] += self.speed*numpy.reshape(numpy.cos(self._dotsDir),(self.nDots,))
-            self._dotsXY[:,1] += self.speed*numpy.reshape(numpy.sin(self._dotsDir),(self.nDots,))# 0 radians=East!
-        elif self.noiseDots == 'direction':
-            #simply use the stored directions to update position
-            self._dotsXY[:,0] += self.speed*numpy.reshape(numpy.cos(self._dotsDir),(self.nDots,))
-            self._dotsXY[:,1] += self.speed*numpy.reshape(numpy.sin(self._dotsDir),(self.nDots,))# 0 radians=East!
-        elif self.noiseDots=='position':
-            #update signal dots
-            self._dotsXY[self._signalDots,0] += \
-                self.speed*numpy.reshape(numpy.cos(self._dotsDir[self._signalDots]),(self._signalDots.sum(),))
-            self._dotsXY[self._signalDots,1] += \
-                self.speed*numpy.reshape(numpy.sin(self._dotsDir[self._signalDots]),(self._signalDots.sum(),))# 0 radians=East!
+            noise = numpy.flatnonzero(numpy.logical_not(self._signalDots, out=self._boolBuffer))
+            newDirs = numpy.random.rand(len(noise))*pi*2
+            self._dotsDir[noise] = newDirs
+            self._dotsDirXY[noise,0] = numpy.cos(newDirs)
+            self._dotsDirXY[noise,1] = numpy.sin(newDirs)
+        #then update all positions from dir*speed (0 radians=East!)
+        #for 'position' the noise dots moved here are all replaced below
+        numpy.multiply(self._dotsDirXY, self.speed, out=self._xyBuffer)
+        self._dotsXY += self._xyBuffer
+        if self.noiseDots=='position':
             #update noise dots
-            dead = dead+(~self._signalDots)#just create new ones
+            dead |= numpy.logical_not(self._signalDots, out=self._boolBuffer)#just create new ones
 
         #handle boundaries of the field
         if self.fieldShape in  [None, 'square', 'sqr']:
-            dead = dead+(numpy.abs(self._dotsXY[:,0])>(self.fieldSize[0]/2.0))+(numpy.abs
-                                                                                  (self
-                                                                                   ._dotsXY[:,1])>(self.fieldSize[1]/2.0))
+            numpy.abs(self._dotsXY, out=self._xyBuffer)
+            dead |= numpy.greater(self._xyBuffer[:,0], self.fieldSize[0]/2.0, out=self._boolBuffer)
+            dead |= numpy.greater(self._xyBuffer[:,1], self.fieldSize[1]/2.0, out=self._boolBuffer)
         elif self.fieldShape == 'circle':
-            #transform to a normalised circle (radius = 1 all around) then to polar coords to check
-            normXY = self._dotsXY/(self.fieldSize/2.0)#the normalised XY position (where radius should be <1)
-            dead = dead + (numpy.hypot(normXY[:,0],normXY[:,1])>1) #add out-of-bounds to those that need replacing
+            #transform to a normalised circle (radius = 1 all around) then check the squared radius
+            numpy.multiply(self._dotsXY[:,0], 2.0/self.fieldSize[0], out=self._xyBuffer[:,0])
+            numpy.multiply(self._dotsXY[:,1], 2.0/self.fieldSize[1], out=self._xyBuffer[:,1])
+            self._xyBuffer *= self._xyBuffer
+            numpy.add(self._xyBuffer[:,0], self._xyBuffer[:,1], out=self._radiusBuffer)
+            dead |= numpy.greater(self._radiusBuffer, 1, out=self._boolBuffer) #add out-of-bounds to those that need replacing
 
         #update any dead dots
-        if sum(dead):
-            self._dotsXY[dead,:] = self._newDotsXY(sum(dead))
+        dead = numpy.flatnonzero(dead)
+        if len(dead):
+            self._dotsXY[dead] = self._newDotsXY(len(dead))
 
         #update the pixel XY coordinates
         self._calcDotsXYRendered()
 
     def _calcDotsXYRendered(self):
         if self.units in ['norm','pix', 'height']: self._dotsXYRendered=self._dotsXY
-        elif self.units in ['deg','degs']: self._dotsXYRendered=deg2pix(self._dotsXY, self.win.monitor)
-        elif self.units=='cm': self._dotsXYRendered=cm2pix(self._dotsXY, self.win.monitor)
+        elif self.units in ['deg','degs']: self._dotsXYRendered=numpy.asarray(deg2pix(self._dotsXY, self.win.monitor), numpy.float32)
+        elif self.units=='cm': self._dotsXYRendered=numpy.asarray(cm2pix(self._dotsXY, self.win.monitor), numpy.float32)
     def _calcFieldCoordsRendered(self):
         if self.units in ['norm', 'pix', 'height']:
             self._fieldSizeRendered=self.fieldSize
@@ -33,6 +33,25 @@ currWindow = None
 import numpy
 
 
+class _ElementSubset(object):
+    """Holds the values of some of the elements, so that setWithOperation
+    can be applied to just those."""
+    def __init__(self, values):
+        self.values = values
+
+def _indexRanges(indices, maxRanges=32):
+    """Return (start, stop) pairs covering the sorted element indices. If
+    there would be more than maxRanges a single range covering them all is
+    returned (fewer, larger uploads are faster than many small ones).
+    """
+    breaks = numpy.flatnonzero(numpy.diff(indices) > 1) + 1
+    if len(breaks) >= maxRanges:
+        return [(indices[0], indices[-1]+1)]
+    starts = indices[numpy.r_[0, breaks]]
+    stops = indices[numpy.r_[breaks-1, len(indices)-1]] + 1
+    return zip(starts, stops)
+
+
 class ElementArrayStim(object):
     """
     This stimulus class defines a field of elements whose behaviour can be independently
@@ -65,6 +84,7 @@ class ElementArrayStim(object):
                  elementMask='gauss',
                  texRes=48,
                  interpolate=True,
+                 useVBOs=False,
                  name='', autoLog=True):
 
         """
@@ -146,6 +166,13 @@ class ElementArrayStim(object):
                 the number of pixels in the textures (overridden if an array
                 or image is provided)
 
+            useVBOs : True or **False**
+                If True the vertices, colors and texture coordinates of the
+                elements are kept in OpenGL vertex buffer objects on the
+                graphics card. When only some elements change (e.g. with
+                `setXYs(xys, indices=changed)`) only those elements are uploaded
+                again, rather than all the arrays on every frame.
+
             name : string
                 The name of the objec to be using during logged messages about
                 this stim
@@ -173,8 +200,16 @@ class ElementArrayStim(object):
         self.phases = phases
         self.needVertexUpdate=True
         self.needColorUpdate=True
+        self.needTexCoordUpdate=True
         self.useShaders=True
+        self.useVBOs=useVBOs
         self.interpolate=interpolate
+        #which elements changed since the arrays for drawing were calculated
+        self._changed = {'vertices': numpy.ones(nElements, bool),
+                         'colors': numpy.ones(nElements, bool)}
+        self._visXYZvertices = None
+        self._RGBAs = None
+        self._vbos = {}
         self.fieldDepth=fieldDepth
         self.depths=depths
         if self.win.winType != 'pyglet':
@@ -221,7 +256,43 @@ class ElementArrayStim(object):
             win.winHandle.switch_to()
             currWindow = win
 
-    def setXYs(self,value=None, operation='', log=True):
+    def _elementIndices(self, indices):
+        """Return indices (ints, a boolean mask or a slice) as a sorted
+        array of element indices"""
+        return numpy.unique(numpy.arange(self.nElements)[indices])
+    def _setElements(self, attrib, value, operation, indices):
+        """Set the values of attrib for the elements in indices, leaving the
+        others unchanged. The array is replaced by a changed copy, as for
+        setWithOperation, so other references to it are not affected.
+        """
+        values = numpy.array(getattr(self, attrib), dtype=float)
+        subset = _ElementSubset(values[indices])
+        if value.ndim and value.size == subset.values.size:
+            value = value.reshape(subset.values.shape)
+        setWithOperation(subset, 'values', value, operation, stealth=True)
+        values[indices] = subset.values
+        setattr(self, attrib, values)
+    def _flagChanged(self, arrays, indices=None):
+        """Flag that the elements in indices (or all elements) need their
+        'vertices' or 'colors' recalculating before the next draw"""
+        if indices is None:
+            self._changed[arrays][:] = True
+        else:
+            self._changed[arrays][indices] = True
+        if arrays == 'vertices':
+            self.needVertexUpdate=True
+        else:
+            self.needColorUpdate=True
+    def _getChanged(self, arrays):
+        """Return the indices of the elements flagged by _flagChanged, or
+        None if all elements should be updated, and clear the flags"""
+        changed = numpy.flatnonzero(self._changed[arrays])
+        self._changed[arrays][:] = False
+        if len(changed) in [0, self.nElements]:
+            return None
+        return changed
+
+    def setXYs(self,value=None, operation='', log=True, indices=None):
         """Set the xy values of the element centres (relative to the centre of the field).
         Values should be:
 
@@ -231,8 +302,22 @@ class ElementArrayStim(object):
         If value is None then the xy positions will be generated automatically, based
         on the fieldSize and fieldPos. In this case opacity will also be overridden
         by this function (it is used to make elements outside the field invisible.
+
+        If `indices` is given (a list/array of element indices, a boolean mask or
+        a slice) only those elements are changed, and value should be an xy pair
+        or an array/list of len(indices)x2 coordinates::
+
+            stim.setXYs([[0, 0], [1, 1]], indices=[3, 10])
+            stim.setXYs([0.1, 0], '+', indices=slice(0, 100))
         """
-        if value==None:
+        if indices is not None:
+            indices = self._elementIndices(indices)
+            if type(value) in [int, float, list, tuple]:
+                value = numpy.array(value, dtype=float)
+            if value is None or value.shape not in [(),(2,),(len(indices),2)]:
+                raise ValueError("New value for setXYs of some elements should be xy or len(indices)x2")
+            self._setElements('xys', value, operation, indices)
+        elif value==None:
             if self.fieldShape in ['sqr', 'square']:
                 self.xys = numpy.random.rand(self.nElements,2)*self.fieldSize - self.fieldSize/2 #initialise a random array of X,Y
                 #gone outside the square
@@ -259,20 +344,29 @@ class ElementArrayStim(object):
                 raise ValueError("New value for setXYs should be either None or Nx2")
             #set value
             setWithOperation(self, 'xys', value, operation)
-        self.needVertexUpdate=True
+        self._flagChanged('vertices', indices)
         if log and self.autoLog:
             self.win.logOnFlip("Set %s XYs=%s" %(self.name, type(value)),
                 level=logging.EXP,obj=self)
-    def setOris(self,value,operation='', log=True):
+    def setOris(self,value,operation='', log=True, indices=None):
         """Set the orientation for each element.
         Should either be a single value or an Nx1 array/list
+
+        If `indices` is given only those elements are changed (see
+        :meth:`~ElementArrayStim.setXYs`) and value should be a single value or
+        have one value per index.
         """
         #make into an array
         if type(value) in [int, float, list, tuple]:
             value = numpy.array(value, dtype=float)
 
         #check shape
-        if value.shape in [(),(1,)]:
+        if indices is not None:
+            indices = self._elementIndices(indices)
+            if value.shape not in [(),(1,),(len(indices),),(len(indices),1)]:
+                raise ValueError("New value for setOris of some elements should be a single value or one per index")
+            self._setElements('oris', value, operation, indices)
+        elif value.shape in [(),(1,)]:
             value = value.repeat(self.nElements)
         elif value.shape in [(self.nElements,), (self.nElements,1)]:
             pass #is already Nx1
@@ -280,9 +374,10 @@ class ElementArrayStim(object):
             raise ValueError("New value for setOris should be either Nx1 or a single value")
 
         #set value
-        setWithOperation(self, 'oris', value, operation)
+        if indices is None:
+            setWithOperation(self, 'oris', value, operation)
 
-        self.needVertexUpdate=True
+        self._flagChanged('vertices', indices)
         if log and self.autoLog:
             self.win.logOnFlip("Set %s oris=%s" %(self.name, type(value)),
                 level=logging.EXP,obj=self)
@@ -322,16 +417,25 @@ class ElementArrayStim(object):
             self.win.logOnFlip("Set %s sfs=%s" %(self.name, type(value)),
                 level=logging.EXP,obj=self)
 
-    def setOpacities(self,value,operation='', log=True):
+    def setOpacities(self,value,operation='', log=True, indices=None):
         """Set the opacity for each element.
         Should either be a single value or an Nx1 array/list
+
+        If `indices` is given only those elements are changed (see
+        :meth:`~ElementArrayStim.setXYs`) and value should be a single value or
+        have one value per index.
         """
         #make into an array
         if type(value) in [int, float, list, tuple]:
             value = numpy.array(value, dtype=float)
 
         #check shape
-        if value.shape in [(),(1,)]:
+        if indices is not None:
+            indices = self._elementIndices(indices)
+            if value.shape not in [(),(1,),(len(indices),),(len(indices),1)]:
+                raise ValueError("New value for setOpacities of some elements should be a single value or one per index")
+            self._setElements('opacities', value, operation, indices)
+        elif value.shape in [(),(1,)]:
             value = value.repeat(self.nElements)
         elif value.shape in [(self.nElements,), (self.nElements,1)]:
             pass #is already Nx1
@@ -339,24 +443,39 @@ class ElementArrayStim(object):
             raise ValueError("New value for setOpacities should be either Nx1 or a single value")
 
         #set value and log
-        setWithOperation(self, 'opacities', value, operation)
-        self.needColorUpdate =True
+        if indices is None:
+            setWithOperation(self, 'opacities', value, operation)
+        self._flagChanged('colors', indices)
         if log and self.autoLog:
             self.win.logOnFlip("Set %s opacities=%s" %(self.name, type(value)),
                 level=logging.EXP,obj=self)
-    def setSizes(self,value,operation='', log=True):
+    def setSizes(self,value,operation='', log=True, indices=None):
         """Set the size for each element.
         Should either be:
 
           - a single value
           - an Nx1 array/list
           - an Nx2 array/list
+
+        If `indices` is given only those elements are changed (see
+        :meth:`~ElementArrayStim.setXYs`) and value should be a single value,
+        an [x,y] pair or have one value (or pair) per index.
         """
         #make into an array
         if type(value) in [int, float, list, tuple]:
             value = numpy.array(value, dtype=float)
         #check shape
-        if value.shape in [(),(1,),(2,)]:
+        if indices is not None:
+            indices = self._elementIndices(indices)
+            nIndices = len(indices)
+            if value.shape in [(),(1,),(2,),(nIndices,2)]:
+                pass
+            elif value.shape in [(nIndices,), (nIndices,1)]:
+                value = value.reshape([nIndices,1]).repeat(2,1)
+            else:
+                raise ValueError("New value for setSizes of some elements should be a single value, [x,y], or one per index")
+            self._setElements('sizes', value, operation, indices)
+        elif value.shape in [(),(1,),(2,)]:
             value = numpy.resize(value, [self.nElements,2])
         elif value.shape in [(self.nElements,), (self.nElements,1)]:
             value.shape=(self.nElements,1)#set to be 2D
@@ -367,10 +486,13 @@ class ElementArrayStim(object):
             raise ValueError("New value for setSizes should be either Nx1, Nx2 or a single value")
 
         #set value and log
-        setWithOperation(self, 'sizes', value, operation)
+        if indices is None:
+            setWithOperation(self, 'sizes', value, operation)
         self._calcSizesRendered()
-        self.needVertexUpdate=True
-        self.needTexCoordUpdate=True
+        self._flagChanged('vertices', indices)
+        if self.units not in ['norm', 'pix', 'height']:
+            #sf is in cycles per unit, so texture coords depend on size
+            self.needTexCoordUpdate=True
 
         if log and self.autoLog:
             self.win.logOnFlip("Set %s sizes=%s" %(self.name, type(value)),
@@ -460,19 +582,28 @@ class ElementArrayStim(object):
             pass#all is good
         else:
             raise ValueError("New value for setRgbs should be either Nx1, Nx3 or a single value")
-        self.needColorUpdate=True
-    def setContrs(self,value,operation='', log=True):
+        self._flagChanged('colors')
+    def setContrs(self,value,operation='', log=True, indices=None):
         """Set the contrast for each element.
         Should either be:
 
           - a single value
           - an Nx1 array/list
+
+        If `indices` is given only those elements are changed (see
+        :meth:`~ElementArrayStim.setXYs`) and value should be a single value or
+        have one value per index.
         """
         #make into an array
         if type(value) in [int, float, list, tuple]:
             value = numpy.array(value, dtype=float)
         #check shape
-        if value.shape in [(),(1,)]:
+        if indices is not None:
+            indices = self._elementIndices(indices)
+            if value.shape not in [(),(1,),(len(indices),),(len(indices),1)]:
+                raise ValueError("New value for setContrs of some elements should be a single value or one per index")
+            self._setElements('contrs', value, operation, indices)
+        elif value.shape in [(),(1,)]:
             value = value.repeat(self.nElements)
         elif value.shape in [(self.nElements,), (self.nElements,1)]:
             pass #is already Nx1
@@ -480,8 +611,9 @@ class ElementArrayStim(object):
             raise ValueError("New value for setContrs should be either Nx1 or a single value")
 
         #set value and log
-        setWithOperation(self, 'contrs', value, operation)
-        self.needColorUpdate=True
+        if indices is None:
+            setWithOperation(self, 'contrs', value, operation)
+        self._flagChanged('colors', indices)
 
         if log and self.autoLog:
             self.win.logOnFlip("Set %s contrs=%s" %(self.name, type(value)),
@@ -536,12 +668,29 @@ class ElementArrayStim(object):
         if win==None: win=self.win
         self._selectWindow(win)
 
+        if self._vbos and not self.useVBOs:
+            #useVBOs was turned off, so the buffers would no longer be updated
+            self._deleteVBOs()
+        elif self.useVBOs and not self._vbos:
+            #e.g. useVBOs was only turned on now
+            self._flagChanged('vertices')
+            self._flagChanged('colors')
+            self.needTexCoordUpdate=True
         if self.needVertexUpdate:
-            self.updateElementVertices()
+            indices = self._getChanged('vertices')
+            self.updateElementVertices(indices)
+            if self.useVBOs:
+                self._uploadElements('vertices', self._visXYZvertices, indices)
         if self.needColorUpdate:
-            self.updateElementColors()
+            indices = self._getChanged('colors')
+            self.updateElementColors(indices)
+            if self.useVBOs:
+                self._uploadElements('colors', self._RGBAs, indices)
         if self.needTexCoordUpdate:
             self.updateTextureCoords()
+            if self.useVBOs:
+                self._uploadElements('texCoords', self._texCoords)
+                self._uploadElements('maskCoords', self._maskCoords)
 
         #scale the drawing frame and get to centre of field
         GL.glPushMatrix()#push before drawing, pop after
@@ -552,8 +701,15 @@ class ElementArrayStim(object):
 
         GL.glTranslatef(self._fieldPosRendered[0],self._fieldPosRendered[1],0)
 
-        GL.glColorPointer(4, GL.GL_DOUBLE, 0, self._RGBAs.ctypes.data_as(ctypes.POINTER(ctypes.c_double)))
-        GL.glVertexPointer(3, GL.GL_DOUBLE, 0, self._visXYZvertices.ctypes.data_as(ctypes.POINTER(ctypes.c_double)))
+        if self.useVBOs:
+            #the pointers are offsets into the bound buffer
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._vbos['colors'][0])
+            GL.glColorPointer(4, GL.GL_FLOAT, 0, None)
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._vbos['vertices'][0])
+            GL.glVertexPointer(3, GL.GL_FLOAT, 0, None)
+        else:
+            GL.glColorPointer(4, GL.GL_FLOAT, 0, self._RGBAs.ctypes)
+            GL.glVertexPointer(3, GL.GL_FLOAT, 0, self._visXYZvertices.ctypes)
 
         #setup the shaderprogram
         GL.glUseProgram(self.win._progSignedTexMask)
@@ -570,10 +726,19 @@ class ElementArrayStim(object):
 
         #setup client texture coordinates first
         GL.glClientActiveTexture (GL.GL_TEXTURE0)
-        GL.glTexCoordPointer (2, GL.GL_DOUBLE, 0, self._texCoords.ctypes)
+        if self.useVBOs:
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._vbos['texCoords'][0])
+            GL.glTexCoordPointer (2, GL.GL_FLOAT, 0, None)
+        else:
+            GL.glTexCoordPointer (2, GL.GL_FLOAT, 0, self._texCoords.ctypes)
         GL.glEnableClientState(GL.GL_TEXTURE_COORD_ARRAY)
         GL.glClientActiveTexture (GL.GL_TEXTURE1)
-        GL.glTexCoordPointer (2, GL.GL_DOUBLE, 0, self._maskCoords.ctypes)
+        if self.useVBOs:
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._vbos['maskCoords'][0])
+            GL.glTexCoordPointer (2, GL.GL_FLOAT, 0, None)
+            GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+        else:
+            GL.glTexCoordPointer (2, GL.GL_FLOAT, 0, self._maskCoords.ctypes)
         GL.glEnableClientState(GL.GL_TEXTURE_COORD_ARRAY)
 
         GL.glEnableClientState(GL.GL_COLOR_ARRAY)
@@ -616,48 +781,68 @@ class ElementArrayStim(object):
             self._fieldSizeRendered=cm2pix(self.fieldSize, self.win.monitor)
             self._fieldPosRendered=cm2pix(self.fieldPos, self.win.monitor)
 
-    def updateElementVertices(self):
-        self._calcXYsRendered()
-
-        self._visXYZvertices=numpy.zeros([self.nElements , 4, 3],'d')
-        wx = self._sizesRendered[:,0]*numpy.cos(self.oris[:]*numpy.pi/180)/2
-        wy = self._sizesRendered[:,0]*numpy.sin(self.oris[:]*numpy.pi/180)/2
-        hx = self._sizesRendered[:,1]*numpy.sin(self.oris[:]*numpy.pi/180)/2
-        hy = -self._sizesRendered[:,1]*numpy.cos(self.oris[:]*numpy.pi/180)/2
+    def updateElementVertices(self, indices=None):
+        """Calculate the vertices of the elements (self._visXYZvertices) from
+        their xys, sizes and oris. Not needed by the user (the set methods
+        flag when it is needed)
 
+        If indices is given only those elements are recalculated.
+        """
+        self._calcXYsRendered()
+        N=self.nElements
+        if indices is None or self._visXYZvertices is None or len(self._visXYZvertices)!=N:
+            self._visXYZvertices=numpy.zeros([N, 4, 3], numpy.float32)
+            indices = slice(None)
+        xys = self._XYsRendered[indices]
+        sizes = self._sizesRendered[indices]
+        oris = numpy.ravel(self.oris)[indices]*numpy.pi/180
+        cosOris, sinOris = numpy.cos(oris), numpy.sin(oris)
+        wx = sizes[:,0]*cosOris/2
+        wy = sizes[:,0]*sinOris/2
+        hx = sizes[:,1]*sinOris/2
+        hy = -sizes[:,1]*cosOris/2
+
+        vertices = self._visXYZvertices[indices]
         #X
-        self._visXYZvertices[:,0,0] = self._XYsRendered[:,0] -wx + hx#TopL
-        self._visXYZvertices[:,1,0] = self._XYsRendered[:,0] +wx + hx#TopR
-        self._visXYZvertices[:,2,0] = self._XYsRendered[:,0] +wx - hx#BotR
-        self._visXYZvertices[:,3,0] = self._XYsRendered[:,0] -wx - hx#BotL
+        vertices[:,0,0] = xys[:,0] -wx + hx#TopL
+        vertices[:,1,0] = xys[:,0] +wx + hx#TopR
+        vertices[:,2,0] = xys[:,0] +wx - hx#BotR
+        vertices[:,3,0] = xys[:,0] -wx - hx#BotL
 
         #Y
-        self._visXYZvertices[:,0,1] = self._XYsRendered[:,1] -wy + hy
-        self._visXYZvertices[:,1,1] = self._XYsRendered[:,1] +wy + hy
-        self._visXYZvertices[:,2,1] = self._XYsRendered[:,1] +wy - hy
-        self._visXYZvertices[:,3,1] = self._XYsRendered[:,1] -wy - hy
+        vertices[:,0,1] = xys[:,1] -wy + hy
+        vertices[:,1,1] = xys[:,1] +wy + hy
+        vertices[:,2,1] = xys[:,1] +wy - hy
+        vertices[:,3,1] = xys[:,1] -wy - hy
 
         #depth
-        self._visXYZvertices[:,:,2] = numpy.tile(self.depths,(1,4)) + self.fieldDepth
+        depths = numpy.resize(numpy.ravel(self.depths), [N])[indices]
+        vertices[:,:,2] = depths.reshape([-1,1]) + self.fieldDepth
+        self._visXYZvertices[indices] = vertices
 
         self.needVertexUpdate=False
 
     #----------------------------------------------------------------------
-    def updateElementColors(self):
+    def updateElementColors(self, indices=None):
         """Create a new array of self._RGBAs based on self.rgbs. Not needed by the
         user (simple call setColors())
 
         For element arrays the self.rgbs values correspond to one element so
-        this function also converts them to be one for each vertex of each element
+        this function also converts them to be one for each vertex of each element.
+        If indices is given only those elements are recalculated.
         """
         N=self.nElements
-        self._RGBAs=numpy.zeros([N,4],'d')
+        if indices is None or self._RGBAs is None or len(self._RGBAs)!=N:
+            self._RGBAs=numpy.zeros([N, 4, 4], numpy.float32)
+            indices = slice(None)
+        contrs = numpy.ravel(self.contrs)[indices].reshape([-1,1])
         if self.colorSpace in ['rgb','dkl','lms','hsv']: #these spaces are 0-centred
-            self._RGBAs[:,0:3] = self.rgbs[:,:] * self.contrs[:].reshape([N,1]).repeat(3,1)/2+0.5
+            rgbs = self.rgbs[indices] * contrs/2+0.5
         else:
-            self._RGBAs[:,0:3] = self.rgbs * self.contrs[:].reshape([N,1]).repeat(3,1)/255.0
-        self._RGBAs[:,-1] = self.opacities.reshape([N,])
-        self._RGBAs=self._RGBAs.reshape([N,1,4]).repeat(4,1)#repeat for the 4 vertices in the grid
+            rgbs = self.rgbs[indices] * contrs/255.0
+        #repeat for the 4 vertices in the grid
+        self._RGBAs[indices,:,0:3] = rgbs.reshape([-1,1,3])
+        self._RGBAs[indices,:,3] = numpy.ravel(self.opacities)[indices].reshape([-1,1])
 
         self.needColorUpdate=False
 
@@ -665,7 +850,7 @@ class ElementArrayStim(object):
         """Create a new array of self._maskCoords"""
 
         N=self.nElements
-        self._maskCoords=numpy.array([[0,1],[1,1],[1,0],[0,0]],'d').reshape([1,4,2])
+        self._maskCoords=numpy.array([[0,1],[1,1],[1,0],[0,0]],numpy.float32).reshape([1,4,2])
         self._maskCoords = self._maskCoords.repeat(N,0)
 
         #for the main texture
@@ -682,7 +867,7 @@ class ElementArrayStim(object):
 
         #self._texCoords=numpy.array([[1,1],[1,0],[0,0],[0,1]],'d').reshape([1,4,2])
         self._texCoords=numpy.concatenate([[L,T],[R,T],[R,B],[L,B]]) \
-            .transpose().reshape([N,4,2]).astype('d')
+            .transpose().reshape([N,4,2]).astype(numpy.float32)
         self._texCoords = numpy.ascontiguousarray(self._texCoords)
         self.needTexCoordUpdate=False
 
@@ -705,8 +890,34 @@ class ElementArrayStim(object):
         if log and self.autoLog:
             self.win.logOnFlip("Set %s mask=%s" %(self.name, value),
                 level=logging.EXP,obj=self)
+    def _uploadElements(self, name, values, indices=None):
+        """Copy values (an array with one row per element) into the vertex
+        buffer object called name. If indices is given only the ranges of the
+        buffer holding those elements are uploaded.
+        """
+        if name not in self._vbos:
+            buffer = GL.GLuint()
+            GL.glGenBuffers(1, ctypes.byref(buffer))
+            self._vbos[name] = (buffer, 0)
+        buffer, nBytes = self._vbos[name]
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, buffer)
+        if indices is None or nBytes != values.nbytes:
+            GL.glBufferData(GL.GL_ARRAY_BUFFER, values.nbytes, values.ctypes.data, GL.GL_DYNAMIC_DRAW)
+            self._vbos[name] = (buffer, values.nbytes)
+        else:
+            elementBytes = values.nbytes//len(values)
+            for start, stop in _indexRanges(indices):
+                GL.glBufferSubData(GL.GL_ARRAY_BUFFER, int(start*elementBytes),
+                                   int((stop-start)*elementBytes), values[start:stop].ctypes.data)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+    def _deleteVBOs(self):
+        """Remove the vertex buffer objects from the graphics card"""
+        for buffer, nBytes in self._vbos.values():
+            GL.glDeleteBuffers(1, buffer)
+        self._vbos = {}
     def __del__(self):
         self.clearTextures()#remove textures from graphics card to prevent crash
+        self._deleteVBOs()
     def clearTextures(self):
         """
         Clear the textures associated with the given stimulus.
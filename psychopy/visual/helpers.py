@@ -8,6 +8,11 @@
 
 import sys
 import os
+import atexit
+import weakref
+import threading
+import Queue
+from collections import OrderedDict
 
 # Ensure setting pyglet.options['debug_gl'] to False is done prior to any
 # other calls to pyglet or pyglet submodules, otherwise it may not get picked
@@ -49,6 +54,341 @@ except:
     haveMatplotlib = False
 
 
+class TextureCache(object):
+    """Least-recently-used cache of the intensity arrays made by
+    createTexture(), so that built-in textures (e.g. 'sin', 'gauss') are not
+    recomputed, and image files are not reloaded, every time a stimulus is
+    given the same texture or mask.
+
+    Arrays are keyed by the texture source (the name of a built-in texture,
+    or the path and modification time of an image file), res, pixFormat,
+    dataType, maskParams and forcePOW2. numpy arrays and PIL images can be
+    changed in place, so they are never cached. Once the arrays held take
+    more than maxBytes, the least recently used ones are dropped.
+
+    For each stimulus, the cache also records what was last uploaded to each
+    of the stimulus's OpenGL texture IDs (a stimulus only draws in the GL
+    context of its window). If the same texture is given again, with the same
+    drawing settings, nothing needs to be uploaded.
+
+    The cache used by createTexture() is `psychopy.visual.helpers.textureCache`::
+
+        from psychopy.visual.helpers import textureCache
+        textureCache.maxBytes = 256*1024**2
+        print textureCache.getStats()
+    """
+    builtinTextures = (None, 'none', 'None', 'sin', 'sqr', 'saw', 'tri',
+                       'sinXsin', 'sqrXsqr', 'circle', 'gauss', 'radRamp',
+                       'raisedCos')
+
+    def __init__(self, maxBytes=64*1024**2):
+        self.maxBytes = maxBytes
+        self._arrays = OrderedDict()
+        self._nBytes = 0
+        self._lock = threading.Lock()  # arrays are added by ImagePrefetcher threads
+        self._uploads = weakref.WeakKeyDictionary()
+        self.hits = 0
+        self.misses = 0
+        self.uploadHits = 0
+        self.evictions = 0
+
+    def getKey(self, tex, res, pixFormat, dataType, maskParams=None, forcePOW2=True):
+        """Return the cache key for a createTexture() call, or None if the
+        texture can't be cached.
+        """
+        if tex is None or type(tex) in [str, unicode, numpy.string_]:
+            if tex in self.builtinTextures:
+                source = tex
+            elif os.path.isfile(tex):
+                source = (os.path.abspath(tex), os.path.getmtime(tex))
+            else:
+                return None
+        else:
+            return None
+        if maskParams is not None:
+            maskParams = tuple(sorted(maskParams.items()))
+        key = (source, res, pixFormat, dataType, maskParams, forcePOW2)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get(self, key):
+        """Return the (intensity, wasLum, origSize) cached for key, or None.
+        """
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._arrays.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._arrays[key] = entry  # now the most recently used
+            self.hits += 1
+        return entry
+
+    def contains(self, key):
+        """True if an array is cached for key (does not count as a hit).
+        """
+        return key is not None and key in self._arrays
+
+    def add(self, key, intensity, wasLum, origSize=None):
+        """Cache the intensity array made for key. The array is made read-only
+        because it is shared by every stimulus using the texture.
+        """
+        if key is None or intensity.nbytes > self.maxBytes:
+            return
+        intensity.flags.writeable = False
+        with self._lock:
+            old = self._arrays.pop(key, None)
+            if old is not None:
+                self._nBytes -= old[0].nbytes
+            self._arrays[key] = (intensity, wasLum, origSize)
+            self._nBytes += intensity.nbytes
+            while self._nBytes > self.maxBytes:
+                oldKey, old = self._arrays.popitem(last=False)
+                self._nBytes -= old[0].nbytes
+                self.evictions += 1
+
+    def isUploaded(self, stim, texID, uploadKey):
+        """True if uploadKey was the last texture uploaded to texID by stim.
+        """
+        if uploadKey is None:
+            return False
+        try:
+            uploaded = self._uploads.get(stim, {}).get(texID) == uploadKey
+        except TypeError:  # stim can't be weakly referenced
+            return False
+        if uploaded:
+            self.uploadHits += 1
+        return uploaded
+
+    def setUploaded(self, stim, texID, uploadKey):
+        try:
+            uploads = self._uploads.setdefault(stim, {})
+        except TypeError:
+            return
+        if uploadKey is None:
+            uploads.pop(texID, None)
+        else:
+            uploads[texID] = uploadKey
+
+    def clear(self):
+        """Drop all cached arrays (textures already uploaded are unaffected).
+        """
+        with self._lock:
+            self._arrays.clear()
+            self._nBytes = 0
+
+    def getStats(self):
+        """Return a dict of the cache hits, misses, uploadHits (uploads that
+        were not needed), evictions, and the number (nArrays) and size
+        (nBytes) of the arrays cached.
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'uploadHits': self.uploadHits, 'evictions': self.evictions,
+                'nArrays': len(self._arrays), 'nBytes': self._nBytes,
+                'maxBytes': self.maxBytes}
+
+textureCache = TextureCache()
+
+
+class ImagePrefetcher(object):
+    """Loads image files into the `textureCache` on background threads, so
+    that setting a stimulus to a preloaded image only needs the texture to be
+    uploaded; the image file is not decoded, resized or converted while
+    frames are being drawn. Use it during the inter-trial interval, e.g. to
+    show a rapid serial visual presentation of images at the frame rate::
+
+        prefetcher = ImagePrefetcher()
+        prefetcher.preload(trialImages)  # defaults suit ImageStim
+        prefetcher.waitUntilDone()
+        for frameN, imageFile in enumerate(trialImages):
+            image.setImage(imageFile)
+            image.draw()
+            win.flip()
+
+    ImageStim.preload() does the same for the images of an ImageStim.
+    The options given to preload() must match those the stimulus will use
+    with createTexture(), otherwise the preloaded arrays are not used. The
+    cache must have room (`textureCache.maxBytes`) for all the images
+    preloaded, or the oldest are dropped before being used.
+
+    Loading is done on nThreads threads. The main thread can keep drawing,
+    but shares the CPU with them (PIL releases the GIL for only part of the
+    work), so preloading is best done between the time-critical parts of a
+    trial.
+    """
+    def __init__(self, nThreads=2, cache=None):
+        if cache is None:
+            cache = textureCache
+        self.cache = cache
+        self._queue = Queue.Queue()
+        self._queued = set()
+        self._queuedLock = threading.Lock()
+        self.nLoaded = 0
+        self.errors = []
+        self._threads = []
+        for n in range(nThreads):
+            thread = threading.Thread(target=self._run, name='ImagePrefetcher')
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        atexit.register(self.stop)
+
+    def preload(self, paths, pixFormat=GL.GL_RGB, dataType=GL.GL_UNSIGNED_BYTE,
+                res=128, maskParams=None, forcePOW2=False):
+        """Queue image files to be loaded into the cache. Files that are
+        already cached, or queued, are skipped. Returns the number of files
+        queued.
+
+        The defaults match ImageStim.setImage(); a GratingStim texture, for
+        example, is created with `forcePOW2=True` and (with shaders)
+        `dataType=GL.GL_FLOAT`.
+        """
+        if type(paths) in [str, unicode, numpy.string_]:
+            paths = [paths]
+        nQueued = 0
+        for path in paths:
+            key = self.cache.getKey(path, res, pixFormat, dataType, maskParams, forcePOW2)
+            if key is None:
+                logging.warning("ImagePrefetcher: '%s' is not an image file" %(path))
+                continue
+            with self._queuedLock:
+                if key in self._queued or self.cache.contains(key):
+                    continue
+                self._queued.add(key)
+            self._queue.put((key, path, pixFormat, dataType, forcePOW2))
+            nQueued += 1
+        return nQueued
+
+    def getNumPending(self):
+        """The number of queued images that have not been loaded yet.
+        """
+        return len(self._queued)
+
+    def isDone(self):
+        return len(self._queued) == 0
+
+    def waitUntilDone(self, timeout=None):
+        """Wait for all the queued images to be loaded, or until timeout
+        seconds have passed. Returns True if all the images were loaded.
+        """
+        if timeout is None:
+            self._queue.join()
+            return True
+        endTime = core.getTime() + timeout
+        while not self.isDone() and core.getTime() < endTime:
+            core.wait(0.001, hogCPUperiod=0)
+        return self.isDone()
+
+    def stop(self):
+        """Stop the loading threads (images still queued are not loaded).
+        """
+        threads, self._threads = self._threads, []
+        for thread in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(1.0)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            key, path, pixFormat, dataType, forcePOW2 = item
+            try:
+                intensity, wasLum, origSize = _imageToIntensity(path, pixFormat,
+                                                                dataType, forcePOW2)
+                self.cache.add(key, intensity, wasLum, origSize)
+                self.nLoaded += 1
+            except Exception, err:
+                self.errors.append((path, err))
+                logging.error("ImagePrefetcher: could not load '%s': %s" %(path, err))
+            finally:
+                with self._queuedLock:
+                    self._queued.discard(key)
+                self._queue.task_done()
+
+_defaultPrefetcher = None
+def getImagePrefetcher():
+    """Return the ImagePrefetcher shared by ImageStim.preload() (its
+    threads are only started when first needed).
+    """
+    global _defaultPrefetcher
+    if _defaultPrefetcher is None:
+        _defaultPrefetcher = ImagePrefetcher()
+    return _defaultPrefetcher
+
+
+def _imageToIntensity(tex, pixFormat, dataType, forcePOW2):
+    """Load the image file, or copy the PIL image, `tex` into an array for
+    createTexture(). Returns the array, whether it is luminance only, and the
+    original image size. Needs no OpenGL context, so can be used from any
+    thread (see ImagePrefetcher).
+    """
+    global _nImageResizes
+    if type(tex) in [str, unicode, numpy.string_]:
+        # maybe tex is the name of a file:
+        if not os.path.isfile(tex):
+            logging.error("Couldn't find image file '%s'; check path?" %(tex)); logging.flush()
+            raise OSError, "Couldn't find image file '%s'; check path? (tried: %s)" \
+                % (tex, os.path.abspath(tex))#ensure we quit
+        try:
+            im = Image.open(tex)
+            im = im.transpose(Image.FLIP_TOP_BOTTOM)
+        except IOError:
+            logging.error("Found file '%s' but failed to load as an image" %(tex)); logging.flush()
+            raise IOError, "Found file '%s' [= %s] but it failed to load as an image" \
+                % (tex, os.path.abspath(tex))#ensure we quit
+    else:
+        # can't be a file; maybe its an image already in memory?
+        try:
+            im = tex.copy().transpose(Image.FLIP_TOP_BOTTOM) # ? need to flip if in mem?
+        except AttributeError: # nope, not an image in memory
+            logging.error("Couldn't make sense of requested image."); logging.flush()
+            raise AttributeError, "Couldn't make sense of requested image."#ensure we quit
+    # at this point we have a valid im
+    origSize=im.size
+    #is it 1D?
+    if im.size[0]==1 or im.size[1]==1:
+        logging.error("Only 2D textures are supported at the moment")
+    else:
+        maxDim = max(im.size)
+        powerOf2 = int(2**numpy.ceil(numpy.log2(maxDim)))
+        if im.size[0]!=powerOf2 or im.size[1]!=powerOf2:
+            if not forcePOW2:
+                notSqr=True
+            elif _nImageResizes<reportNImageResizes:
+                logging.warning("Image '%s' was not a square power-of-two image. Linearly interpolating to be %ix%i" %(tex, powerOf2, powerOf2))
+                _nImageResizes+=1
+                im=im.resize([powerOf2,powerOf2],Image.BILINEAR)
+            elif _nImageResizes==reportNImageResizes:
+                logging.warning("Multiple images have needed resizing - I'll stop bothering you!")
+                im=im.resize([powerOf2,powerOf2],Image.BILINEAR)
+
+    #is it Luminance or RGB?
+    if im.mode=='L' and pixFormat==GL.GL_ALPHA:
+        wasLum = True
+    elif pixFormat==GL.GL_ALPHA:#we have RGB and need Lum
+        wasLum = True
+        im = im.convert("L")#force to intensity (in case it was rgb)
+    elif pixFormat==GL.GL_RGB:#we have RGB and keep it that way
+        #texture = im.tostring("raw", "RGB", 0, -1)
+        im = im.convert("RGBA")#force to rgb (in case it was CMYK or L)
+        wasLum=False
+    if dataType==GL.GL_FLOAT:
+        #convert from ubyte to float
+        intensity = numpy.array(im).astype(numpy.float32)*0.0078431372549019607-1.0 # much faster to avoid division 2/255
+    else:
+        intensity = numpy.array(im)
+    if wasLum and intensity.shape!=im.size:
+        intensity.shape=im.size
+    return intensity, wasLum, origSize
+
+
 def createTexture(tex, id, pixFormat, stim, res=128, maskParams=None,
                   forcePOW2=True, dataType=None):
     """
@@ -75,6 +415,8 @@ def createTexture(tex, id, pixFormat, stim, res=128, maskParams=None,
     For grating stimuli (anything that needs multiple cycles) forcePOW2 should
     be set to be True. Otherwise the wrapping of the texture will not work.
 
+    Built-in textures and image files are cached by `textureCache`.
+
     """
 
     """
@@ -91,7 +433,14 @@ def createTexture(tex, id, pixFormat, stim, res=128, maskParams=None,
         else:
             dataType = GL.GL_UNSIGNED_BYTE
 
-    if type(tex) == numpy.ndarray:
+    cacheKey = textureCache.getKey(tex, res, pixFormat, dataType, maskParams, forcePOW2)
+    cached = textureCache.get(cacheKey)
+    if cached is not None:
+        intensity, wasLum, origSize = cached
+        if origSize is not None:
+            stim._origSize = origSize
+            wasImage = True
+    elif type(tex) == numpy.ndarray:
         #handle a numpy array
         #for now this needs to be an NxN intensity array
         intensity = tex.astype(numpy.float32)
@@ -213,63 +562,25 @@ def createTexture(tex, id, pixFormat, stim, res=128, maskParams=None,
         intensity[artifact_idx] = 0
 
     else:
-        if type(tex) in [str, unicode, numpy.string_]:
-            # maybe tex is the name of a file:
-            if not os.path.isfile(tex):
-                logging.error("Couldn't find image file '%s'; check path?" %(tex)); logging.flush()
-                raise OSError, "Couldn't find image file '%s'; check path? (tried: %s)" \
-                    % (tex, os.path.abspath(tex))#ensure we quit
-            try:
-                im = Image.open(tex)
-                im = im.transpose(Image.FLIP_TOP_BOTTOM)
-            except IOError:
-                logging.error("Found file '%s' but failed to load as an image" %(tex)); logging.flush()
-                raise IOError, "Found file '%s' [= %s] but it failed to load as an image" \
-                    % (tex, os.path.abspath(tex))#ensure we quit
-        else:
-            # can't be a file; maybe its an image already in memory?
-            try:
-                im = tex.copy().transpose(Image.FLIP_TOP_BOTTOM) # ? need to flip if in mem?
-            except AttributeError: # nope, not an image in memory
-                logging.error("Couldn't make sense of requested image."); logging.flush()
-                raise AttributeError, "Couldn't make sense of requested image."#ensure we quit
-        # at this point we have a valid im
-        stim._origSize=im.size
+        intensity, wasLum, stim._origSize = _imageToIntensity(tex, pixFormat,
+                                                              dataType, forcePOW2)
         wasImage=True
-        #is it 1D?
-        if im.size[0]==1 or im.size[1]==1:
-            logging.error("Only 2D textures are supported at the moment")
-        else:
-            maxDim = max(im.size)
-            powerOf2 = int(2**numpy.ceil(numpy.log2(maxDim)))
-            if im.size[0]!=powerOf2 or im.size[1]!=powerOf2:
-                if not forcePOW2:
-                    notSqr=True
-                elif _nImageResizes<reportNImageResizes:
-                    logging.warning("Image '%s' was not a square power-of-two image. Linearly interpolating to be %ix%i" %(tex, powerOf2, powerOf2))
-                    _nImageResizes+=1
-                    im=im.resize([powerOf2,powerOf2],Image.BILINEAR)
-                elif _nImageResizes==reportNImageResizes:
-                    logging.warning("Multiple images have needed resizing - I'll stop bothering you!")
-                    im=im.resize([powerOf2,powerOf2],Image.BILINEAR)
-
-        #is it Luminance or RGB?
-        if im.mode=='L' and pixFormat==GL.GL_ALPHA:
-            wasLum = True
-        elif pixFormat==GL.GL_ALPHA:#we have RGB and need Lum
-            wasLum = True
-            im = im.convert("L")#force to intensity (in case it was rgb)
-        elif pixFormat==GL.GL_RGB:#we have RGB and keep it that way
-            #texture = im.tostring("raw", "RGB", 0, -1)
-            im = im.convert("RGBA")#force to rgb (in case it was CMYK or L)
-            wasLum=False
-        if dataType==GL.GL_FLOAT:
-            #convert from ubyte to float
-            intensity = numpy.array(im).astype(numpy.float32)*0.0078431372549019607-1.0 # much faster to avoid division 2/255
-        else:
-            intensity = numpy.array(im)
-        if wasLum and intensity.shape!=im.size:
-            intensity.shape=im.size
+
+    if cached is None:
+        textureCache.add(cacheKey, intensity, wasLum, stim._origSize if wasImage else None)
+
+    # the texture only needs uploading if the stim's texture ID holds
+    # something else
+    texID = getattr(id, 'value', id)
+    uploadKey = None
+    if cacheKey is not None:
+        uploadKey = (cacheKey, interpolate, useShaders)
+        if pixFormat==GL.GL_RGB and wasLum and dataType!=GL.GL_FLOAT:
+            # colour is applied to the texture itself
+            uploadKey += (stim.colorSpace, tuple(stim.rgb),
+                          tuple(stim.rgbPedestal), stim.contrast)
+    if textureCache.isUploaded(stim, texID, uploadKey):
+        return wasLum
 
     if pixFormat==GL.GL_RGB and wasLum and dataType==GL.GL_FLOAT: #grating stim on good machine
         #keep as float32 -1:1
@@ -340,6 +651,7 @@ def createTexture(tex, id, pixFormat, stim, res=128, maskParams=None,
                         data.shape[1],data.shape[0], 0, # [JRG] for non-square, want data.shape[1], data.shape[0]
                         pixFormat, dataType, texture)
     GL.glTexEnvi(GL.GL_TEXTURE_ENV, GL.GL_TEXTURE_ENV_MODE, GL.GL_MODULATE)#?? do we need this - think not!
+    textureCache.setUploaded(stim, texID, uploadKey)
     return wasLum
 
 def pointInPolygon(x, y, poly):
@@ -21,7 +21,7 @@ from psychopy import logging
 from psychopy.tools.arraytools import val2array
 from psychopy.visual.basevisual import BaseVisualStim
 from psychopy.visual.helpers import (pointInPolygon, polygonsOverlap,
-                                     createTexture)
+                                     createTexture, getImagePrefetcher)
 
 import numpy
 
@@ -311,6 +311,22 @@ class ImageStim(BaseVisualStim):
         #if we switched to/from lum image then need to update shader rule
         if wasLumImage != self.isLumImage:
             self._needUpdate=True
+    def preload(self, images, wait=False):
+        """Start loading image files on background threads, so that a later
+        `setImage()` with one of them only has to upload the image to the
+        graphics card. Call this before the time-critical part of a trial,
+        e.g. during the inter-trial interval. If wait is True, returns once
+        all the images have been loaded.
+
+        Returns the ImagePrefetcher used (see `psychopy.visual.helpers`).
+        """
+        prefetcher = getImagePrefetcher()
+        prefetcher.preload(images, pixFormat=GL.GL_RGB,
+            dataType=GL.GL_UNSIGNED_BYTE, maskParams=self.maskParams,
+            forcePOW2=False)
+        if wait:
+            prefetcher.waitUntilDone()
+        return prefetcher
     def setMask(self,value, log=True):
         """Change the image to be used as an alpha-mask for the image
         """
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+
+'''Draw many ShapeStim objects (and Rect, Circle, Polygon, Line) with a
+handful of OpenGL calls, by packing their vertices and colors into shared
+arrays.'''
+
+# Part of the PsychoPy library
+# Copyright (C) 2013 Jonathan Peirce
+# Distributed under the terms of the GNU General Public License (GPL).
+
+# Ensure setting pyglet.options['debug_gl'] to False is done prior to any
+# other calls to pyglet or pyglet submodules, otherwise it may not get picked
+# up by the pyglet GL engine and have no effect.
+# Shaders will work but require OpenGL2.0 drivers AND PyOpenGL3.0+
+import pyglet
+pyglet.options['debug_gl'] = False
+GL = pyglet.gl
+
+import psychopy  # so we can get the __path__
+from psychopy import logging
+
+global currWindow
+currWindow = None
+
+import numpy
+
+
+def _changed(old, new):
+    """True if any item of new differs from old. Arrays are compared by
+    identity: the stimulus setters replace arrays rather than changing them
+    in place, so a new array means a new value.
+    """
+    for a, b in zip(old, new):
+        if a is b:
+            continue
+        if isinstance(a, numpy.ndarray) or isinstance(b, numpy.ndarray) or a != b:
+            return True
+    return False
+
+
+class ShapeBatch(object):
+    """Draws a collection of :class:`~psychopy.visual.ShapeStim` objects
+    (or Rect, Circle, Polygon and Line stimuli) together.
+
+    Drawing each shape separately sets up the OpenGL state (matrix, textures,
+    smoothing, colour) and issues one or two draw calls per shape, which
+    dominates the frame time of displays with hundreds of small shapes, such
+    as visual search or crowding arrays. A ShapeBatch instead keeps the
+    transformed vertices and the colors of all its shapes in shared arrays,
+    and draws all fills with one call and all outlines with one call per
+    combination of lineWidth and interpolate.
+
+    The shapes stay ordinary stimuli and are changed in the usual way
+    (`shape.setPos()`, `shape.setFillColor()`, ...). On each draw the batch
+    checks which shapes have changed and only recalculates the vertices or
+    colors of those. If you change an array of a shape in place (e.g.
+    `shape.vertices[0] = ...` without calling setVertices) call
+    :meth:`~ShapeBatch.setDirty`.
+
+    Some differences to drawing the shapes one by one:
+
+        - all fills are drawn before all outlines, so where shapes overlap
+          the outline of a shape can appear on top of the fill of a later one
+        - fills are drawn as triangle fans, which (like GL_POLYGON) only
+          fill convex shapes correctly, and are never antialiased
+          (`interpolate` only affects the outlines)
+
+    Example::
+
+        shapes = [visual.Rect(win, width=0.05, height=0.05, pos=pos,
+                              fillColor='red', lineColor=None)
+                  for pos in positions]
+        batch = visual.ShapeBatch(win, shapes)
+        shapes[3].setFillColor('green')  # only shape 3 is updated
+        batch.draw()
+    """
+    def __init__(self, win, shapes=(), name='', autoLog=True):
+        """
+        :Parameters:
+
+            win :
+                a :class:`~psychopy.visual.Window` object (required)
+
+            shapes :
+                a sequence of ShapeStim objects (or subclasses) drawn in `win`
+
+            name : string
+                The name of the object to be using during logged messages about
+                this stim
+        """
+        self.win = win
+        self.name = name
+        self.autoLog = autoLog
+        self.shapes = []
+        self._states = []
+        self._winSize = None
+        self._needLayout = True
+        for shape in shapes:
+            self.append(shape, log=False)
+
+    def __len__(self):
+        return len(self.shapes)
+
+    def _selectWindow(self, win):
+        global currWindow
+        #don't call switch if it's already the curr window
+        if win!=currWindow and win.winType=='pyglet':
+            win.winHandle.switch_to()
+            currWindow = win
+
+    def append(self, shape, log=True):
+        """Add a shape to the batch (it is drawn after the shapes already in
+        the batch).
+        """
+        if shape.win is not self.win:
+            raise ValueError("ShapeBatch shapes must be drawn in the same window as the batch")
+        self.shapes.append(shape)
+        self._states.append(None)
+        self._needLayout = True
+        if log and self.autoLog:
+            self.win.logOnFlip("Added %s to %s" %(shape.name, self.name),
+                level=logging.EXP,obj=self)
+
+    def remove(self, shape, log=True):
+        """Remove a shape from the batch.
+        """
+        index = self.shapes.index(shape)
+        del self.shapes[index]
+        del self._states[index]
+        self._needLayout = True
+        if log and self.autoLog:
+            self.win.logOnFlip("Removed %s from %s" %(shape.name, self.name),
+                level=logging.EXP,obj=self)
+
+    def setDirty(self, shape=None):
+        """Recalculate the vertices and colors of `shape` (or, if shape is
+        None, of every shape) on the next draw. Only needed when arrays of a
+        shape were changed in place.
+        """
+        if shape is None:
+            self._states = [None]*len(self.shapes)
+        else:
+            self._states[self.shapes.index(shape)] = None
+
+    def draw(self, win=None):
+        """
+        Draw all the shapes in the batch in its relevant window. You must call
+        this method after every MyWin.flip() if you want the
+        shapes to appear on that frame and then update the screen
+        again.
+        """
+        if win==None: win=self.win
+        self._selectWindow(win)
+        self._update()
+        if not self.shapes:
+            return
+
+        GL.glPushMatrix()#push before drawing, pop after
+        #vertices are in normalised window coords, whatever the shape units
+        win.setScale('norm')
+        #load Null textures into multitexteureARB - or they modulate glColor
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+        GL.glEnable(GL.GL_TEXTURE_2D)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glActiveTexture(GL.GL_TEXTURE1)
+        GL.glEnable(GL.GL_TEXTURE_2D)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glDisable(GL.GL_POLYGON_SMOOTH)
+
+        GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+        GL.glEnableClientState(GL.GL_COLOR_ARRAY)
+        GL.glVertexPointer(2, GL.GL_FLOAT, 0, self._xy.ctypes)
+        if len(self._fillIndices):
+            GL.glColorPointer(4, GL.GL_FLOAT, 0, self._fillRGBAs.ctypes)
+            GL.glDrawElements(GL.GL_TRIANGLES, len(self._fillIndices),
+                              GL.GL_UNSIGNED_INT, self._fillIndices.ctypes)
+        if self._lineGroups:
+            GL.glColorPointer(4, GL.GL_FLOAT, 0, self._lineRGBAs.ctypes)
+            for (lineWidth, interpolate), indices in self._lineGroups:
+                if interpolate:
+                    GL.glEnable(GL.GL_LINE_SMOOTH)
+                else:
+                    GL.glDisable(GL.GL_LINE_SMOOTH)
+                GL.glLineWidth(lineWidth)
+                GL.glDrawElements(GL.GL_LINES, len(indices),
+                                  GL.GL_UNSIGNED_INT, indices.ctypes)
+        GL.glDisableClientState(GL.GL_COLOR_ARRAY)
+        GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
+        GL.glPopMatrix()
+
+    def _getState(self, shape):
+        """Return the (geometry, color, layout) values of a shape that the
+        batch arrays depend on.
+        """
+        if shape.needVertexUpdate:
+            shape._calcVerticesRendered()
+        geometry = (shape._winScale, float(shape.ori), shape._posRendered,
+                    shape._verticesRendered)
+        color = (shape.fillRGB, shape.fillColorSpace, shape.lineRGB,
+                 shape.lineColorSpace, shape.contrast, shape.opacity)
+        layout = (numpy.size(shape._verticesRendered)//2,
+                  shape.fillRGB is None, shape.lineRGB is None,
+                  float(shape.lineWidth), bool(shape.interpolate),
+                  bool(shape.closeShape))
+        return geometry, color, layout
+
+    def _update(self):
+        """Bring the shared arrays up to date with any shapes that changed
+        since the last draw.
+        """
+        winSize = tuple(self.win.size)
+        if winSize != self._winSize:
+            #the scale of 'pix' and 'height' units has changed
+            self._winSize = winSize
+            self._states = [None]*len(self.shapes)
+
+        states = [self._getState(shape) for shape in self.shapes]
+        needIndices = self._needLayout
+        if not needIndices:
+            for old, new in zip(self._states, states):
+                if old is None or old[2] != new[2]:
+                    needIndices = True
+                    break
+        if needIndices:
+            nVerts = [layout[0] for geometry, color, layout in states]
+            if self._needLayout or nVerts != self._nVerts:
+                self._allocate(nVerts)
+            self._calcIndices(states)
+
+        for index, (shape, state) in enumerate(zip(self.shapes, states)):
+            old = self._states[index]
+            if old is None or _changed(old[0], state[0]):
+                self._calcVertices(index, shape)
+            if old is None or _changed(old[1], state[1]):
+                self._calcColors(index, shape)
+        self._states = states
+
+    def _allocate(self, nVerts):
+        """Lay out one slot of vertices per shape in new shared arrays.
+        """
+        self._nVerts = nVerts
+        self._starts = numpy.cumsum([0] + nVerts)
+        total = self._starts[-1]
+        self._xy = numpy.zeros([total, 2], numpy.float32)
+        self._fillRGBAs = numpy.zeros([total, 4], numpy.float32)
+        self._lineRGBAs = numpy.zeros([total, 4], numpy.float32)
+        self._states = [None]*len(self.shapes)
+        self._needLayout = False
+
+    def _calcIndices(self, states):
+        """Make the index arrays for the fill triangles and for the line
+        segments of each (lineWidth, interpolate) group of shapes.
+        """
+        fills = []
+        lineGroups = []
+        groupIndex = {}
+        for index, (geometry, color, layout) in enumerate(states):
+            nVerts, noFill, noLine, lineWidth, interpolate, closeShape = layout
+            start = self._starts[index]
+            if nVerts > 2 and not noFill:
+                #a fan of triangles from the first vertex
+                fan = numpy.arange(1, nVerts-1)
+                fills.append(numpy.column_stack(
+                    [numpy.repeat(start, nVerts-2), start+fan, start+fan+1]).ravel())
+            if nVerts > 1 and not noLine:
+                ends = list(range(1, nVerts))
+                if closeShape and nVerts > 2:
+                    ends.append(0)
+                ends = numpy.array(ends)
+                starts = numpy.arange(len(ends))
+                key = (lineWidth, interpolate)
+                if key not in groupIndex:
+                    groupIndex[key] = len(lineGroups)
+                    lineGroups.append((key, []))
+                lineGroups[groupIndex[key]][1].append(
+                    numpy.column_stack([start+starts, start+ends]).ravel())
+        self._fillIndices = numpy.concatenate(fills).astype(numpy.uint32) \
+            if fills else numpy.zeros(0, numpy.uint32)
+        self._lineGroups = [(key, numpy.concatenate(indices).astype(numpy.uint32))
+                            for key, indices in lineGroups]
+
+    def _unitsToNorm(self, winScale):
+        """The scale from the window coords of a shape to normalised coords
+        (as in Window.setScale)
+        """
+        if winScale == 'norm':
+            return numpy.array([1.0, 1.0])
+        elif winScale == 'height':
+            return numpy.array([2.0*self.win.size[1]/self.win.size[0], 2.0])
+        else:
+            return 2.0/numpy.array(self.win.size, float)
+
+    def _calcVertices(self, index, shape):
+        """Rotate, translate and scale the vertices of one shape into its slot
+        """
+        vertices = numpy.reshape(shape._verticesRendered, [-1, 2])
+        ori = numpy.radians(float(shape.ori))
+        cosOri, sinOri = numpy.cos(ori), numpy.sin(ori)
+        scale = self._unitsToNorm(shape._winScale)
+        xy = self._xy[self._starts[index]:self._starts[index+1]]
+        #the same transform as glTranslatef(pos) and glRotatef(-ori) in ShapeStim.draw
+        xy[:, 0] = (vertices[:, 0]*cosOri + vertices[:, 1]*sinOri
+                    + shape._posRendered[0])*scale[0]
+        xy[:, 1] = (vertices[:, 1]*cosOri - vertices[:, 0]*sinOri
+                    + shape._posRendered[1])*scale[1]
+
+    def _calcColors(self, index, shape):
+        """Fill the slot of one shape in the fill and line color arrays
+        """
+        start, stop = self._starts[index], self._starts[index+1]
+        for rgb, colorSpace, rgbas in [
+                (shape.fillRGB, shape.fillColorSpace, self._fillRGBAs),
+                (shape.lineRGB, shape.lineColorSpace, self._lineRGBAs)]:
+            if rgb is None:
+                continue
+            rgbas[start:stop, :3] = shape._getDesiredRGB(rgb, colorSpace, shape.contrast)
+            rgbas[start:stop, 3] = shape.opacity
@@ -340,7 +340,8 @@ class Window:
         of the script. Set this to `False` while the screen is not being
         updated, i.e., during any slow, non-frame-time-critical sections of
         your code, including inter-trial-intervals, `event.waitkeys()`,
-        `core.wait()`, or `image.setImage()`.
+        `core.wait()`, or `image.setImage()` (unless the image was loaded in
+        advance with `image.preload()`).
 
         see also:
             Window.saveFrameIntervals()